@@ -0,0 +1,110 @@
+import gzip
+import heapq
+import json
+import logging
+import os
+import zlib
+from app.services.concurrency import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+
+class AdventureArchive:
+    """
+    Older Sleepen adventures, one gzip-compressed NDJSON segment per month
+
+    Every adventure carries ``seq``, its position in the Sleepen's whole
+    adventure history. ``index.json`` records the lowest and highest seq in
+    each segment, so a page of history opens only the segments that can
+    hold it. Appends add a gzip member to the end of the month's segment
+    instead of rewriting it. Callers serialize writes (SleepenManager holds
+    its exclusive lock); an adventure archived twice after an interrupted
+    save is returned once.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_file = os.path.join(directory, 'index.json')
+
+    def append(self, adventures):
+        """Add adventures (each with its seq) to the segments of their months"""
+        if not adventures:
+            return
+        by_month = {}
+        for adventure in adventures:
+            by_month.setdefault(self._month(adventure), []).append(adventure)
+
+        os.makedirs(self.directory, exist_ok=True)
+        index = self.load_index()
+        for month, entries in by_month.items():
+            lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+            with open(self._segment_path(month), 'ab') as f:
+                f.write(gzip.compress(lines.encode('utf-8')))
+                f.flush()
+                os.fsync(f.fileno())
+            seqs = [entry['seq'] for entry in entries]
+            bounds = index.get(month)
+            index[month] = {
+                'min': min(seqs + [bounds['min']] if bounds else seqs),
+                'max': max(seqs + [bounds['max']] if bounds else seqs)
+            }
+        atomic_write_json(self.index_file, index, indent=2)
+
+    def page(self, before, limit):
+        """Up to limit archived adventures with seq below before, newest first
+
+        Segments are opened in order of their highest seq and only until
+        none of the rest can hold an adventure newer than the page's oldest.
+        """
+        segments = sorted(
+            ((bounds['max'], month) for month, bounds in self.load_index().items() if bounds['min'] < before),
+            reverse=True
+        )
+        found = {}
+        for highest, month in segments:
+            if len(found) >= limit and highest < heapq.nlargest(limit, found)[-1]:
+                break
+            for adventure in self._read_segment(month):
+                if adventure['seq'] < before:
+                    found[adventure['seq']] = adventure
+        return [found[seq] for seq in heapq.nlargest(limit, found)]
+
+    def clear(self):
+        """Delete every segment and the index"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.ndjson.gz') or name == 'index.json':
+                os.remove(os.path.join(self.directory, name))
+
+    def load_index(self):
+        """Month -> {"min", "max"} seq of each segment"""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _read_segment(self, month):
+        adventures = []
+        try:
+            with gzip.open(self._segment_path(month), 'rt', encoding='utf-8') as f:
+                for line in f:
+                    adventures.append(json.loads(line))
+        except (EOFError, zlib.error, json.JSONDecodeError):
+            # A torn member from an interrupted append; everything before it is intact
+            logger.warning(f"Stopped at an unreadable entry in adventure segment {month}")
+        except FileNotFoundError:
+            pass
+        return adventures
+
+    @staticmethod
+    def _month(adventure):
+        """Segment name (YYYY-MM) for an adventure's date"""
+        date = adventure.get('date') or ''
+        if len(date) >= 7 and date[:4].isdigit() and date[4] == '-' and date[5:7].isdigit():
+            return date[:7]
+        return 'undated'
+
+    def _segment_path(self, month):
+        return os.path.join(self.directory, f'{month}.ndjson.gz')
@@ -0,0 +1,201 @@
+"""Running sleep statistics maintained incrementally on every write."""
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    # sleep_data imports this module for SleepDataCollection
+    from app.models.sleep_data import SleepData
+
+# Bump when the layout of the state dict changes so stale persisted state is rebuilt
+AGGREGATES_FORMAT = 2
+
+# Quality at or above which a night's bedtime/wake time counts towards the optimal times
+HIGH_QUALITY_THRESHOLD = 3
+
+
+def _number_key(value: Any) -> str:
+    """JSON object key for a numeric value (hours or quality)."""
+    return repr(float(value))
+
+
+def _best_rated(item: 'SleepData') -> Optional[Tuple[str, List[Any]]]:
+    """Recorded, rated nights by quality, remembering the sleep hours of the first one."""
+    if item.sleep_hours and item.sleep_quality > 0:
+        return _number_key(item.sleep_quality), [item.sleep_hours]
+    return None
+
+
+def _best_timed(item: 'SleepData') -> Optional[Tuple[str, List[Any]]]:
+    """Rated nights with both times by quality, remembering the times of the first one."""
+    if item.bedtime and item.wake_time and item.sleep_quality > 0:
+        return _number_key(item.sleep_quality), [item.bedtime, item.wake_time]
+    return None
+
+
+def _high_quality_bedtime(item: 'SleepData') -> Optional[Tuple[str, List[Any]]]:
+    if item.bedtime and item.wake_time and item.sleep_quality >= HIGH_QUALITY_THRESHOLD:
+        return item.bedtime, []
+    return None
+
+
+def _high_quality_wake_time(item: 'SleepData') -> Optional[Tuple[str, List[Any]]]:
+    if item.bedtime and item.wake_time and item.sleep_quality >= HIGH_QUALITY_THRESHOLD:
+        return item.wake_time, []
+    return None
+
+
+# Buckets whose entries are [count, first position, *payload of the first record].
+# The first position reproduces the "first seen in list order" tie breaking of
+# a full scan.
+FIRST_SEEN_BUCKETS: Dict[str, Callable[['SleepData'], Optional[Tuple[str, List[Any]]]]] = {
+    'bestRated': _best_rated,
+    'bestTimed': _best_timed,
+    'highQualityBedtimes': _high_quality_bedtime,
+    'highQualityWakeTimes': _high_quality_wake_time
+}
+
+
+class SleepAggregates:
+    """Sums, counts and histograms over a sleep record list.
+
+    Wraps a plain JSON-serializable dict (``state``) so it can be persisted
+    next to the records as ``data['aggregates']``. Every add/update applies
+    the difference of one record instead of rescanning the history; the only
+    rescan happens when a record that was the first of its kind in a
+    first-seen bucket is replaced. Float sums are kept by adding and
+    subtracting, so after many updates they can differ from a fresh pass in
+    the last bits.
+    """
+
+    def __init__(self, state: Dict[str, Any] = None):
+        self.state = state if state is not None else self.empty_state()
+
+    @staticmethod
+    def empty_state() -> Dict[str, Any]:
+        """Return the state of an empty record list."""
+        state = {
+            'format': AGGREGATES_FORMAT,
+            'count': 0,
+            'revTotal': 0,
+            'recordedDays': 0,
+            'totalSleepHours': 0,
+            'totalSleepQuality': 0,
+            'efficiencyDays': 0,
+            'totalSleepEfficiency': 0,
+            'durations': {},
+            'bedtimes': {},
+            'wakeTimes': {}
+        }
+        for bucket in FIRST_SEEN_BUCKETS:
+            state[bucket] = {}
+        return state
+
+    @classmethod
+    def from_items(cls, items: Sequence['SleepData']) -> 'SleepAggregates':
+        """Build aggregates with one pass over the records in list order."""
+        aggregates = cls()
+        for position, item in enumerate(items):
+            aggregates.add(position, item)
+        return aggregates
+
+    def is_valid_for(self, count: int, rev_total: int) -> bool:
+        """Check persisted state is in the current format and was computed from these records.
+
+        rev_total is the sum of the records' revs, a cheap fingerprint that
+        changes whenever a record is saved or replaced behind the aggregates' back.
+        """
+        return (self.state.get('format') == AGGREGATES_FORMAT and self.state.get('count') == count
+                and self.state.get('revTotal') == rev_total)
+
+    def add(self, position: int, item: 'SleepData') -> None:
+        """Add the contribution of the record stored at position."""
+        self._apply(item, 1)
+        for bucket, classify in FIRST_SEEN_BUCKETS.items():
+            match = classify(item)
+            if match is None:
+                continue
+            key, payload = match
+            entry = self.state[bucket].get(key)
+            if entry is None:
+                self.state[bucket][key] = [1, position] + payload
+            else:
+                entry[0] += 1
+                if position < entry[1]:
+                    entry[1:] = [position] + payload
+
+    def remove(self, position: int, item: 'SleepData',
+               items: Callable[[], Sequence['SleepData']]) -> None:
+        """Remove the contribution of the record stored at position.
+
+        items returns the current record list; it is only called when the
+        next first-seen record of a bucket has to be found.
+        """
+        self._apply(item, -1)
+        for bucket, classify in FIRST_SEEN_BUCKETS.items():
+            match = classify(item)
+            if match is None:
+                continue
+            key = match[0]
+            entry = self.state[bucket][key]
+            entry[0] -= 1
+            if not entry[0]:
+                del self.state[bucket][key]
+            elif entry[1] == position:
+                entry[1:] = self._next_first_seen(items(), classify, key, position)
+
+    def replace(self, position: int, old_item: 'SleepData', new_item: 'SleepData',
+                items: Callable[[], Sequence['SleepData']]) -> None:
+        """Swap the contribution of the record at position for a new one."""
+        self.remove(position, old_item, items)
+        self.add(position, new_item)
+
+    @staticmethod
+    def _next_first_seen(items: Sequence['SleepData'], classify: Callable, key: str,
+                         removed_position: int) -> List[Any]:
+        for position, other in enumerate(items):
+            if position == removed_position:
+                continue
+            match = classify(other)
+            if match is not None and match[0] == key:
+                return [position] + match[1]
+        raise ValueError(f"Aggregates out of sync with records for key {key!r}")
+
+    def _apply(self, item: 'SleepData', sign: int) -> None:
+        state = self.state
+        state['count'] += sign
+        state['revTotal'] += sign * (item.rev or 0)
+
+        if item.sleep_hours:
+            state['recordedDays'] += sign
+            state['totalSleepHours'] += sign * item.sleep_hours
+            state['totalSleepQuality'] += sign * item.sleep_quality
+            if item.sleep_efficiency:
+                state['efficiencyDays'] += sign
+                state['totalSleepEfficiency'] += sign * item.sleep_efficiency
+
+        self._count(state['durations'], _number_key(item.sleep_hours), sign)
+        if item.bedtime:
+            self._count(state['bedtimes'], item.bedtime, sign)
+        if item.wake_time:
+            self._count(state['wakeTimes'], item.wake_time, sign)
+
+    @staticmethod
+    def _count(histogram: Dict[str, int], key: str, sign: int) -> None:
+        count = histogram.get(key, 0) + sign
+        if count:
+            histogram[key] = count
+        else:
+            histogram.pop(key, None)
+
+    def best(self, bucket: str) -> Optional[List[Any]]:
+        """Return the entry of a quality-keyed bucket with the highest quality."""
+        entries = self.state[bucket]
+        if not entries:
+            return None
+        return entries[max(entries, key=float)]
+
+    def mode(self, bucket: str) -> Optional[str]:
+        """Return the most common key of a bucket, ties going to the one seen first."""
+        entries = self.state[bucket]
+        if not entries:
+            return None
+        return min(entries, key=lambda key: (-entries[key][0], entries[key][1]))
@@ -0,0 +1,122 @@
+"""Columnar, array-backed sleep data for analytics."""
+import datetime
+from array import array
+from typing import Any, Dict, List, Optional
+from app.models.sleep_data import SleepData, SleepDataCollection
+
+# Sentinel for missing integer values (unparseable date or time)
+MISSING = -(2 ** 31)
+
+
+def parse_clock_minutes(time_str: str) -> Optional[int]:
+    """Parse an HH:MM string into minutes since midnight."""
+    try:
+        hours, minutes = map(int, time_str.split(':'))
+    except (ValueError, AttributeError):
+        return None
+    total = hours * 60 + minutes
+    return total if abs(total) < -MISSING else None
+
+
+def parse_date_ordinal(date_str: str) -> Optional[int]:
+    """Parse an ISO date/datetime string into a proleptic Gregorian ordinal."""
+    try:
+        return datetime.datetime.fromisoformat(date_str).toordinal()
+    except (ValueError, TypeError):
+        return None
+
+
+class SleepDataColumns:
+    """Sleep records stored as one typed array per field.
+
+    A record costs a few dozen bytes instead of a SleepData object with its
+    own ``__dict__``, and aggregate passes become loops (or vectorized
+    operations) over flat buffers. Bedtime and wake time are kept both as
+    minutes since midnight and as codes into ``time_labels`` so results that
+    report the stored HH:MM string stay exact.
+    """
+
+    def __init__(self):
+        self.day = array('i')
+        self.date_ordinal = array('i')
+        self.bedtime = array('i')
+        self.wake_time = array('i')
+        self.bedtime_code = array('i')
+        self.wake_time_code = array('i')
+        self.sleep_hours = array('d')
+        self.time_in_bed = array('d')
+        self.efficiency = array('d')
+        self.quality = array('d')
+        self.challenge = array('b')
+        self.time_labels: List[str] = []
+        self._label_codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    @classmethod
+    def from_collection(cls, collection: SleepDataCollection) -> 'SleepDataColumns':
+        """Build columns from a hydrated collection."""
+        columns = cls()
+        for item in collection.data:
+            columns.append(item)
+        return columns
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> 'SleepDataColumns':
+        """Build columns straight from stored record dicts without keeping objects."""
+        columns = cls()
+        for record in records:
+            columns.append(SleepData.from_dict(record))
+        return columns
+
+    def append(self, item: SleepData) -> None:
+        """Append one record."""
+        for column, value in zip(self._columns(), self._row(item)):
+            column.append(value)
+
+    def put(self, position: int, item: SleepData) -> None:
+        """Store a record at position, appending when position is the end."""
+        if position == len(self):
+            self.append(item)
+            return
+        for column, value in zip(self._columns(), self._row(item)):
+            column[position] = value
+
+    def label_code(self, time_str: str) -> int:
+        """Return the code for an HH:MM label, or -1 for a missing time."""
+        if not time_str:
+            return -1
+        code = self._label_codes.get(time_str)
+        if code is None:
+            code = len(self.time_labels)
+            self.time_labels.append(time_str)
+            self._label_codes[time_str] = code
+        return code
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the column buffers."""
+        return sum(column.itemsize * len(column) for column in self._columns())
+
+    def _columns(self) -> tuple:
+        return (self.day, self.date_ordinal, self.bedtime, self.wake_time,
+                self.bedtime_code, self.wake_time_code, self.sleep_hours,
+                self.time_in_bed, self.efficiency, self.quality, self.challenge)
+
+    def _row(self, item: SleepData) -> tuple:
+        ordinal = parse_date_ordinal(item.date)
+        bedtime = parse_clock_minutes(item.bedtime) if item.bedtime else None
+        wake_time = parse_clock_minutes(item.wake_time) if item.wake_time else None
+        return (
+            item.day,
+            MISSING if ordinal is None else ordinal,
+            MISSING if bedtime is None else bedtime,
+            MISSING if wake_time is None else wake_time,
+            self.label_code(item.bedtime),
+            self.label_code(item.wake_time),
+            item.sleep_hours,
+            item.time_in_bed,
+            item.sleep_efficiency,
+            item.sleep_quality,
+            1 if item.challenge_completed else 0
+        )
@@ -1,6 +1,8 @@
 """Sleep data model and operations."""
+import bisect
 import datetime
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
+from app.models.sleep_aggregates import SleepAggregates
 
 
 class SleepData:
@@ -9,7 +11,7 @@ class SleepData:
     def __init__(self, day: int, date: str = None, bed_in_time: str = None, 
                  bed_out_time: str = None, bedtime: str = None, wake_time: str = None,
                  sleep_quality: int = 0, notes: str = "", challenge_completed: bool = False,
-                 reflection: Dict = None):
+                 reflection: Dict = None, rev: int = 0):
         self.day = day
         self.date = date or datetime.datetime.now().isoformat()
         self.bed_in_time = bed_in_time
@@ -20,6 +22,8 @@ class SleepData:
         self.notes = notes
         self.challenge_completed = challenge_completed
         self.reflection = reflection or {}
+        # Data version at which this record last changed (see delta sync)
+        self.rev = rev
         
         # Calculate derived values
         self.sleep_hours = self._calculate_sleep_hours()
@@ -87,7 +91,8 @@ class SleepData:
             'sleepQuality': self.sleep_quality,
             'notes': self.notes,
             'challengeCompleted': self.challenge_completed,
-            'reflection': self.reflection
+            'reflection': self.reflection,
+            'rev': self.rev
         }
     
     @classmethod
@@ -103,51 +108,146 @@ class SleepData:
             sleep_quality=data.get('sleepQuality', 0),
             notes=data.get('notes', ''),
             challenge_completed=data.get('challengeCompleted', False),
-            reflection=data.get('reflection', {})
+            reflection=data.get('reflection', {}),
+            rev=data.get('rev', 0)
         )
 
 
 class SleepDataCollection:
-    """Collection of sleep data with operations."""
+    """Collection of sleep data with operations.
     
-    def __init__(self, data_list: List[Dict] = None):
+    Keeps a day -> positions map, a date (YYYY-MM-DD) -> positions map and
+    a bisect-sorted (day, position) index in sync with ``data`` so lookups
+    and upserts don't scan the whole history. Positions within each map stay
+    ascending, preserving the "first match in list order" behaviour of the
+    original linear scans.
+    
+    Running aggregates (see SleepAggregates) are built on first use, or
+    adopted from persisted state when it matches the records, and are then
+    kept up to date by add_or_update.
+    """
+    
+    def __init__(self, data_list: List[Dict] = None, aggregates: Dict[str, Any] = None):
         self.data = []
         if data_list:
             self.data = [SleepData.from_dict(item) for item in data_list]
+        self._rebuild_indexes()
+        
+        self._aggregates = None
+        if aggregates is not None:
+            persisted = SleepAggregates(aggregates)
+            if persisted.is_valid_for(len(self.data), sum(item.rev or 0 for item in self.data)):
+                self._aggregates = persisted
+    
+    @property
+    def aggregates(self) -> SleepAggregates:
+        """Running aggregates over the records."""
+        if self._aggregates is None:
+            self._aggregates = SleepAggregates.from_items(self.data)
+        return self._aggregates
+    
+    def _rebuild_indexes(self) -> None:
+        """Build all indexes from scratch."""
+        self._keys: List[Tuple[Any, str]] = []
+        self._by_day: Dict[Any, List[int]] = {}
+        self._by_date: Dict[str, List[int]] = {}
+        for position, item in enumerate(self.data):
+            key = (item.day, item.date)
+            self._keys.append(key)
+            self._by_day.setdefault(item.day, []).append(position)
+            self._by_date.setdefault(item.date[:10], []).append(position)
+        self._day_order = sorted((day, position) for position, (day, _) in enumerate(self._keys))
     
-    def add_or_update(self, sleep_data: SleepData) -> None:
-        """Add new data or update existing data for the same date."""
+    def _index(self, position: int, item: SleepData) -> None:
+        """Add the item stored at position to the indexes."""
+        key = (item.day, item.date)
+        if position == len(self._keys):
+            self._keys.append(key)
+        else:
+            self._keys[position] = key
+        bisect.insort(self._by_day.setdefault(item.day, []), position)
+        bisect.insort(self._by_date.setdefault(item.date[:10], []), position)
+        bisect.insort(self._day_order, (item.day, position))
+    
+    def _unindex(self, position: int) -> None:
+        """Remove the item stored at position from the indexes."""
+        day, date = self._keys[position]
+        self._remove_position(self._by_day, day, position)
+        self._remove_position(self._by_date, date[:10], position)
+        del self._day_order[bisect.bisect_left(self._day_order, (day, position))]
+    
+    @staticmethod
+    def _remove_position(index: Dict[Any, List[int]], key: Any, position: int) -> None:
+        positions = index[key]
+        del positions[bisect.bisect_left(positions, position)]
+        if not positions:
+            del index[key]
+    
+    def add_or_update(self, sleep_data: SleepData) -> int:
+        """Add new data or update existing data for the same date.
+        
+        Returns the index the data was stored at.
+        """
         existing_index = self._find_by_date(sleep_data.date)
         if existing_index is not None:
+            if self._aggregates is not None:
+                self._aggregates.replace(existing_index, self.data[existing_index], sleep_data,
+                                         lambda: self.data)
+            self._unindex(existing_index)
             self.data[existing_index] = sleep_data
-        else:
-            self.data.append(sleep_data)
+            self._index(existing_index, sleep_data)
+            return existing_index
+        
+        self.data.append(sleep_data)
+        self._index(len(self.data) - 1, sleep_data)
+        if self._aggregates is not None:
+            self._aggregates.add(len(self.data) - 1, sleep_data)
+        return len(self.data) - 1
     
     def find_by_day(self, day: int) -> Optional[SleepData]:
         """Find data by day number."""
-        for item in self.data:
-            if item.day == day:
-                return item
-        return None
+        positions = self._by_day.get(day)
+        return self.data[positions[0]] if positions else None
     
     def find_by_date(self, date_str: str) -> Optional[SleepData]:
         """Find data by date string."""
-        for item in self.data:
-            if item.date and item.date.startswith(date_str):
-                return item
-        return None
+        index = self._find_by_date(date_str)
+        return self.data[index] if index is not None else None
     
     def _find_by_date(self, date_str: str) -> Optional[int]:
         """Find index by date string."""
-        for i, item in enumerate(self.data):
-            if item.date and item.date.startswith(date_str):
+        if len(date_str) < 10:
+            # Shorter than YYYY-MM-DD (e.g. a month prefix): not covered by the index
+            for i, item in enumerate(self.data):
+                if item.date and item.date.startswith(date_str):
+                    return i
+            return None
+        
+        for i in self._by_date.get(date_str[:10], ()):
+            if self.data[i].date.startswith(date_str):
                 return i
         return None
     
     def get_recent_data(self, days: int = 7) -> List[SleepData]:
         """Get recent data sorted by day."""
-        sorted_data = sorted(self.data, key=lambda x: x.day, reverse=True)
-        return sorted_data[:days]
+        # Walk the day index from the top, keeping list order within a day
+        # exactly like a stable sort with reverse=True
+        recent = []
+        end = len(self._day_order)
+        while end > 0 and len(recent) < days:
+            start = bisect.bisect_left(self._day_order, (self._day_order[end - 1][0],))
+            for _, position in self._day_order[start:end]:
+                recent.append(self.data[position])
+            end = start
+        return recent[:days]
+    
+    def sorted_by_day(self) -> List[SleepData]:
+        """Get all data sorted by day, keeping list order within a day."""
+        return [self.data[position] for _, position in self._day_order]
+    
+    def day_order_positions(self) -> List[int]:
+        """Get list positions in the order of sorted_by_day."""
+        return [position for _, position in self._day_order]
     
     def get_all_dates(self) -> List[str]:
         """Get all dates with data."""
@@ -1,19 +1,25 @@
 """Sleep data API routes."""
 import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response, url_for
+from config.settings import SYNC_MODE, MAX_SYNC_BODY_BYTES, MAX_SYNC_DECODED_BYTES
 from app.services.data_service import DataService
+from app.services.sync_upload import (NDJSON_MIMETYPES, UploadTooLarge, open_upload,
+                                      read_json_upload, read_ndjson_upload)
+from app.services.storage import create_sleepen_manager
 from app.models.sleep_data import SleepData
-from sleepen import SleepenManager
-from config.settings import SLEEPEN_DATA_FILE
 
 sleep_bp = Blueprint('sleep', __name__, url_prefix='/api')
 
+# Bounds for /api/trends query parameters
+MAX_TREND_WINDOW = 365
+MAX_TREND_WINDOWS = 5
+MAX_TREND_DAYS = 3660
+
 
 @sleep_bp.route('/save_sleep_data', methods=['POST'])
 def save_sleep_data():
     """API endpoint to save sleep data."""
     data_service = DataService()
-    data = data_service.load_data()
     form_data = request.form
     
     # Get selected date from form
@@ -21,37 +27,38 @@ def save_sleep_data():
     if not selected_date:
         selected_date = datetime.datetime.now().strftime('%Y-%m-%d')
     
-    # Create sleep data object
-    sleep_data = SleepData(
-        day=data['currentDay'],
-        date=selected_date + 'T00:00:00',
-        bed_in_time=form_data.get('bed_in_time'),
-        bed_out_time=form_data.get('bed_out_time'),
-        bedtime=form_data.get('bedtime'),
-        wake_time=form_data.get('wake_time'),
-        sleep_quality=int(form_data.get('sleep_quality', 0)),
-        notes=form_data.get('notes', ''),
-        challenge_completed=form_data.get('challenge_completed') == 'on'
-    )
-    
-    # Add reflection data if provided
-    if 'morning_feeling' in form_data:
-        sleep_data.reflection = {
-            'morningFeeling': int(form_data.get('morning_feeling', 0)),
-            'workedWell': form_data.get('worked_well', ''),
-            'improve': form_data.get('improve', ''),
-            'nextGoal': form_data.get('next_goal', '')
-        }
-    
-    # Update data collection
-    sleep_collection = data_service.get_sleep_data_collection(data)
-    sleep_collection.add_or_update(sleep_data)
-    data['sleepData'] = sleep_collection.to_dict_list()
+    def record(data):
+        # Create sleep data object
+        sleep_data = SleepData(
+            day=data['currentDay'],
+            date=selected_date + 'T00:00:00',
+            bed_in_time=form_data.get('bed_in_time'),
+            bed_out_time=form_data.get('bed_out_time'),
+            bedtime=form_data.get('bedtime'),
+            wake_time=form_data.get('wake_time'),
+            sleep_quality=int(form_data.get('sleep_quality', 0)),
+            notes=form_data.get('notes', ''),
+            challenge_completed=form_data.get('challenge_completed') == 'on'
+        )
+        
+        # Add reflection data if provided
+        if 'morning_feeling' in form_data:
+            sleep_data.reflection = {
+                'morningFeeling': int(form_data.get('morning_feeling', 0)),
+                'workedWell': form_data.get('worked_well', ''),
+                'improve': form_data.get('improve', ''),
+                'nextGoal': form_data.get('next_goal', '')
+            }
+        
+        # Update data collection
+        sleep_collection = data_service.get_sleep_data_collection(data)
+        data_service.save_sleep_record(data, sleep_collection, sleep_data)
+        return sleep_data
     
-    data_service.save_data(data)
+    sleep_data = data_service.update(record)
     
     # Update Sleepen based on sleep data
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
+    sleepen_manager = create_sleepen_manager()
     sleepen = sleepen_manager.process_sleep_data(sleep_data.to_dict())
     
     return jsonify({
@@ -60,7 +67,7 @@ def save_sleep_data():
         'sleepen': {
             'level': sleepen.level,
             'exp': sleepen.exp,
-            'adventure': sleepen.adventures[-1] if sleepen.adventures else None
+            'adventure': sleepen.render_adventure(sleepen.adventures[-1]) if sleepen.adventures else None
         }
     })
 
@@ -69,15 +76,8 @@ def save_sleep_data():
 def save_reflection():
     """API endpoint to save sleep reflection data."""
     data_service = DataService()
-    data = data_service.load_data()
     form_data = request.form
     
-    current_day = data['currentDay']
-    
-    # Find existing data or create new
-    sleep_collection = data_service.get_sleep_data_collection(data)
-    existing_data = sleep_collection.find_by_day(current_day)
-    
     reflection_data = {
         'morningFeeling': int(form_data.get('morning_feeling', 0)),
         'workedWell': form_data.get('worked_well', ''),
@@ -85,20 +85,26 @@ def save_reflection():
         'nextGoal': form_data.get('next_goal', '')
     }
     
-    if existing_data:
-        existing_data.reflection = reflection_data
-        sleep_collection.add_or_update(existing_data)
-    else:
-        # Create new data with reflection only
-        sleep_data = SleepData(
-            day=current_day,
-            date=datetime.datetime.now().isoformat(),
-            reflection=reflection_data
-        )
-        sleep_collection.add_or_update(sleep_data)
+    def reflect(data):
+        current_day = data['currentDay']
+        
+        # Find existing data or create new
+        sleep_collection = data_service.get_sleep_data_collection(data)
+        existing_data = sleep_collection.find_by_day(current_day)
+        
+        if existing_data:
+            existing_data.reflection = reflection_data
+            data_service.save_sleep_record(data, sleep_collection, existing_data)
+        else:
+            # Create new data with reflection only
+            sleep_data = SleepData(
+                day=current_day,
+                date=datetime.datetime.now().isoformat(),
+                reflection=reflection_data
+            )
+            data_service.save_sleep_record(data, sleep_collection, sleep_data)
     
-    data['sleepData'] = sleep_collection.to_dict_list()
-    data_service.save_data(data)
+    data_service.update(reflect)
     
     return jsonify({'success': True, 'message': '睡眠の振り返りが保存されました！'})
 
@@ -107,16 +113,17 @@ def save_reflection():
 def save_goals():
     """API endpoint to save sleep goals."""
     data_service = DataService()
-    data = data_service.load_data()
     form_data = request.form
     
-    data['settings']['sleepGoals'] = {
-        'duration': float(form_data.get('duration', 8)),
-        'bedtime': form_data.get('bedtime', '23:00'),
-        'wakeTime': form_data.get('wake_time', '07:00')
-    }
+    def set_goals(data):
+        data['settings']['sleepGoals'] = {
+            'duration': float(form_data.get('duration', 8)),
+            'bedtime': form_data.get('bedtime', '23:00'),
+            'wakeTime': form_data.get('wake_time', '07:00')
+        }
+        data_service.save_state(data)
     
-    data_service.save_data(data)
+    data_service.update(set_goals)
     
     return jsonify({'success': True, 'message': '睡眠目標が保存されました！'})
 
@@ -125,20 +132,22 @@ def save_goals():
 def save_settings():
     """API endpoint to save settings."""
     data_service = DataService()
-    data = data_service.load_data()
     form_data = request.form
     
-    data['settings']['idealSleepTime'] = float(form_data.get('ideal_sleep_time', 8))
-    data['settings']['bedtimeReminder'] = form_data.get('bedtime_reminder', '22:00')
-    
-    # Handle start date setting
-    start_date = form_data.get('start_date')
-    if start_date:
-        data['settings']['startDate'] = start_date
-        # Recalculate current day based on start date
-        data['currentDay'] = data_service.calculate_current_day(start_date)
+    def set_settings(data):
+        data['settings']['idealSleepTime'] = float(form_data.get('ideal_sleep_time', 8))
+        data['settings']['bedtimeReminder'] = form_data.get('bedtime_reminder', '22:00')
+        
+        # Handle start date setting
+        start_date = form_data.get('start_date')
+        if start_date:
+            data['settings']['startDate'] = start_date
+            # Recalculate current day based on start date
+            data['currentDay'] = data_service.calculate_current_day(start_date)
+        
+        data_service.save_state(data)
     
-    data_service.save_data(data)
+    data_service.update(set_settings)
     
     return jsonify({'success': True, 'message': '設定が保存されました。'})
 
@@ -147,10 +156,7 @@ def save_settings():
 def view_day(day):
     """API endpoint to view data for a specific day."""
     data_service = DataService()
-    data = data_service.load_data()
-    
-    sleep_collection = data_service.get_sleep_data_collection(data)
-    day_data = sleep_collection.find_by_day(day)
+    day_data = data_service.find_by_day(day)
     
     if day_data:
         return jsonify({'success': True, 'data': day_data.to_dict()})
@@ -162,10 +168,7 @@ def view_day(day):
 def view_date(date_str):
     """API endpoint to view data for a specific date."""
     data_service = DataService()
-    data = data_service.load_data()
-    
-    sleep_collection = data_service.get_sleep_data_collection(data)
-    day_data = sleep_collection.find_by_date(date_str)
+    day_data = data_service.find_by_date(date_str)
     
     if day_data:
         return jsonify({'success': True, 'data': day_data.to_dict()})
@@ -180,10 +183,8 @@ def advance_day():
     data = data_service.advance_day()
     
     # Rest Sleepen when advancing to next day
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
-    sleepen = sleepen_manager.get_sleepen()
-    sleepen.rest()
-    sleepen_manager.update_sleepen(sleepen)
+    sleepen_manager = create_sleepen_manager()
+    sleepen_manager.update(lambda sleepen: sleepen.rest())
     
     return jsonify({'success': True, 'message': f'Day {data["currentDay"]}に進みました。'})
 
@@ -199,46 +200,191 @@ def reset_program():
 
 @sleep_bp.route('/sync', methods=['POST'])
 def sync_data():
-    """API endpoint to synchronize offline data with server data."""
+    """API endpoint to synchronize offline data with server data.
+    
+    Clients that include ``syncToken`` (null on their first sync) upload and
+    receive only changed records; see DataService.sync_offline_data.
+    
+    With SYNC_MODE 'queue' the upload is queued and the response is a 202
+    with a job id to poll at /api/sync/status/<job_id>. Uploads carrying
+    the same Idempotency-Key header map to the same job and are merged only
+    once; without the header every upload is a new job.
+    
+    The body may be gzip-encoded (Content-Encoding: gzip) and may be NDJSON
+    (application/x-ndjson, one record per line, parsed line by line).
+    Bodies over MAX_SYNC_BODY_BYTES, or MAX_SYNC_DECODED_BYTES once
+    decompressed, are rejected with a 413.
+    """
     try:
-        offline_data = request.json
+        try:
+            offline_data = _read_sync_body()
+        except UploadTooLarge as e:
+            return jsonify({'success': False, 'message': f'同期データが大きすぎます: {str(e)}'}), 413
         
         if not offline_data:
             return jsonify({'success': False, 'message': 'No data provided'})
         
+        if SYNC_MODE == 'queue':
+            job = DataService.get_sync_queue().submit(offline_data, request.headers.get('Idempotency-Key'))
+            return _sync_job_response(job)
+        
         data_service = DataService()
-        merged_data = data_service.merge_offline_data(offline_data)
+        payload = data_service.sync_offline_data(offline_data)
         
         return jsonify({
             'success': True,
             'message': 'データが同期されました。',
-            'data': merged_data
+            **payload
         })
     except Exception as e:
         return jsonify({'success': False, 'message': f'同期エラー: {str(e)}'})
 
 
+def _read_sync_body():
+    """Parse the /api/sync body within the upload limits."""
+    if request.content_length is not None and request.content_length > MAX_SYNC_BODY_BYTES:
+        raise UploadTooLarge(f"Request body exceeds {MAX_SYNC_BODY_BYTES} bytes")
+    
+    upload = open_upload(request.stream, request.headers.get('Content-Encoding'),
+                         MAX_SYNC_BODY_BYTES, MAX_SYNC_DECODED_BYTES)
+    if request.mimetype in NDJSON_MIMETYPES:
+        return read_ndjson_upload(upload)
+    if not request.is_json:
+        raise ValueError(f"Unsupported Content-Type: {request.mimetype}")
+    return read_json_upload(upload)
+
+
+@sleep_bp.route('/sync/status/<job_id>', methods=['GET'])
+def sync_status(job_id):
+    """API endpoint to poll a queued sync upload."""
+    job = DataService.get_sync_queue().get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '同期ジョブが見つかりません。'})
+    return _sync_job_response(job)
+
+
+def _sync_job_response(job):
+    """202 while a sync job is queued; its result (or error) once it has run."""
+    body = {
+        'success': job['status'] != 'failed',
+        'jobId': job['id'],
+        'status': job['status'],
+        'statusUrl': url_for('sleep.sync_status', job_id=job['id'])
+    }
+    if job['status'] == 'queued':
+        body['message'] = '同期データを受け付けました。'
+        response = jsonify(body)
+        response.status_code = 202
+        response.headers['Location'] = body['statusUrl']
+        return response
+    if job['status'] == 'failed':
+        body['message'] = f"同期エラー: {job.get('error', '')}"
+    else:
+        body['message'] = 'データが同期されました。'
+        body.update(job.get('result', {}))
+    return jsonify(body)
+
+
 @sleep_bp.route('/analyze', methods=['GET'])
 def analyze_sleep_patterns():
-    """API endpoint to get advanced sleep pattern analysis."""
+    """API endpoint to get advanced sleep pattern analysis.
+    
+    Responses carry a strong ETag derived from the data version and
+    settings, so a client revalidating with If-None-Match gets a 304
+    without the analysis being recomputed.
+    """
     try:
         data_service = DataService()
         data = data_service.load_data()
         
-        sleep_collection = data_service.get_sleep_data_collection(data)
+        etag = data_service.etag_for(data, 'analyze')
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
         
-        if not sleep_collection.data:
-            return jsonify({'success': False, 'message': 'データがありません。'})
+        result = data_service.memoize(data, 'analyze', lambda: _analyze(data_service, data))
+        response = jsonify(result)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'分析エラー: {str(e)}'})
+
+
+def _analyze(data_service, data):
+    """Build the /api/analyze response body."""
+    sleep_collection = data_service.get_sleep_data_collection(data)
+    
+    if not sleep_collection.data:
+        return {'success': False, 'message': 'データがありません。'}
+    
+    from app.services.sleep_analytics import create_sleep_analytics
+    analytics = create_sleep_analytics(sleep_collection, data['settings'],
+                                       data_service.get_sleep_columns(data))
+    
+    # Advanced analytics
+    analysis = {
+        'weekdayVsWeekend': analytics.analyze_weekday_vs_weekend(),
+        'recommendations': analytics.generate_recommendations()
+    }
+    
+    return {'success': True, 'analysis': analysis}
+
+
+@sleep_bp.route('/trends', methods=['GET'])
+def sleep_trends():
+    """API endpoint to get moving averages and sleep debt per calendar day.
+    
+    Query parameters: ``windows`` (comma separated day counts, default
+    7,30,90) and ``days`` (length of the series, default 365).
+    """
+    try:
+        # A repeated window would name the same series twice; keep its first position
+        windows = list(dict.fromkeys(int(window) for window in request.args.get('windows', '7,30,90').split(',')))
+        days = int(request.args.get('days', 365))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'windows と days は整数で指定してください。'})
+    
+    if (not windows or len(windows) > MAX_TREND_WINDOWS
+            or not all(1 <= window <= MAX_TREND_WINDOW for window in windows)
+            or not 1 <= days <= MAX_TREND_DAYS):
+        return jsonify({'success': False, 'message': '期間の指定が範囲外です。'})
+    
+    try:
+        data_service = DataService()
+        data = data_service.load_data()
         
-        from app.services.sleep_analytics import SleepAnalytics
-        analytics = SleepAnalytics(sleep_collection, data['settings'])
+        endpoint = f"trends:{','.join(map(str, windows))}:{days}"
+        etag = data_service.etag_for(data, endpoint)
+        if request.if_none_match.contains(etag):
+            return _not_modified(etag)
         
-        # Advanced analytics
-        analysis = {
-            'weekdayVsWeekend': analytics.analyze_weekday_vs_weekend(),
-            'recommendations': analytics.generate_recommendations()
-        }
+        def compute():
+            from app.services.sleep_analytics import create_sleep_analytics
+            analytics = create_sleep_analytics(data_service.get_sleep_data_collection(data), data['settings'],
+                                               data_service.get_sleep_columns(data))
+            return {'success': True, 'trends': analytics.calculate_trends(windows, days)}
         
-        return jsonify({'success': True, 'analysis': analysis})
+        response = jsonify(data_service.memoize(data, endpoint, compute))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
-        return jsonify({'success': False, 'message': f'分析エラー: {str(e)}'})
\ No newline at end of file
+        return jsonify({'success': False, 'message': f'分析エラー: {str(e)}'})
+
+
+def _not_modified(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@sleep_bp.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """API endpoint to monitor the parsed-data cache."""
+    return jsonify({
+        'success': True,
+        'cache': DataService.get_cache_stats(),
+        'analytics': DataService.get_analytics_cache_stats(),
+        'writeBehind': DataService.get_write_behind_stats()
+    })
\ No newline at end of file
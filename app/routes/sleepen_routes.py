@@ -1,7 +1,8 @@
 """Sleepen API routes."""
 from flask import Blueprint, request, jsonify
-from sleepen import SleepenManager
-from config.settings import SLEEPEN_DATA_FILE
+from app.services.storage import create_sleepen_manager
+from config.settings import MAX_DREAMS_PER_REQUEST
+from dream_lexicon import load_lexicon
 
 sleepen_bp = Blueprint('sleepen', __name__, url_prefix='/api/sleepen')
 
@@ -9,13 +10,13 @@ sleepen_bp = Blueprint('sleepen', __name__, url_prefix='/api/sleepen')
 @sleepen_bp.route('/', methods=['GET'])
 def get_sleepen_data():
     """API endpoint to get Sleepen data."""
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
+    sleepen_manager = create_sleepen_manager()
     sleepen = sleepen_manager.get_sleepen()
     
     return jsonify({
         'success': True,
-        'sleepen': sleepen.to_dict(),
-        'recent_adventures': sleepen.adventures[-5:] if sleepen.adventures else []
+        'sleepen': dict(sleepen.to_dict(), adventures=sleepen.render_adventures(sleepen.adventures)),
+        'recent_adventures': sleepen.render_adventures(sleepen.adventures[-5:])
     })
 
 
@@ -24,10 +25,8 @@ def set_sleepen_name():
     """API endpoint to set Sleepen name."""
     name = request.form.get('name', 'スリープン')
     
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
-    sleepen = sleepen_manager.get_sleepen()
-    sleepen.name = name
-    sleepen_manager.update_sleepen(sleepen)
+    sleepen_manager = create_sleepen_manager()
+    sleepen_manager.update(lambda sleepen: sleepen.rename(name))
     
     return jsonify({'success': True, 'message': f'スリープンの名前を「{name}」に変更しました！'})
 
@@ -35,11 +34,8 @@ def set_sleepen_name():
 @sleepen_bp.route('/play', methods=['POST'])
 def play_with_sleepen():
     """API endpoint to play with Sleepen."""
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
-    sleepen = sleepen_manager.get_sleepen()
-    
-    mood = sleepen.play()
-    sleepen_manager.update_sleepen(sleepen)
+    sleepen_manager = create_sleepen_manager()
+    sleepen, mood = sleepen_manager.update(lambda sleepen: (sleepen, sleepen.play()))
     
     return jsonify({
         'success': True,
@@ -52,11 +48,8 @@ def play_with_sleepen():
 @sleepen_bp.route('/rest', methods=['POST'])
 def rest_sleepen():
     """API endpoint to let Sleepen rest."""
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
-    sleepen = sleepen_manager.get_sleepen()
-    
-    energy = sleepen.rest()
-    sleepen_manager.update_sleepen(sleepen)
+    sleepen_manager = create_sleepen_manager()
+    sleepen, energy = sleepen_manager.update(lambda sleepen: (sleepen, sleepen.rest()))
     
     return jsonify({
         'success': True,
@@ -71,23 +64,23 @@ def manual_adventure():
     sleep_quality = int(request.form.get('quality', 3))
     location = request.form.get('location', None)
     
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
-    sleepen = sleepen_manager.get_sleepen()
-    
-    # Check if Sleepen has enough energy
-    if sleepen.energy < 30:
+    def send(sleepen):
+        # Check if Sleepen has enough energy
+        if sleepen.energy < 30:
+            return sleepen, None
+        
+        # Check if location exists in sleepen's discovered locations
+        known_location = location if location and sleepen.get_location(location) is not None else None
+        return sleepen, sleepen.go_on_adventure(sleep_quality, known_location)
+    
+    sleepen_manager = create_sleepen_manager()
+    sleepen, adventure = sleepen_manager.update(send)
+    if adventure is None:
         return jsonify({
             'success': False,
             'message': f'{sleepen.name}は疲れています。先に休ませてください。'
         })
     
-    # Check if location exists in sleepen's discovered locations
-    if location and not any(loc["name"] == location for loc in sleepen.dream_locations):
-        location = None
-    
-    adventure = sleepen.go_on_adventure(sleep_quality, location)
-    sleepen_manager.update_sleepen(sleepen)
-    
     return jsonify({
         'success': True,
         'message': f'{sleepen.name}が冒険に出かけました！',
@@ -105,20 +98,22 @@ def train_sleepen():
     """API endpoint to train Sleepen's skills."""
     skill_name = request.form.get('skill', None)
     
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
-    sleepen = sleepen_manager.get_sleepen()
-    
-    # Check if Sleepen has any skills
-    if not sleepen.skills:
+    def train(sleepen):
+        # Check if Sleepen has any skills
+        if not sleepen.skills:
+            return sleepen, None
+        
+        # Train the skill
+        return sleepen, sleepen.train(skill_name)
+    
+    sleepen_manager = create_sleepen_manager()
+    sleepen, skill = sleepen_manager.update(train)
+    if skill is None:
         return jsonify({
             'success': False,
             'message': f'{sleepen.name}はまだスキルを習得していません。'
         })
     
-    # Train the skill
-    skill = sleepen.train(skill_name)
-    sleepen_manager.update_sleepen(sleepen)
-    
     return jsonify({
         'success': True,
         'message': f'{sleepen.name}が「{skill["name"]}」のトレーニングをしました！',
@@ -139,28 +134,107 @@ def interpret_dream():
             'message': '夢の内容を入力してください。'
         })
     
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
-    sleepen = sleepen_manager.get_sleepen()
+    def interpret(sleepen):
+        # Check if Sleepen has the dream interpretation skill
+        if not sleepen.has_skill("夢の解読"):
+            return sleepen, None
+        
+        # Interpret the dream
+        return sleepen, sleepen.interpret_dream(dream_description)
+    
+    sleepen_manager = create_sleepen_manager()
+    sleepen, interpretation = sleepen_manager.update(interpret)
+    if interpretation is None:
+        return jsonify({
+            'success': False,
+            'message': f'{sleepen.name}はまだ夢を解読するスキルを習得していません。'
+        })
     
-    # Check if Sleepen has the dream interpretation skill
-    has_interpretation_skill = any(skill["name"] == "夢の解読" for skill in sleepen.skills)
+    return jsonify({
+        'success': True,
+        'interpretation': interpretation,
+        'sleepen': {
+            'friendship': sleepen.friendship,
+            'exp': sleepen.exp,
+            'level': sleepen.level
+        }
+    })
+
+@sleepen_bp.route('/interpret_dreams', methods=['POST'])
+def interpret_dreams():
+    """API endpoint to interpret a batch of dreams, e.g. a dream journal.
+    
+    Takes a JSON body ``{"dreams": [...]}`` whose entries are dream texts or
+    objects with a ``dream`` text; any other fields of an object (date,
+    id, ...) are returned with its result.
+    """
+    body = request.get_json(silent=True) or {}
+    dreams = body.get('dreams') if isinstance(body, dict) else None
+    
+    if not isinstance(dreams, list) or not dreams:
+        return jsonify({
+            'success': False,
+            'message': '夢の内容を入力してください。'
+        })
+    if len(dreams) > MAX_DREAMS_PER_REQUEST:
+        return jsonify({
+            'success': False,
+            'message': f'一度に解読できる夢は{MAX_DREAMS_PER_REQUEST}件までです。'
+        })
     
-    if not has_interpretation_skill:
+    entries = [entry if isinstance(entry, dict) else {'dream': entry} for entry in dreams]
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry.get('dream'), str) or not entry['dream']:
+            return jsonify({
+                'success': False,
+                'message': f'{number}件目の夢の内容を入力してください。'
+            })
+    
+    def interpret(sleepen):
+        if not sleepen.has_skill("夢の解読"):
+            return sleepen, None
+        
+        lexicon = load_lexicon()
+        return sleepen, [
+            dict({key: value for key, value in entry.items() if key != 'dream'},
+                 **sleepen.analyze_dream(entry['dream'], lexicon))
+            for entry in entries
+        ]
+    
+    sleepen_manager = create_sleepen_manager()
+    sleepen, results = sleepen_manager.update(interpret)
+    if results is None:
         return jsonify({
             'success': False,
             'message': f'{sleepen.name}はまだ夢を解読するスキルを習得していません。'
         })
     
-    # Interpret the dream
-    interpretation = sleepen.interpret_dream(dream_description)
-    sleepen_manager.update_sleepen(sleepen)
-    
     return jsonify({
         'success': True,
-        'interpretation': interpretation,
+        'results': results,
         'sleepen': {
             'friendship': sleepen.friendship,
             'exp': sleepen.exp,
             'level': sleepen.level
         }
-    })
\ No newline at end of file
+    })
+
+
+@sleepen_bp.route('/adventures', methods=['GET'])
+def list_adventures():
+    """API endpoint to page backwards through Sleepen's adventure history.
+    
+    Returns the newest adventures first; pass the returned ``next_cursor``
+    as ``cursor`` to get the page before them.
+    """
+    cursor = request.args.get('cursor', type=int)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    
+    sleepen_manager = create_sleepen_manager()
+    adventures, next_cursor = sleepen_manager.adventures_page(cursor, limit)
+    
+    return jsonify({
+        'success': True,
+        'adventures': adventures,
+        'next_cursor': next_cursor
+    })
@@ -0,0 +1,225 @@
+"""Cross-process file locking, optimistic concurrency and atomic writes."""
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrentModificationError(Exception):
+    """Raised when a document was changed by someone else since it was loaded."""
+
+    def __init__(self, path: str, expected: int, actual: int):
+        super().__init__(f"{path} changed concurrently (expected version {expected}, found {actual})")
+        self.path = path
+        self.expected = expected
+        self.actual = actual
+
+
+class FileLockManager:
+    """Shared/exclusive advisory locks on ``<path>.lock`` using fcntl.flock.
+
+    Readers take shared locks and never block each other; writers take an
+    exclusive lock that excludes readers and writers in every process and
+    thread. Locks are reentrant per thread, so a writer can re-read the
+    document it holds; a shared lock cannot be upgraded. Without fcntl
+    (Windows) both modes fall back to one in-process lock per path.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._fallback_locks: Dict[str, threading.RLock] = {}
+        self._guard = threading.Lock()
+
+    @contextmanager
+    def shared(self, path: str) -> Iterator[None]:
+        """Hold a shared (read) lock on path."""
+        with self._acquire(path, exclusive=False):
+            yield
+
+    @contextmanager
+    def exclusive(self, path: str) -> Iterator[None]:
+        """Hold an exclusive (write) lock on path."""
+        with self._acquire(path, exclusive=True):
+            yield
+
+    @contextmanager
+    def _acquire(self, path: str, exclusive: bool) -> Iterator[None]:
+        held = self._held()
+        entry = held.get(path)
+        if entry is not None:
+            if exclusive and not entry['exclusive']:
+                raise RuntimeError(f"Cannot upgrade a shared lock on {path}")
+            entry['depth'] += 1
+            try:
+                yield
+            finally:
+                entry['depth'] -= 1
+            return
+
+        release = self._lock(path, exclusive)
+        held[path] = {'exclusive': exclusive, 'depth': 1}
+        try:
+            yield
+        finally:
+            del held[path]
+            release()
+
+    def _held(self) -> Dict[str, Dict[str, Any]]:
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            held = self._local.held = {}
+        return held
+
+    def _lock(self, path: str, exclusive: bool) -> Callable[[], None]:
+        if fcntl is None:
+            with self._guard:
+                lock = self._fallback_locks.setdefault(path, threading.RLock())
+            lock.acquire()
+            return lock.release
+
+        # A separate open file description per holder, so threads of one
+        # process exclude each other just like separate processes do
+        fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        def release() -> None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+        return release
+
+
+file_locks = FileLockManager()
+
+
+class LoadStamps:
+    """Per-thread record of the version each document was loaded at.
+
+    Cached documents are shared by every thread of a process and saves bump
+    their version in place, so a document's own version can't tell a thread
+    whether someone saved since it loaded it. Stores stamp the document they
+    hand out and compare the stamp, not the document, with the stored version.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def stamp(self, path: str, document: Any) -> Any:
+        """Remember document's current version as this thread's starting point for path."""
+        stamps = self._stamps()
+        stamps[path] = (document, document.get('version', 0))
+        return document
+
+    def expected(self, path: str, document: Any) -> int:
+        """Version document was stamped with in this thread, or its own if it never was."""
+        stamped = self._stamps().get(path)
+        if stamped is not None and stamped[0] is document:
+            return stamped[1]
+        return document.get('version', 0)
+
+    def _stamps(self) -> Dict[str, Any]:
+        stamps = getattr(self._local, 'stamps', None)
+        if stamps is None:
+            stamps = self._local.stamps = {}
+        return stamps
+
+
+load_stamps = LoadStamps()
+
+
+def check_version(path: str, expected: int, actual: int) -> None:
+    """Raise ConcurrentModificationError unless the stored version is the expected one."""
+    if expected != actual:
+        raise ConcurrentModificationError(path, expected, actual)
+
+
+def retry_on_conflict(operation: Callable[[], Any], attempts: int = 5,
+                      on_conflict: Callable[[], None] = None) -> Any:
+    """Run operation, re-running it after a ConcurrentModificationError.
+
+    on_conflict runs before each retry, typically to drop cached copies so
+    the next attempt starts from the latest stored document. Waits a short
+    randomized, growing delay between attempts.
+    """
+    for attempt in range(attempts):
+        try:
+            return operation()
+        except ConcurrentModificationError as e:
+            if on_conflict is not None:
+                on_conflict()
+            if attempt == attempts - 1:
+                raise
+            logger.info(f"Retrying after concurrent modification: {e}")
+            time.sleep(random.uniform(0, 0.005 * (2 ** attempt)))
+
+
+# Read once at import: os.umask can only be queried by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def file_mode_for(path: str) -> int:
+    """Permission bits a rewrite of path should have: the existing file's, or the umask default."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write_json(path: str, document: Any, **dump_kwargs) -> None:
+    """Write JSON to a unique temp file in the same directory, fsync it and swap it in.
+
+    Readers see either the old or the new file, never a partial one, and two
+    writers never share a temp file. The file keeps its permissions (mkstemp
+    creates temp files owner-only).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        os.chmod(tmp_path, file_mode_for(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(document, f, ensure_ascii=False, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def append_json_line(path: str, record: Any, fsync: bool = True) -> int:
+    """Append record to a JSON-lines file and return the file's size after it.
+
+    A torn last line left by an interrupted append is ended first, so it stays
+    one unreadable line instead of swallowing this record.
+    """
+    with open(path, 'a+b') as f:
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        f.write((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+        return f.tell()
@@ -0,0 +1,154 @@
+"""Process-wide cache of parsed data documents."""
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+Signature = Optional[Tuple[Optional[Tuple[int, int, int]], ...]]
+
+
+class _CacheEntry:
+    """Cached document together with the file state it was read from."""
+
+    def __init__(self, document: Any, signature: Signature):
+        self.document = document
+        self.signature = signature
+        self.derived: Dict[str, Any] = {}
+
+
+class DocumentCache:
+    """Cache parsed documents and derived objects keyed by file path.
+
+    An entry stays valid while the (mtime, size, inode) signature of the file
+    and of any companion files (e.g. a journal) is unchanged, so a write from
+    another process forces a re-read while our own ``store`` calls keep the
+    entry warm. Cached documents are shared between requests: callers that
+    mutate one must hold ``lock(path)`` from loading it until it is persisted
+    with ``store``, and ``invalidate`` it if they give up, so other threads
+    never build on (or keep seeing) a half-applied change.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._document_locks: Dict[str, threading.RLock] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def signature(*paths: str) -> Signature:
+        """Return the (mtime_ns, size, inode) signatures of files, or None if none exist."""
+        signatures = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                signatures.append(None)
+                continue
+            signatures.append((st.st_mtime_ns, st.st_size, st.st_ino))
+        if not any(signatures):
+            return None
+        return tuple(signatures)
+
+    @contextmanager
+    def lock(self, path: str) -> Iterator[None]:
+        """Serialize load -> mutate -> save of the document at path within this process.
+
+        Reentrant, so a locked update can call helpers that lock again. Other
+        processes are excluded by the file lock and version check on save.
+        """
+        with self._lock:
+            document_lock = self._document_locks.setdefault(path, threading.RLock())
+        with document_lock:
+            yield
+
+    def get(self, path: str, loader: Callable[[], Any], companions: Tuple[str, ...] = ()) -> Any:
+        """Return the cached document for path, re-reading it if stale."""
+        signature = self.signature(path, *companions)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and signature is not None and entry.signature == signature:
+                self.hits += 1
+                return entry.document
+            self.misses += 1
+
+        # Read outside the lock so slow disks don't serialize other files
+        document = loader()
+        if signature is not None:
+            with self._lock:
+                self._entries[path] = _CacheEntry(document, signature)
+        return document
+
+    def store(self, path: str, document: Any, derived: Dict[str, Any] = None,
+              companions: Tuple[str, ...] = ()) -> None:
+        """Record a document we just wrote to path."""
+        signature = self.signature(path, *companions)
+        with self._lock:
+            if signature is None:
+                self._entries.pop(path, None)
+                return
+            entry = _CacheEntry(document, signature)
+            if derived:
+                entry.derived.update(derived)
+            self._entries[path] = entry
+
+    def refresh(self, path: str, document: Any, companions: Tuple[str, ...] = ()) -> None:
+        """Re-record the file signature after writing the cached document out unchanged.
+
+        Keeps the entry's derived objects; does nothing if
+        document is no longer the one cached for path.
+        """
+        signature = self.signature(path, *companions)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.document is document and signature is not None:
+                entry.signature = signature
+
+    def derive(self, path: str, document: Any, name: str, factory: Callable[[], Any]) -> Any:
+        """Return an object built from the cached document, building it once.
+
+        Falls back to calling factory directly when document is not the one
+        currently cached for path (e.g. the default document of a new install).
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.document is not document:
+                return factory()
+            if name in entry.derived:
+                return entry.derived[name]
+
+        value = factory()
+        with self._lock:
+            if self._entries.get(path) is entry:
+                entry.derived[name] = value
+        return value
+
+    def peek(self, path: str, document: Any, name: str) -> Any:
+        """Return an already-built derived object, or None without building it."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.document is not document:
+                return None
+            return entry.derived.get(name)
+
+    def invalidate(self, path: str = None) -> None:
+        """Drop the entry for path, or every entry when path is None."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters for monitoring."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / total, 3) if total else 0.0,
+                'entries': len(self._entries)
+            }
+
+
+document_cache = DocumentCache()
@@ -1,27 +1,88 @@
 """Data management service."""
 import datetime
 import logging
-from typing import Dict, Any
-from config.settings import DATA_FILE, DEFAULT_SETTINGS
-from sync import SleepDataSync
-from app.models.sleep_data import SleepDataCollection
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config.settings import DEFAULT_SETTINGS, SYNC_QUEUE_DIR, SYNC_QUEUE_INTERVAL
+from app.models.sleep_data import SleepData, SleepDataCollection
+from app.models.sleep_columns import SleepDataColumns
+from app.models.sleep_aggregates import SleepAggregates
+from app.services.concurrency import retry_on_conflict
+from app.services.data_cache import document_cache
+from app.services.result_cache import analytics_cache, settings_hash
+from app.services.storage import create_sleep_storage
+from app.services.sync_queue import SyncJobQueue
+from app.services.write_behind import write_behind
 
 logger = logging.getLogger(__name__)
 
+_sync_queue: Optional[SyncJobQueue] = None
+_sync_queue_lock = threading.Lock()
+
 
 class DataService:
     """Service for managing sleep data and settings."""
     
     def __init__(self):
-        self.sync = SleepDataSync(DATA_FILE)
+        self.sync = create_sleep_storage()
     
     def load_data(self) -> Dict[str, Any]:
         """Load sleep data from JSON file."""
         return self.sync.load_data()
     
-    def save_data(self, data: Dict[str, Any]) -> None:
-        """Save sleep data to JSON file."""
+    def update(self, mutator: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Apply mutator to freshly loaded data, retrying when another worker saved first.
+        
+        mutator must persist its changes through this service (save_data,
+        save_sleep_record or save_state) and may run more than once; each
+        retry starts from the latest stored data. Other threads of this
+        process wait until the mutator returns, and if it raises, the cached
+        document it may have half-changed is dropped. Returns mutator's result.
+        """
+        def attempt():
+            with document_cache.lock(self.sync.data_file):
+                try:
+                    return mutator(self.load_data())
+                except BaseException:
+                    document_cache.invalidate(self.sync.data_file)
+                    raise
+        
+        return retry_on_conflict(attempt)
+    
+    def save_data(self, data: Dict[str, Any], collection: SleepDataCollection = None) -> None:
+        """Save sleep data to JSON file.
+        
+        Passing the collection the data was rebuilt from keeps it cached for
+        the next request instead of hydrating it again.
+        """
         self.sync.save_data(data)
+        if collection is not None:
+            document_cache.derive(self.sync.data_file, data, 'collection', lambda: collection)
+    
+    def save_sleep_record(self, data: Dict[str, Any], collection: SleepDataCollection,
+                          sleep_data: SleepData) -> None:
+        """Add or update one record, journaling only that record."""
+        columns = document_cache.peek(self.sync.data_file, data, 'columns')
+        sleep_data.rev = self.sync.next_version(data)
+        index = collection.add_or_update(sleep_data)
+        record = sleep_data.to_dict()
+        
+        records = data.setdefault('sleepData', [])
+        if index < len(records):
+            records[index] = record
+        else:
+            records.append(record)
+        
+        self.sync.append_record(data, index, record)
+        document_cache.derive(self.sync.data_file, data, 'collection', lambda: collection)
+        if columns is not None:
+            columns.put(index, sleep_data)
+            document_cache.derive(self.sync.data_file, data, 'columns', lambda: columns)
+        logger.info(f"Sleep record saved for {sleep_data.date}")
+    
+    def save_state(self, data: Dict[str, Any]) -> None:
+        """Persist current day and settings without rewriting the records."""
+        self.sync.append_state(data)
         logger.info(f"Data saved successfully. Current day: {data['currentDay']}")
     
     def initialize_settings(self, settings: Dict[str, Any]) -> Dict[str, Any]:
@@ -57,24 +118,149 @@ class DataService:
             return 1
     
     def get_sleep_data_collection(self, data: Dict[str, Any]) -> SleepDataCollection:
-        """Get sleep data collection from loaded data."""
-        return SleepDataCollection(data.get('sleepData', []))
+        """Get sleep data collection from loaded data, cached per document.
+        
+        The collection's running aggregates are stored in data['aggregates']
+        (adopting the persisted ones when they still match the records), so
+        the next journal entry or snapshot persists them with the data.
+        """
+        return document_cache.derive(self.sync.data_file, data, 'collection',
+                                     lambda: self._build_collection(data))
+    
+    @staticmethod
+    def _build_collection(data: Dict[str, Any]) -> SleepDataCollection:
+        collection = SleepDataCollection(data.get('sleepData', []), data.get('aggregates'))
+        data['aggregates'] = collection.aggregates.state
+        return collection
+    
+    def get_sleep_columns(self, data: Dict[str, Any]) -> SleepDataColumns:
+        """Get the columnar form of the loaded data for analytics, cached per document."""
+        return document_cache.derive(
+            self.sync.data_file, data, 'columns',
+            lambda: SleepDataColumns.from_collection(self.get_sleep_data_collection(data))
+        )
+    
+    def find_by_day(self, day: int) -> Optional[SleepData]:
+        """Find data by day number, using the store's index when it has one."""
+        if self.sync.indexed:
+            record = self.sync.find_by_day(day)
+            return SleepData.from_dict(record) if record else None
+        return self.get_sleep_data_collection(self.load_data()).find_by_day(day)
+    
+    def find_by_date(self, date_str: str) -> Optional[SleepData]:
+        """Find data by date string, using the store's index when it has one."""
+        if self.sync.indexed:
+            record = self.sync.find_by_date(date_str)
+            return SleepData.from_dict(record) if record else None
+        return self.get_sleep_data_collection(self.load_data()).find_by_date(date_str)
+    
+    def get_all_dates(self) -> List[str]:
+        """Get all dates with data."""
+        if self.sync.indexed:
+            return self.sync.get_all_dates()
+        return self.get_sleep_data_collection(self.load_data()).get_all_dates()
+    
+    def result_key(self, data: Dict[str, Any], endpoint: str) -> Tuple:
+        """Key identifying a result computed from data's records and settings."""
+        return (self.sync.data_file, data.get('version', 0),
+                settings_hash(data.get('settings', {})), endpoint)
+    
+    def etag_for(self, data: Dict[str, Any], endpoint: str) -> str:
+        """Strong ETag for a response computed from data's records and settings."""
+        _, version, settings_digest, _ = self.result_key(data, endpoint)
+        return f'{endpoint}-{version}-{settings_digest}'
+    
+    def memoize(self, data: Dict[str, Any], endpoint: str, factory: Callable[[], Any]) -> Any:
+        """Return the cached result for data's current version, computing it once."""
+        return analytics_cache.get_or_compute(self.result_key(data, endpoint), factory)
+    
+    @staticmethod
+    def get_cache_stats() -> Dict[str, Any]:
+        """Get document cache hit/miss counters."""
+        return document_cache.stats()
+    
+    @staticmethod
+    def get_analytics_cache_stats() -> Dict[str, Any]:
+        """Get analytics memo cache hit/miss counters."""
+        return analytics_cache.stats()
+    
+    @staticmethod
+    def get_write_behind_stats() -> Dict[str, Any]:
+        """Get write-behind queue counters."""
+        return write_behind.stats()
     
     def merge_offline_data(self, offline_data: Dict[str, Any]) -> Dict[str, Any]:
         """Merge offline data with server data."""
-        return self.sync.merge_offline_data(offline_data)
+        return self.update(lambda _: self.sync.merge_offline_data(offline_data))
+    
+    def sync_offline_data(self, offline_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge a client's upload and build the /api/sync response payload.
+        
+        Clients that send a ``syncToken`` key take part in delta sync: they
+        upload only records changed since their token and get back only the
+        records changed on the server since then (``full: False``). Without
+        a usable token (first sync, reset program, ...) they get the whole
+        merged document in ``data`` (``full: True``), which is also the
+        response old clients without the key receive.
+        """
+        return self.sync_offline_batch([offline_data])[0]
+    
+    def sync_offline_batch(self, offline_batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Merge several uploads with one save; returns one sync_offline_data payload per upload."""
+        current = self.load_data()
+        since = [
+            self.sync.parse_sync_token(current, offline_data['syncToken'])
+            if 'syncToken' in offline_data else None
+            for offline_data in offline_batch
+        ]
+        
+        merged_data = self.update(lambda _: self.sync.merge_offline_batch(offline_batch))
+        token = self.sync.sync_token(merged_data)
+        payloads = []
+        for offline_data, version in zip(offline_batch, since):
+            payload: Dict[str, Any] = {'syncToken': token}
+            if version is None or self.sync.parse_sync_token(merged_data, offline_data['syncToken']) is None:
+                # Also covers a token invalidated by this very merge
+                payload['full'] = True
+                payload['data'] = merged_data
+            else:
+                payload['full'] = False
+                payload['changes'] = self.sync.changes_since(merged_data, version,
+                                                             offline_data.get('sleepData', []))
+                payload['currentDay'] = merged_data['currentDay']
+                payload['settings'] = merged_data['settings']
+            payloads.append(payload)
+        return payloads
+    
+    @staticmethod
+    def get_sync_queue() -> SyncJobQueue:
+        """Get the process-wide queue that merges sync uploads in the background."""
+        global _sync_queue
+        with _sync_queue_lock:
+            if _sync_queue is None:
+                _sync_queue = SyncJobQueue(SYNC_QUEUE_DIR,
+                                           lambda batch: DataService().sync_offline_batch(batch),
+                                           interval=SYNC_QUEUE_INTERVAL)
+            return _sync_queue
     
     def reset_program(self) -> Dict[str, Any]:
         """Reset the program data."""
-        data = self.load_data()
-        data['sleepData'] = []
-        data['currentDay'] = 1
-        self.save_data(data)
-        return data
+        def reset(data):
+            data['sleepData'] = []
+            data['currentDay'] = 1
+            data['aggregates'] = SleepAggregates().state
+            # Records were removed, so delta sync tokens can't describe this
+            self.sync.new_sync_epoch(data)
+            self.save_data(data)
+            return data
+        
+        return self.update(reset)
     
     def advance_day(self) -> Dict[str, Any]:
         """Advance to the next day."""
-        data = self.load_data()
-        data['currentDay'] += 1
-        self.save_data(data)
-        return data
\ No newline at end of file
+        def advance(data):
+            data['currentDay'] += 1
+            self.save_state(data)
+            return data
+        
+        return self.update(advance)
\ No newline at end of file
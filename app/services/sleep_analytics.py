@@ -1,18 +1,59 @@
 """Sleep analytics and statistics calculation service."""
 import datetime
-from typing import Dict, List, Any, Tuple
+import logging
+from itertools import accumulate
+from typing import Dict, List, Any, NamedTuple, Optional, Sequence
+from config.settings import ANALYTICS_ENGINE
 from app.models.sleep_data import SleepData, SleepDataCollection
+from app.models.sleep_aggregates import SleepAggregates
+from app.models.sleep_columns import SleepDataColumns, MISSING
+
+logger = logging.getLogger(__name__)
+
+
+def create_sleep_analytics(sleep_data: SleepDataCollection, settings: Dict[str, Any],
+                           columns: SleepDataColumns = None) -> 'SleepAnalytics':
+    """Create the analytics implementation configured by ANALYTICS_ENGINE."""
+    if ANALYTICS_ENGINE == 'numpy':
+        try:
+            from app.services.numpy_analytics import NumpySleepAnalytics
+        except ImportError:
+            logger.warning("NumPy is not installed; using the pure Python analytics engine")
+        else:
+            return NumpySleepAnalytics(sleep_data, settings, columns)
+    return SleepAnalytics(sleep_data, settings, columns)
+
+
+class SleepSummary(NamedTuple):
+    """Everything the index page shows about the sleep history."""
+    stats: Dict[str, str]
+    goals_progress: Dict[str, Dict[str, int]]
+    chart_data: Dict[str, List]
+    sleep_data_dates: List[str]
 
 
 class SleepAnalytics:
-    """Sleep analytics and statistics service."""
+    """Sleep analytics and statistics service.
     
-    def __init__(self, sleep_data: SleepDataCollection, settings: Dict[str, Any]):
+    Aggregates run over the columnar form of the collection; pass prebuilt
+    columns to avoid converting the collection on every instance.
+    """
+    
+    def __init__(self, sleep_data: SleepDataCollection, settings: Dict[str, Any],
+                 columns: SleepDataColumns = None):
         self.sleep_data = sleep_data
         self.settings = settings
+        self._columns = columns
+    
+    @property
+    def columns(self) -> SleepDataColumns:
+        """Columnar view of the collection, built on first use."""
+        if self._columns is None:
+            self._columns = SleepDataColumns.from_collection(self.sleep_data)
+        return self._columns
     
     def calculate_stats(self) -> Dict[str, str]:
-        """Calculate and return sleep statistics."""
+        """Calculate and return sleep statistics from the collection's running aggregates."""
         stats = {
             'avgSleepTime': '0時間',
             'sleepDebt': '0時間',
@@ -23,142 +64,114 @@ class SleepAnalytics:
             'optimalWakeTime': '07:00'
         }
         
-        if not self.sleep_data.data:
-            return stats
-        
-        total_sleep_hours = 0
-        total_sleep_quality = 0
-        total_sleep_efficiency = 0
-        recorded_days = 0
-        efficiency_recorded_days = 0
-        
-        quality_sleep_hours = []
-        
-        for sleep_item in self.sleep_data.data:
-            if sleep_item.sleep_hours:
-                total_sleep_hours += sleep_item.sleep_hours
-                total_sleep_quality += sleep_item.sleep_quality
-                recorded_days += 1
-                
-                if sleep_item.sleep_quality > 0:
-                    quality_sleep_hours.append((sleep_item.sleep_hours, sleep_item.sleep_quality))
-                
-                if sleep_item.sleep_efficiency:
-                    total_sleep_efficiency += sleep_item.sleep_efficiency
-                    efficiency_recorded_days += 1
+        aggregates = self.sleep_data.aggregates
+        totals = aggregates.state
+        recorded_days = totals['recordedDays']
         
         if recorded_days > 0:
+            total_sleep_hours = totals['totalSleepHours']
             avg_sleep_hours = total_sleep_hours / recorded_days
-            avg_quality = total_sleep_quality / recorded_days
+            avg_quality = totals['totalSleepQuality'] / recorded_days
             sleep_debt = max(0, (self.settings['idealSleepTime'] * recorded_days) - total_sleep_hours)
             
             stats['avgSleepTime'] = f'{avg_sleep_hours:.1f}時間'
             stats['sleepDebt'] = f'{sleep_debt:.1f}時間'
             stats['avgSleepQuality'] = f'{avg_quality:.1f}/5'
             
-            optimal_sleep_data = self._analyze_optimal_sleep_time(quality_sleep_hours)
+            optimal_sleep_data = self._analyze_optimal_sleep_time(aggregates)
             stats.update(optimal_sleep_data)
         
-        if efficiency_recorded_days > 0:
-            avg_efficiency = total_sleep_efficiency / efficiency_recorded_days
+        if totals['efficiencyDays'] > 0:
+            avg_efficiency = totals['totalSleepEfficiency'] / totals['efficiencyDays']
             stats['sleepEfficiency'] = f'{avg_efficiency:.1f}%'
         
         return stats
     
     def calculate_goals_progress(self, goals: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
-        """Calculate progress for each sleep goal."""
+        """Calculate progress for each sleep goal from the collection's histograms."""
         progress = {
             'duration': {'percentage': 0, 'success_count': 0},
             'bedtime': {'percentage': 0, 'success_count': 0},
             'wakeTime': {'percentage': 0, 'success_count': 0}
         }
         
-        if not self.sleep_data.data:
+        totals = self.sleep_data.aggregates.state
+        total_days = totals['count']
+        if not total_days:
             return progress
         
-        for sleep_item in self.sleep_data.data:
-            # Sleep duration goal
-            if sleep_item.sleep_hours >= goals['duration']:
-                progress['duration']['success_count'] += 1
-            
-            # Bedtime goal
-            if sleep_item.bedtime and self._is_time_equal_or_earlier(sleep_item.bedtime, goals['bedtime']):
-                progress['bedtime']['success_count'] += 1
-            
-            # Wake time goal
-            if sleep_item.wake_time and self._is_time_equal_or_earlier(goals['wakeTime'], sleep_item.wake_time):
-                progress['wakeTime']['success_count'] += 1
+        # Each distinct duration / HH:MM label is compared with the goal once
+        progress['duration']['success_count'] = sum(
+            count for hours, count in totals['durations'].items() if float(hours) >= goals['duration']
+        )
+        progress['bedtime']['success_count'] = sum(
+            count for label, count in totals['bedtimes'].items()
+            if self._is_time_equal_or_earlier(label, goals['bedtime'])
+        )
+        progress['wakeTime']['success_count'] = sum(
+            count for label, count in totals['wakeTimes'].items()
+            if self._is_time_equal_or_earlier(goals['wakeTime'], label)
+        )
         
         # Calculate percentages
-        total_days = len(self.sleep_data.data)
         progress['duration']['percentage'] = round((progress['duration']['success_count'] / total_days) * 100)
         progress['bedtime']['percentage'] = round((progress['bedtime']['success_count'] / total_days) * 100)
         progress['wakeTime']['percentage'] = round((progress['wakeTime']['success_count'] / total_days) * 100)
         
         return progress
     
-    def _analyze_optimal_sleep_time(self, quality_sleep_hours: List[Tuple[float, int]]) -> Dict[str, str]:
-        """Analyze sleep data to determine optimal sleep time."""
+    def _analyze_optimal_sleep_time(self, aggregates: SleepAggregates) -> Dict[str, str]:
+        """Determine optimal sleep time from the first-seen buckets of the aggregates."""
         result = {
             'optimalSleepTime': '8.0時間',
             'optimalBedtime': '23:00',
             'optimalWakeTime': '07:00'
         }
         
-        if not quality_sleep_hours:
+        # Sleep duration of the first recorded night with the highest quality
+        best_rated = aggregates.best('bestRated')
+        if best_rated is None:
             return result
-        
-        # Find sleep duration with highest quality
-        best_quality = 0
-        optimal_duration = 8.0
-        
-        for hours, quality in quality_sleep_hours:
-            if quality > best_quality:
-                best_quality = quality
-                optimal_duration = hours
-        
-        # Find the most common bedtime and wake time for high quality sleep
-        high_quality_days = []
-        quality_threshold = 3
-        
-        for sleep_item in self.sleep_data.data:
-            if (sleep_item.sleep_quality >= quality_threshold and 
-                sleep_item.bedtime and sleep_item.wake_time):
-                high_quality_days.append(sleep_item)
-        
-        # Find most common bedtime and wake time in high quality days
-        bedtimes = {}
-        wake_times = {}
-        
-        for sleep_item in high_quality_days:
-            bedtimes[sleep_item.bedtime] = bedtimes.get(sleep_item.bedtime, 0) + 1
-            wake_times[sleep_item.wake_time] = wake_times.get(sleep_item.wake_time, 0) + 1
-        
-        # Get most common times
-        optimal_bedtime = max(bedtimes.items(), key=lambda x: x[1])[0] if bedtimes else '23:00'
-        optimal_wake_time = max(wake_times.items(), key=lambda x: x[1])[0] if wake_times else '07:00'
-        
-        # If no high quality days, use the day with highest quality
-        if not high_quality_days and quality_sleep_hours:
-            best_day = None
-            best_quality = 0
-            
-            for sleep_item in self.sleep_data.data:
-                if (sleep_item.sleep_quality > best_quality and 
-                    sleep_item.bedtime and sleep_item.wake_time):
-                    best_quality = sleep_item.sleep_quality
-                    best_day = sleep_item
-            
-            if best_day:
-                optimal_bedtime = best_day.bedtime
-                optimal_wake_time = best_day.wake_time
-        
-        result['optimalSleepTime'] = f'{optimal_duration:.1f}時間'
-        result['optimalBedtime'] = optimal_bedtime
-        result['optimalWakeTime'] = optimal_wake_time
+        result['optimalSleepTime'] = f'{best_rated[2]:.1f}時間'
+        
+        # Most common bedtime and wake time for high quality sleep
+        optimal_bedtime = aggregates.mode('highQualityBedtimes')
+        if optimal_bedtime is not None:
+            result['optimalBedtime'] = optimal_bedtime
+            result['optimalWakeTime'] = aggregates.mode('highQualityWakeTimes')
+        else:
+            # If no high quality days, use the day with highest quality
+            best_timed = aggregates.best('bestTimed')
+            if best_timed is not None:
+                result['optimalBedtime'], result['optimalWakeTime'] = best_timed[2:]
         
         return result
     
+    def summarize(self, goals: Dict[str, Any]) -> SleepSummary:
+        """Compute stats, goal progress, optimal times, chart series and calendar dates together.
+        
+        Stats and goal progress are read from the running aggregates, chart
+        series are gathered through the collection's day index instead of
+        sorting, and calendar dates take one pass over the records.
+        """
+        return SleepSummary(
+            self.calculate_stats(),
+            self.calculate_goals_progress(goals),
+            self._chart_data_from_index(),
+            self.sleep_data.get_all_dates()
+        )
+    
+    def _chart_data_from_index(self) -> Dict[str, List]:
+        """Gather chart series in day order using the collection's day index."""
+        # Read from the records rather than the float columns so integer hours stay integers in JSON
+        records = self.sleep_data.data
+        ordered = [records[position] for position in self.sleep_data.day_order_positions()]
+        return {
+            'labels': [f"Day {item.day}" for item in ordered],
+            'sleepHours': [item.sleep_hours for item in ordered],
+            'sleepQuality': [item.sleep_quality for item in ordered]
+        }
+    
     def _is_time_equal_or_earlier(self, time1: str, time2: str) -> bool:
         """Compare times (HH:MM format)."""
         try:
@@ -178,8 +191,8 @@ class SleepAnalytics:
         if not self.sleep_data.data:
             return {'labels': [], 'sleepHours': [], 'sleepQuality': []}
         
-        # Sort data by day
-        sorted_data = sorted(self.sleep_data.data, key=lambda x: x.day)
+        # Day order is maintained by the collection's index
+        sorted_data = self.sleep_data.sorted_by_day()
         
         labels = [f"Day {item.day}" for item in sorted_data]
         sleep_hours = [item.sleep_hours for item in sorted_data]
@@ -198,25 +211,26 @@ class SleepAnalytics:
         weekday_quality = []
         weekend_quality = []
         
-        for sleep_item in self.sleep_data.data:
-            if sleep_item.date:
-                try:
-                    date = datetime.datetime.fromisoformat(sleep_item.date)
-                    is_weekend = date.weekday() >= 5
-                    
-                    if sleep_item.sleep_hours:
-                        if is_weekend:
-                            weekend_hours.append(sleep_item.sleep_hours)
-                        else:
-                            weekday_hours.append(sleep_item.sleep_hours)
-                    
-                    if sleep_item.sleep_quality:
-                        if is_weekend:
-                            weekend_quality.append(sleep_item.sleep_quality)
-                        else:
-                            weekday_quality.append(sleep_item.sleep_quality)
-                except (ValueError, TypeError):
-                    continue
+        columns = self.columns
+        for date_ordinal, sleep_hours, sleep_quality in zip(
+                columns.date_ordinal, columns.sleep_hours, columns.quality):
+            if date_ordinal == MISSING:
+                continue
+            
+            # Ordinal 1 (0001-01-01) is a Monday
+            is_weekend = (date_ordinal - 1) % 7 >= 5
+            
+            if sleep_hours:
+                if is_weekend:
+                    weekend_hours.append(sleep_hours)
+                else:
+                    weekday_hours.append(sleep_hours)
+            
+            if sleep_quality:
+                if is_weekend:
+                    weekend_quality.append(sleep_quality)
+                else:
+                    weekday_quality.append(sleep_quality)
         
         avg_weekday_hours = sum(weekday_hours) / len(weekday_hours) if weekday_hours else 0
         avg_weekend_hours = sum(weekend_hours) / len(weekend_hours) if weekend_hours else 0
@@ -231,6 +245,100 @@ class SleepAnalytics:
             'difference': round(avg_weekend_hours - avg_weekday_hours, 1)
         }
     
+    def calculate_trends(self, windows: Sequence[int] = (7, 30, 90), days: int = 365) -> Dict[str, Any]:
+        """Calculate moving averages and sleep debt per calendar day over the last days.
+        
+        Records are bucketed by calendar date and turned into prefix sums, so
+        every point of every window is one subtraction; the whole series is
+        one pass over the records plus one over the calendar days. Days with
+        no nights in a window give None for that window's averages.
+        """
+        ideal_sleep = self.settings['idealSleepTime']
+        series_names = ('sleepHours', 'sleepQuality', 'sleepEfficiency', 'sleepDebt')
+        trends = {
+            'dates': [],
+            'windows': {str(window): {name: [] for name in series_names} for window in windows},
+            'cumulativeSleepDebt': []
+        }
+        
+        columns = self.columns
+        dated = [ordinal for ordinal in columns.date_ordinal if ordinal != MISSING]
+        if not dated or not windows:
+            return trends
+        
+        last = max(dated)
+        first_shown = max(min(dated), last - days + 1)
+        # Earliest calendar day the widest window reaches back to
+        origin = first_shown - max(windows) + 1
+        size = last - origin + 1
+        
+        hours = [0.0] * size
+        hours_nights = [0] * size
+        quality = [0.0] * size
+        quality_nights = [0] * size
+        efficiency = [0.0] * size
+        efficiency_nights = [0] * size
+        # Nights before origin only count towards the cumulative sleep debt
+        earlier_hours = 0
+        earlier_nights = 0
+        
+        for ordinal, sleep_hours, sleep_quality, sleep_efficiency in zip(
+                columns.date_ordinal, columns.sleep_hours, columns.quality, columns.efficiency):
+            if ordinal == MISSING:
+                continue
+            
+            i = ordinal - origin
+            if i < 0:
+                if sleep_hours:
+                    earlier_hours += sleep_hours
+                    earlier_nights += 1
+                continue
+            
+            if sleep_hours:
+                hours[i] += sleep_hours
+                hours_nights[i] += 1
+            if sleep_quality:
+                quality[i] += sleep_quality
+                quality_nights[i] += 1
+            if sleep_efficiency:
+                efficiency[i] += sleep_efficiency
+                efficiency_nights[i] += 1
+        
+        prefix = {
+            name: list(accumulate(values, initial=0))
+            for name, values in (('hours', hours), ('hoursNights', hours_nights),
+                                 ('quality', quality), ('qualityNights', quality_nights),
+                                 ('efficiency', efficiency), ('efficiencyNights', efficiency_nights))
+        }
+        
+        def window_sum(name: str, end: int, window: int) -> float:
+            return prefix[name][end] - prefix[name][end - window]
+        
+        for ordinal in range(first_shown, last + 1):
+            end = ordinal - origin + 1
+            trends['dates'].append(datetime.date.fromordinal(ordinal).isoformat())
+            
+            total_hours = earlier_hours + prefix['hours'][end]
+            total_nights = earlier_nights + prefix['hoursNights'][end]
+            trends['cumulativeSleepDebt'].append(round(max(0, ideal_sleep * total_nights - total_hours), 1))
+            
+            for window in windows:
+                series = trends['windows'][str(window)]
+                nights = window_sum('hoursNights', end, window)
+                window_hours = window_sum('hours', end, window)
+                series['sleepHours'].append(self._window_average(window_hours, nights))
+                series['sleepQuality'].append(self._window_average(
+                    window_sum('quality', end, window), window_sum('qualityNights', end, window)))
+                series['sleepEfficiency'].append(self._window_average(
+                    window_sum('efficiency', end, window), window_sum('efficiencyNights', end, window)))
+                series['sleepDebt'].append(round(max(0, ideal_sleep * nights - window_hours), 1))
+        
+        return trends
+    
+    @staticmethod
+    def _window_average(total: float, count: int) -> Optional[float]:
+        return round(total / count, 1) if count else None
+    
     def generate_recommendations(self) -> List[Dict[str, str]]:
         """Generate personalized sleep recommendations."""
         recommendations = []
@@ -0,0 +1,213 @@
+"""SQLite storage backend for sleep and Sleepen data."""
+import copy
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from sync import SleepDataSync
+from sleepen import SleepenManager
+from app.services.concurrency import check_version, load_stamps
+from app.services.data_cache import document_cache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sleep_records (
+    position INTEGER PRIMARY KEY,
+    day INTEGER NOT NULL,
+    date TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sleep_records_day ON sleep_records (day, position);
+CREATE INDEX IF NOT EXISTS idx_sleep_records_date ON sleep_records (date, position);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+"""
+
+# Statements are kept as module constants so sqlite3's per-connection
+# statement cache reuses the prepared form on every call.
+SELECT_RECORDS = 'SELECT record FROM sleep_records ORDER BY position'
+SELECT_BY_DAY = 'SELECT record FROM sleep_records WHERE day = ? ORDER BY position LIMIT 1'
+SELECT_BY_DATE_PREFIX = ('SELECT record FROM sleep_records WHERE date >= ? AND date < ? '
+                         'ORDER BY position LIMIT 1')
+SELECT_DATES = 'SELECT date FROM sleep_records WHERE date IS NOT NULL ORDER BY position'
+UPSERT_RECORD = 'INSERT OR REPLACE INTO sleep_records (position, day, date, record) VALUES (?, ?, ?, ?)'
+SELECT_STATE = 'SELECT key, value FROM state'
+SELECT_STATE_VALUE = 'SELECT value FROM state WHERE key = ?'
+UPSERT_STATE = 'INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)'
+SELECT_DOCUMENT = 'SELECT body FROM documents WHERE name = ?'
+SELECT_DOCUMENT_VERSION = "SELECT json_extract(body, '$.version') FROM documents WHERE name = ?"
+UPSERT_DOCUMENT = 'INSERT OR REPLACE INTO documents (name, body) VALUES (?, ?)'
+
+# Keys after the last code point so 'YYYY-MM-DD' + _PREFIX_END bounds a prefix range
+_PREFIX_END = '\U0010ffff'
+
+
+class SQLiteDatabase:
+    """Thread-local connections to one SQLite database in WAL mode."""
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def companions(self) -> tuple:
+        """Files whose signature changes on every committed write."""
+        return (self.db_file + '-wal',)
+
+
+_databases: Dict[str, SQLiteDatabase] = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(db_file: str) -> SQLiteDatabase:
+    """Return the shared SQLiteDatabase for db_file."""
+    with _databases_lock:
+        if db_file not in _databases:
+            _databases[db_file] = SQLiteDatabase(db_file)
+        return _databases[db_file]
+
+
+class SQLiteSleepStorage(SleepDataSync):
+    """Sleep data storage backed by SQLite with indexed day/date lookups.
+
+    Records keep their list position as the primary key so whole-document
+    loads and "first match" lookups behave exactly like the JSON backend.
+    """
+
+    indexed = True
+
+    def __init__(self, db_file: str):
+        super().__init__(db_file)
+        self.journal_file = None
+        self.db = get_database(db_file)
+
+    def load_data(self) -> Dict[str, Any]:
+        """Load the full document, reusing the cached one while the database is unchanged."""
+        return load_stamps.stamp(self.data_file,
+                                 document_cache.get(self.data_file, self._read_data, self.db.companions()))
+
+    def _read_data(self) -> Dict[str, Any]:
+        conn = self.db.connection()
+        data = copy.deepcopy(self.default_data)
+        for key, value in conn.execute(SELECT_STATE):
+            data[key] = json.loads(value)
+        data['sleepData'] = [json.loads(row[0]) for row in conn.execute(SELECT_RECORDS)]
+        return data
+
+    def save_data(self, data: Dict[str, Any]) -> None:
+        """Replace all records and state in one transaction."""
+        with self._write_transaction(data) as conn:
+            conn.execute('DELETE FROM sleep_records')
+            conn.executemany(UPSERT_RECORD, (
+                self._record_row(index, record)
+                for index, record in enumerate(data.get('sleepData', []))
+            ))
+            self._write_state(conn, data)
+        document_cache.store(self.data_file, data, companions=self.db.companions())
+    
+    def append_record(self, data: Dict[str, Any], index: int, record: Dict[str, Any]) -> None:
+        """Insert or replace the record at its position, together with the running aggregates."""
+        with self._write_transaction(data) as conn:
+            conn.execute(UPSERT_RECORD, self._record_row(index, record))
+            if 'aggregates' in data:
+                conn.execute(UPSERT_STATE, ('aggregates', json.dumps(data['aggregates'], ensure_ascii=False)))
+        document_cache.store(self.data_file, data, companions=self.db.companions())
+    
+    def append_state(self, data: Dict[str, Any]) -> None:
+        """Persist current day and settings."""
+        with self._write_transaction(data) as conn:
+            self._write_state(conn, data)
+        document_cache.store(self.data_file, data, companions=self.db.companions())
+    
+    @contextmanager
+    def _write_transaction(self, data: Dict[str, Any]) -> Iterator[sqlite3.Connection]:
+        """Open a write transaction after checking the stored version, then bump it.
+        
+        BEGIN IMMEDIATE takes SQLite's write lock up front, so the version
+        check and the writes are atomic across processes.
+        """
+        conn = self.db.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(SELECT_STATE_VALUE, ('version',)).fetchone()
+            check_version(self.data_file, load_stamps.expected(self.data_file, data),
+                          json.loads(row[0]) if row else 0)
+            conn.execute(UPSERT_STATE, ('version', json.dumps(self.bump_version(data))))
+            load_stamps.stamp(self.data_file, data)
+            yield conn
+    
+    def find_by_day(self, day: int) -> Optional[Dict[str, Any]]:
+        """Return the first record for day using the day index."""
+        row = self.db.connection().execute(SELECT_BY_DAY, (day,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def find_by_date(self, date_str: str) -> Optional[Dict[str, Any]]:
+        """Return the first record whose date starts with date_str using the date index."""
+        row = self.db.connection().execute(
+            SELECT_BY_DATE_PREFIX, (date_str, date_str + _PREFIX_END)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_all_dates(self) -> List[str]:
+        """Return the date part of every record's date."""
+        return [row[0].split('T')[0] for row in self.db.connection().execute(SELECT_DATES)]
+
+    @staticmethod
+    def _record_row(index: int, record: Dict[str, Any]) -> tuple:
+        return (index, record.get('day', 1), record.get('date'),
+                json.dumps(record, ensure_ascii=False))
+
+    @staticmethod
+    def _write_state(conn: sqlite3.Connection, data: Dict[str, Any]) -> None:
+        for key, value in data.items():
+            if key != 'sleepData':
+                conn.execute(UPSERT_STATE, (key, json.dumps(value, ensure_ascii=False)))
+
+
+class SQLiteSleepenManager(SleepenManager):
+    """SleepenManager that keeps its document in the SQLite documents table."""
+
+    document_name = 'sleepen'
+
+    def __init__(self, db_file: str):
+        super().__init__(db_file)
+        self.db = get_database(db_file)
+
+    def load_data(self):
+        """Load Sleepen data from the database"""
+        row = self.db.connection().execute(SELECT_DOCUMENT, (self.document_name,)).fetchone()
+        if row is None:
+            return self.default_data
+        return self._hydrate(json.loads(row[0]))
+
+    def save_data(self, data):
+        """Save Sleepen data to the database if it is still at the version it was loaded with"""
+        conn = self.db.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(SELECT_DOCUMENT_VERSION, (self.document_name,)).fetchone()
+            check_version(self.data_file, data.get('version', 0), (row[0] or 0) if row else 0)
+            self._archive_adventures(data)
+            self.bump_version(data)
+            conn.execute(UPSERT_DOCUMENT, (
+                self.document_name, json.dumps(self._serialize(data), ensure_ascii=False)
+            ))
+
+    def save_events(self, data, before, events):
+        """Save the whole document; the database keeps no separate event log"""
+        self.save_data(data)
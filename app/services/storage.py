@@ -0,0 +1,24 @@
+"""Storage backend selection."""
+from config.settings import (DATA_FILE, SLEEPEN_DATA_FILE, STORAGE_BACKEND,
+                             SQLITE_DB_FILE, JOURNAL_COMPACT_THRESHOLD, DURABILITY_MODE,
+                             SLEEPEN_SNAPSHOT_EVERY, SLEEPEN_HOT_ADVENTURES)
+from sync import SleepDataSync
+from sleepen import SleepenManager
+
+
+def create_sleep_storage() -> SleepDataSync:
+    """Create the sleep data store configured by STORAGE_BACKEND."""
+    if STORAGE_BACKEND == 'sqlite':
+        from app.services.sqlite_storage import SQLiteSleepStorage
+        return SQLiteSleepStorage(SQLITE_DB_FILE)
+    return SleepDataSync(DATA_FILE, compact_threshold=JOURNAL_COMPACT_THRESHOLD,
+                         durability=DURABILITY_MODE)
+
+
+def create_sleepen_manager() -> SleepenManager:
+    """Create the Sleepen manager configured by STORAGE_BACKEND."""
+    if STORAGE_BACKEND == 'sqlite':
+        from app.services.sqlite_storage import SQLiteSleepenManager
+        return SQLiteSleepenManager(SQLITE_DB_FILE)
+    return SleepenManager(SLEEPEN_DATA_FILE, durability=DURABILITY_MODE,
+                          snapshot_every=SLEEPEN_SNAPSHOT_EVERY, hot_adventures=SLEEPEN_HOT_ADVENTURES)
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""Persistent queue that merges /api/sync uploads in the background."""
+import datetime
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+from app.services.concurrency import atomic_write_json, file_locks, file_mode_for
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class SyncJobQueue:
+    """Queue of sync uploads kept as one JSON file per job.
+
+    ``submit`` stores the upload and returns at once. Every ``interval``
+    seconds a background thread takes all queued jobs, merges them with one
+    call to ``process`` (one write for uploads from many devices) and
+    records each job's result, falling back to one job at a time if the
+    batch fails. Job ids are derived from the client's idempotency key, so a
+    retried upload maps to the job that already exists instead of being
+    merged again; an upload without a key always gets a new job, since equal
+    bodies from different devices are not the same upload. Jobs survive
+    restarts and finished ones are pruned after ``retention`` seconds. Only
+    one process at a time works through the queue.
+    """
+
+    def __init__(self, directory: str, process: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+                 interval: float = 1.0, retention: float = 24 * 60 * 60):
+        self.directory = directory
+        self.process = process
+        self.interval = interval
+        self.retention = retention
+        self._thread: Optional[threading.Thread] = None
+        self._guard = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, payload: Dict[str, Any], key: str = None) -> Dict[str, Any]:
+        """Queue payload unless a job with the same idempotency key exists; return the job.
+        
+        Without a key the upload is always queued as a new job.
+        """
+        if key:
+            job_id = hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+        else:
+            job_id = uuid.uuid4().hex[:20]
+        job = {
+            'id': job_id,
+            'status': QUEUED,
+            'createdAt': datetime.datetime.now().isoformat(),
+            'payload': payload
+        }
+        if self._create(job):
+            logger.info(f"Queued sync job {job_id}")
+        else:
+            job = self.get(job_id) or job
+            logger.info(f"Sync job {job_id} already exists ({job['status']}); not queued again")
+        self._ensure_worker()
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the stored job, or None if there is no such job."""
+        if not job_id.isalnum():
+            return None
+        self._ensure_worker()
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def run_once(self) -> int:
+        """Process every queued job now; returns how many were processed."""
+        with file_locks.exclusive(os.path.join(self.directory, 'worker')):
+            jobs = [job for job in self._jobs() if job['status'] == QUEUED]
+            jobs.sort(key=lambda job: job['createdAt'])
+            if jobs:
+                try:
+                    results = self.process([job['payload'] for job in jobs])
+                    for job, result in zip(jobs, results):
+                        self._finish(job, DONE, result=result)
+                except Exception as e:
+                    logger.warning(f"Batch of {len(jobs)} sync jobs failed ({e}); retrying one by one")
+                    for job in jobs:
+                        self._run_single(job)
+            self._prune()
+            return len(jobs)
+
+    def _run_single(self, job: Dict[str, Any]) -> None:
+        try:
+            result = self.process([job['payload']])[0]
+        except Exception as e:
+            logger.error(f"Sync job {job['id']} failed: {e}")
+            self._finish(job, FAILED, error=str(e))
+        else:
+            self._finish(job, DONE, result=result)
+
+    def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: str = None) -> None:
+        job['status'] = status
+        job['finishedAt'] = datetime.datetime.now().isoformat()
+        if result is not None:
+            job['result'] = result
+        if error is not None:
+            job['error'] = error
+        atomic_write_json(self._path(job['id']), job)
+
+    def _create(self, job: Dict[str, Any]) -> bool:
+        """Write a new job file; False if one with this id already exists."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            os.chmod(tmp_path, file_mode_for(self._path(job['id'])))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            # link() never replaces an existing file, so concurrent duplicates can't both win
+            os.link(tmp_path, self._path(job['id']))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+
+    def _jobs(self) -> List[Dict[str, Any]]:
+        jobs = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    jobs.append(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                logger.warning(f"Skipping unreadable sync job file {path}")
+        return jobs
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        finished = json.load(f)['status'] != QUEUED
+                    if finished:
+                        os.remove(path)
+            except (OSError, ValueError, KeyError):
+                continue
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _ensure_worker(self) -> None:
+        with self._guard:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sync-queue-worker', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Sync queue worker error: {e}")
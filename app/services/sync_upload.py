@@ -0,0 +1,103 @@
+"""Streaming readers for /api/sync request bodies (JSON or NDJSON, optionally gzip)."""
+import gzip
+import io
+import json
+import zlib
+from typing import Any, BinaryIO, Dict
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl')
+# Top-level fields an NDJSON line without a ``day`` may set
+NDJSON_STATE_KEYS = frozenset({'syncToken', 'currentDay', 'settings'})
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds a size limit."""
+
+
+class _LimitedReader(io.RawIOBase):
+    """Binary stream wrapper that fails once more than limit bytes were read."""
+
+    def __init__(self, stream: BinaryIO, limit: int, what: str):
+        self._stream = stream
+        self._limit = limit
+        self._what = what
+        self.count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._stream.read(len(buffer))
+        self.count += len(chunk)
+        if self.count > self._limit:
+            raise UploadTooLarge(f"{self._what} exceeds {self._limit} bytes")
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def open_upload(stream: BinaryIO, content_encoding: str, max_body_bytes: int,
+                max_decoded_bytes: int) -> BinaryIO:
+    """Wrap a request body stream, decoding gzip and enforcing both size limits as it is read.
+
+    max_body_bytes bounds the bytes on the wire; max_decoded_bytes bounds
+    them after decompression, so a small gzip bomb can't expand unchecked.
+    """
+    body = _LimitedReader(stream, max_body_bytes, 'Request body')
+    encoding = (content_encoding or '').strip().lower()
+    if encoding in ('', 'identity'):
+        return io.BufferedReader(body)
+    if encoding in ('gzip', 'x-gzip'):
+        decoded = gzip.GzipFile(fileobj=io.BufferedReader(body), mode='rb')
+        return io.BufferedReader(_LimitedReader(decoded, max_decoded_bytes, 'Decompressed body'))
+    raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+
+
+def read_json_upload(upload: BinaryIO) -> Dict[str, Any]:
+    """Parse a single JSON document upload."""
+    try:
+        data = json.load(upload)
+    except (gzip.BadGzipFile, zlib.error, EOFError) as e:
+        raise ValueError(f"Invalid gzip body: {e}")
+    if not isinstance(data, dict):
+        raise ValueError('Sync body must be a JSON object')
+    return data
+
+
+def read_ndjson_upload(upload: BinaryIO) -> Dict[str, Any]:
+    """Parse an NDJSON upload one line at a time into the shape of a JSON sync body.
+
+    Every line is a JSON object. Lines with a ``day`` are sleep records;
+    any other line sets top-level fields and may only hold the keys in
+    NDJSON_STATE_KEYS (a ``sleepData`` key, for one, raises ValueError).
+    Records are kept per day as they arrive, the last line for a day
+    winning at the position of the first just as in a JSON body. Only the
+    reading is streamed: the raw text and duplicate records are never held
+    in memory, but every parsed record is, until the whole upload has been
+    read and is merged in one go.
+    """
+    records: Dict[Any, Dict[str, Any]] = {}
+    data: Dict[str, Any] = {}
+    # One copy of each key string for all records; json.loads only shares
+    # keys within a single document, i.e. a single line
+    keys: Dict[str, str] = {}
+    try:
+        for number, line in enumerate(io.TextIOWrapper(upload, encoding='utf-8'), 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON on line {number}: {e.msg}")
+            if not isinstance(item, dict):
+                raise ValueError(f"Line {number} is not a JSON object")
+            if 'day' in item:
+                records[item['day']] = {keys.setdefault(key, key): value for key, value in item.items()}
+            else:
+                unknown = sorted(set(item) - NDJSON_STATE_KEYS)
+                if unknown:
+                    raise ValueError(f"Line {number} has unsupported fields: {', '.join(unknown)}")
+                data.update(item)
+    except (gzip.BadGzipFile, zlib.error, EOFError) as e:
+        raise ValueError(f"Invalid gzip body: {e}")
+    data['sleepData'] = list(records.values())
+    return data
@@ -0,0 +1,97 @@
+"""Write-behind queue that coalesces document saves into periodic background writes."""
+import atexit
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config.settings import WRITE_BEHIND_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Durability modes for the JSON stores
+SYNC = 'sync'
+WRITE_BEHIND = 'write_behind'
+
+
+class WriteBehindQueue:
+    """Hold the latest unsaved version of each document and write it from one thread.
+
+    Stores hand over a document together with the function that persists it.
+    Saves scheduled between two ticks of the flusher collapse into a single
+    write of the newest document. A document stays visible through
+    ``pending`` until it has been written, so readers in this process never
+    fall back to the older file in between. Failed writes are kept and
+    retried on the next tick; ``flush`` runs once more at interpreter exit.
+
+    Write-behind assumes this process is the only writer of the files it
+    buffers: pending documents win over changes other processes make to them.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        # path -> (document, write function, generation)
+        self._pending: Dict[str, Tuple[Any, Callable[[Any], None], int]] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.scheduled = 0
+        self.writes = 0
+        self.failures = 0
+        atexit.register(self.flush)
+
+    def schedule(self, path: str, document: Any, write: Callable[[Any], None]) -> None:
+        """Queue document to be written to path by write(document) on the next tick."""
+        with self._lock:
+            self._generation += 1
+            self._pending[path] = (document, write, self._generation)
+            self.scheduled += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind-flusher', daemon=True)
+                self._thread.start()
+
+    def pending(self, path: str) -> Any:
+        """Return the unsaved document for path, or None if everything is written."""
+        with self._lock:
+            entry = self._pending.get(path)
+            return entry[0] if entry is not None else None
+
+    def flush(self, path: str = None) -> None:
+        """Write the pending document for path, or every pending document, now."""
+        with self._flush_lock:
+            with self._lock:
+                paths: List[str] = [path] if path is not None else list(self._pending)
+                entries = [(p, self._pending[p]) for p in paths if p in self._pending]
+
+            for pending_path, (document, write, generation) in entries:
+                try:
+                    write(document)
+                except Exception as e:
+                    # Keep it queued; the next tick tries again
+                    self.failures += 1
+                    logger.error(f"Write-behind flush of {pending_path} failed: {e}")
+                    continue
+                self.writes += 1
+                with self._lock:
+                    # A save that arrived during the write needs another one
+                    current = self._pending.get(pending_path)
+                    if current is not None and current[2] == generation:
+                        del self._pending[pending_path]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return scheduled/written counters for monitoring."""
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'scheduled': self.scheduled,
+                'writes': self.writes,
+                'failures': self.failures
+            }
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+
+write_behind = WriteBehindQueue(WRITE_BEHIND_INTERVAL)
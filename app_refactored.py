@@ -2,16 +2,16 @@
 import datetime
 import json
 import logging
-from flask import Flask, render_template, send_from_directory
+from flask import Flask, jsonify, render_template, send_from_directory
 
 # Import services and routes
 from app.services.data_service import DataService
-from app.services.sleep_analytics import SleepAnalytics
+from app.services.sleep_analytics import create_sleep_analytics
 from app.services.content_service import ContentService
 from app.routes.sleep_routes import sleep_bp
 from app.routes.sleepen_routes import sleepen_bp
-from sleepen import SleepenManager
-from config.settings import SLEEPEN_DATA_FILE
+from app.services.concurrency import ConcurrentModificationError
+from app.services.storage import create_sleepen_manager
 
 # Configure logging
 logging.basicConfig(
@@ -31,6 +31,16 @@ app.register_blueprint(sleep_bp)
 app.register_blueprint(sleepen_bp)
 
 
+@app.errorhandler(ConcurrentModificationError)
+def concurrent_modification(error):
+    """Report a save that kept losing the race to other workers."""
+    logger.warning(f"Giving up after repeated concurrent modifications: {error}")
+    return jsonify({
+        'success': False,
+        'message': '他の操作と同時に更新されました。もう一度お試しください。'
+    }), 409
+
+
 @app.route('/manifest.json')
 def manifest():
     return send_from_directory('.', 'manifest.json')
@@ -53,14 +63,20 @@ def index():
     data = data_service.load_data()
     
     sleep_data_raw = data['sleepData']
-    settings = data_service.initialize_settings(data['settings'])
+    # Fill defaults on a copy; the loaded document is shared with other requests
+    settings = data_service.initialize_settings(dict(data['settings']))
     
     # Always recalculate current day based on start date
     calculated_day = data_service.calculate_current_day(settings['startDate'])
     if calculated_day != data['currentDay']:
-        data['currentDay'] = calculated_day
-        data['settings'] = settings
-        data_service.save_data(data)
+        def set_current_day(latest):
+            latest['currentDay'] = calculated_day
+            latest['settings'] = data_service.initialize_settings(latest['settings'])
+            data_service.save_state(latest)
+            return latest
+        
+        data = data_service.update(set_current_day)
+        settings = data['settings']
     
     current_day = data['currentDay']
     
@@ -76,19 +92,14 @@ def index():
     if not today_data:
         today_data = sleep_collection.find_by_day(current_day)
     
-    # Calculate stats using analytics service
-    analytics = SleepAnalytics(sleep_collection, settings)
-    stats = analytics.calculate_stats()
-    
-    # Calculate goals progress
-    goals_progress = analytics.calculate_goals_progress(settings['sleepGoals'])
+    # Stats, goal progress, chart series and calendar dates in one pass
+    analytics = create_sleep_analytics(sleep_collection, settings, data_service.get_sleep_columns(data))
+    summary = data_service.memoize(data, 'summary', lambda: analytics.summarize(settings['sleepGoals']))
+    stats = summary.stats
     
     # Get daily tip and challenge
     daily_content = ContentService.get_daily_tip_and_challenge(current_day)
     
-    # Get chart data
-    chart_data = analytics.get_chart_data()
-    
     # Format current date
     current_date = today.strftime('%Y年%m月%d日(%a)')
     
@@ -96,17 +107,14 @@ def index():
     progress_percentage = ((current_day - 1) % 30) / 30 * 100
     
     # Get Sleepen data
-    sleepen_manager = SleepenManager(SLEEPEN_DATA_FILE)
+    sleepen_manager = create_sleepen_manager()
     sleepen = sleepen_manager.get_sleepen()
     
     # Calculate Sleepen progress percentages
     sleepen_exp_percentage = (sleepen.exp / (sleepen.level * 100)) * 100 if sleepen.level > 0 else 0
     
     # Get recent adventures
-    recent_adventures = sleepen.adventures[-3:] if sleepen.adventures else []
-    
-    # Get all dates with sleep data for the calendar
-    sleep_data_dates = sleep_collection.get_all_dates()
+    recent_adventures = sleepen.render_adventures(sleepen.adventures[-3:])
     
     return render_template('index_tabbed.html',
                            current_day=current_day,
@@ -115,14 +123,14 @@ def index():
                            today_iso_date=today_iso_date,
                            stats=stats,
                            goals=settings['sleepGoals'],
-                           goals_progress=goals_progress,
+                           goals_progress=summary.goals_progress,
                            today_data=today_data.to_dict() if today_data else None,
                            daily_tip=daily_content['tip'],
                            daily_challenge=daily_content['challenge'],
                            settings=settings,
-                           chart_data=json.dumps(chart_data),
+                           chart_data=json.dumps(summary.chart_data),
                            sleep_data=sleep_data_raw,
-                           sleep_data_dates=json.dumps(sleep_data_dates),
+                           sleep_data_dates=json.dumps(summary.sleep_data_dates),
                            optimal_sleep_time=stats.get('optimalSleepTime', '8.0時間'),
                            optimal_bedtime=stats.get('optimalBedtime', '23:00'),
                            optimal_wake_time=stats.get('optimalWakeTime', '07:00'),
@@ -0,0 +1,85 @@
+"""Benchmark the pure Python and NumPy analytics engines.
+
+Usage (from the project root):
+    python -m benchmarks.bench_analytics [--sizes 1000 10000 100000]
+"""
+import argparse
+import datetime
+import json
+import random
+import time
+from app.models.sleep_data import SleepDataCollection
+from app.models.sleep_columns import SleepDataColumns
+from app.services.sleep_analytics import SleepAnalytics
+from app.services.numpy_analytics import NumpySleepAnalytics
+
+SETTINGS = {'idealSleepTime': 8}
+
+
+def synthetic_records(count: int, seed: int = 0) -> list:
+    """Generate count nights of plausible sleep records."""
+    rng = random.Random(seed)
+    start = datetime.date(2000, 1, 1)
+    records = []
+    for day in range(1, count + 1):
+        bedtime = f'{rng.choice([21, 22, 23, 0, 1]):02d}:{rng.choice([0, 15, 30, 45]):02d}'
+        wake_time = f'{rng.choice([5, 6, 7, 8]):02d}:{rng.choice([0, 15, 30, 45]):02d}'
+        records.append({
+            'day': day,
+            'date': (start + datetime.timedelta(days=day)).isoformat() + 'T00:00:00',
+            'bedInTime': bedtime,
+            'bedOutTime': wake_time,
+            'bedtime': bedtime,
+            'wakeTime': wake_time,
+            'sleepQuality': rng.randint(1, 5)
+        })
+    return records
+
+
+def run_engine(engine_class, collection, columns) -> dict:
+    """Compute the outputs each engine computes its own way.
+
+    Stats and goal progress come from the running aggregates in both
+    engines, so they are not timed here.
+    """
+    analytics = engine_class(collection, SETTINGS, columns)
+    return {
+        'weekdayVsWeekend': analytics.analyze_weekday_vs_weekend(),
+        'recommendations': analytics.generate_recommendations()
+    }
+
+
+def best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'columns ms':>11} {'python ms':>10} {'numpy ms':>9} {'speedup':>8}")
+    for size in args.sizes:
+        collection = SleepDataCollection(synthetic_records(size))
+        build = best_of(lambda: SleepDataColumns.from_collection(collection), 1)
+        columns = SleepDataColumns.from_collection(collection)
+
+        python_result = run_engine(SleepAnalytics, collection, columns)
+        numpy_result = run_engine(NumpySleepAnalytics, collection, columns)
+        if json.dumps(python_result, sort_keys=True) != json.dumps(numpy_result, sort_keys=True):
+            raise SystemExit(f'Engines disagree at {size} records')
+
+        python_time = best_of(lambda: run_engine(SleepAnalytics, collection, columns), args.repeat)
+        numpy_time = best_of(lambda: run_engine(NumpySleepAnalytics, collection, columns), args.repeat)
+        print(f'{size:>8} {build * 1000:>11.1f} {python_time * 1000:>10.2f} '
+              f'{numpy_time * 1000:>9.2f} {python_time / numpy_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
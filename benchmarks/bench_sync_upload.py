@@ -0,0 +1,104 @@
+"""Benchmark /api/sync uploads: JSON vs NDJSON bodies, plain vs gzip.
+
+Each upload runs in a fresh process against a throwaway data file, which
+reports the request latency and how far the request raised peak RSS.
+
+Usage (from the project root):
+    python -m benchmarks.bench_sync_upload [--sizes 1000 10000 50000]
+"""
+import argparse
+import gc
+import gzip
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.bench_analytics import synthetic_records
+
+FORMATS = {
+    'json': ('application/json', None),
+    'json+gzip': ('application/json', 'gzip'),
+    'ndjson': ('application/x-ndjson', None),
+    'ndjson+gzip': ('application/x-ndjson', 'gzip'),
+}
+
+
+def build_body(records: list, fmt: str) -> bytes:
+    """Encode a sync upload of records in the given format."""
+    content_type, encoding = FORMATS[fmt]
+    header = {'currentDay': len(records), 'settings': {'idealSleepTime': 8}}
+    if content_type == 'application/json':
+        body = json.dumps(dict(header, sleepData=records), ensure_ascii=False).encode('utf-8')
+    else:
+        lines = [json.dumps(header)] + [json.dumps(record, ensure_ascii=False) for record in records]
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+    return gzip.compress(body) if encoding == 'gzip' else body
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_upload(fmt: str, body_file: str) -> dict:
+    """Post one upload to a fresh app (runs in the child process)."""
+    workdir = tempfile.mkdtemp(prefix='bench_sync_')
+    os.chdir(workdir)
+    from app.services import storage
+    storage.DATA_FILE = os.path.join(workdir, 'sleep_data.json')
+    storage.STORAGE_BACKEND = 'json'
+    from app_refactored import app
+    import logging
+    logging.disable(logging.INFO)
+
+    content_type, encoding = FORMATS[fmt]
+    headers = {'Content-Encoding': encoding} if encoding else {}
+    with open(body_file, 'rb') as f:
+        body = f.read()
+    client = app.test_client()
+    gc.collect()
+
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    response = client.post('/api/sync', data=body, headers=headers, content_type=content_type)
+    elapsed = time.perf_counter() - start
+    if not response.get_json().get('success'):
+        raise SystemExit(f"{fmt} upload failed: {response.get_json()}")
+    return {'ms': elapsed * 1000, 'rss_mb': peak_rss_mb() - before, 'bytes': len(body)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--worker', nargs=2, metavar=('FORMAT', 'BODY_FILE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_upload(*args.worker)))
+        return
+
+    print(f"{'records':>8} {'format':>12} {'body KiB':>9} {'latency ms':>11} {'peak RSS +MiB':>14}")
+    for size in args.sizes:
+        records = synthetic_records(size)
+        for fmt in FORMATS:
+            with tempfile.NamedTemporaryFile(suffix='.body', delete=False) as f:
+                f.write(build_body(records, fmt))
+            try:
+                output = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.bench_sync_upload', '--worker', fmt, f.name],
+                    check=True, capture_output=True, text=True, cwd=os.getcwd(),
+                    env=dict(os.environ, PYTHONPATH=os.getcwd())
+                ).stdout
+            finally:
+                os.remove(f.name)
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{size:>8} {fmt:>12} {result['bytes'] / 1024:>9.0f} {result['ms']:>11.1f} "
+                  f"{result['rss_mb']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,49 @@ DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)))
 DATA_FILE = os.path.join(DATA_DIR, 'sleep_data.json')
 SLEEPEN_DATA_FILE = os.path.join(DATA_DIR, 'sleepen_data.json')
 
+# Sleepen adventure, loot and skill tables
+SLEEPEN_CONTENT_FILE = os.environ.get('SLEEPEN_CONTENT_FILE',
+                                      os.path.join(DATA_DIR, 'config', 'sleepen_content.json'))
+
+# Weighted dream interpretation keywords, and how many dreams one batch request may send
+DREAM_LEXICON_FILE = os.environ.get('DREAM_LEXICON_FILE',
+                                    os.path.join(DATA_DIR, 'config', 'dream_lexicon.json'))
+MAX_DREAMS_PER_REQUEST = 100
+
+# Storage backend: 'json' (sleep_data.json + journal) or 'sqlite'
+STORAGE_BACKEND = os.environ.get('SLEEP_STORAGE_BACKEND', 'json')
+SQLITE_DB_FILE = os.path.join(DATA_DIR, 'sleep_data.db')
+
+# Analytics engine: 'python' or 'numpy' (vectorized, requires NumPy)
+ANALYTICS_ENGINE = os.environ.get('SLEEP_ANALYTICS_ENGINE', 'python')
+
+# Journal size (bytes) after which sleep_data.journal is compacted into the snapshot
+JOURNAL_COMPACT_THRESHOLD = 256 * 1024
+
+# Sleepen events logged between two full snapshots of sleepen_data.json
+SLEEPEN_SNAPSHOT_EVERY = 50
+
+# Adventures kept in sleepen_data.json; older ones go to monthly archive segments
+SLEEPEN_HOT_ADVENTURES = 20
+
+# Durability of the JSON stores: 'sync' writes (and fsyncs) every save inside
+# the request; 'write_behind' applies saves in memory and writes them from a
+# background thread every WRITE_BEHIND_INTERVAL seconds (single worker only)
+DURABILITY_MODE = os.environ.get('SLEEP_DURABILITY_MODE', 'sync')
+WRITE_BEHIND_INTERVAL = float(os.environ.get('SLEEP_WRITE_BEHIND_INTERVAL', '1.0'))
+
+# /api/sync handling: 'inline' merges during the request; 'queue' stores the
+# upload in SYNC_QUEUE_DIR, answers 202 with a job id and merges queued
+# uploads in batches every SYNC_QUEUE_INTERVAL seconds
+SYNC_MODE = os.environ.get('SLEEP_SYNC_MODE', 'inline')
+SYNC_QUEUE_DIR = os.path.join(DATA_DIR, 'sync_queue')
+SYNC_QUEUE_INTERVAL = float(os.environ.get('SLEEP_SYNC_QUEUE_INTERVAL', '1.0'))
+
+# Per-request /api/sync upload limits: bytes on the wire, and bytes after
+# gzip decompression
+MAX_SYNC_BODY_BYTES = 16 * 1024 * 1024
+MAX_SYNC_DECODED_BYTES = 64 * 1024 * 1024
+
 # Default settings
 DEFAULT_SETTINGS = {
     'idealSleepTime': 8,
@@ -0,0 +1,113 @@
+import json
+from collections import deque
+from functools import lru_cache
+from config.settings import DREAM_LEXICON_FILE
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton finding every keyword occurring in a text in one pass
+
+    Matching takes time linear in the text length plus the number of
+    matches, however many keywords the automaton holds.
+    """
+    __slots__ = ('keywords', '_goto', '_fail', '_output')
+
+    def __init__(self, keywords):
+        self.keywords = tuple(keywords)
+        self._goto = [{}]
+        self._fail = [0]
+        output = [[]]
+
+        # Trie of all keywords
+        for index, keyword in enumerate(self.keywords):
+            if not keyword:
+                raise ValueError("Keywords must not be empty")
+            node = 0
+            for char in keyword:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    output.append([])
+                node = next_node
+            output[node].append(index)
+
+        # Failure links breadth-first; each node also reports the matches of its failure node
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                output[child].extend(output[self._fail[child]])
+                queue.append(child)
+        self._output = tuple(tuple(matches) for matches in output)
+
+    def find(self, text):
+        """Indices into keywords of every match in text, in order of where they end"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                yield from output[node]
+
+
+class DreamLexicon:
+    """
+    Weighted dream keywords by theme, compiled once into one automaton
+
+    A dream scores the weights of the distinct keywords it contains for
+    every theme at once; the interpretation is the message of the single
+    highest-scoring theme, or the mixed message if there is none.
+    """
+
+    def __init__(self, lexicon):
+        self.mixed = lexicon['mixed']
+        self.interpretations = {name: theme['interpretation'] for name, theme in lexicon['themes'].items()}
+
+        # A keyword may belong to several themes: keep one automaton entry with all its weights
+        weights = {}
+        for name, theme in lexicon['themes'].items():
+            for keyword, weight in theme['keywords'].items():
+                weights.setdefault(keyword, []).append((name, float(weight)))
+        self._weights = tuple(tuple(entries) for entries in weights.values())
+        self.automaton = AhoCorasick(weights)
+
+    def analyze(self, text):
+        """Theme scores, matched keywords and the winning theme (None when mixed) for text"""
+        scores = dict.fromkeys(self.interpretations, 0.0)
+        matched = set()
+        for index in self.automaton.find(text):
+            if index not in matched:
+                matched.add(index)
+                for name, weight in self._weights[index]:
+                    scores[name] += weight
+
+        best = max(scores.values(), default=0.0)
+        leaders = [name for name, score in scores.items() if score == best]
+        theme = leaders[0] if best > 0 and len(leaders) == 1 else None
+        return {
+            "theme": theme,
+            "scores": scores,
+            "keywords": [self.automaton.keywords[index] for index in sorted(matched)]
+        }
+
+    def interpretation(self, theme, name):
+        """Message for a theme from analyze(), spoken by the named Sleepen"""
+        template = self.interpretations[theme] if theme else self.mixed
+        return template.format(name=name)
+
+
+@lru_cache(maxsize=None)
+def load_lexicon(path=DREAM_LEXICON_FILE):
+    """Load and compile a lexicon file once per path"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return DreamLexicon(json.load(f))
@@ -15,6 +15,9 @@ const API_ENDPOINTS = [
   '/api/analyze'
 ];
 
+// Delta sync state (the server-issued sync token)
+const SYNC_STATE_CACHE = 'sleep-set-sync-v1';
+
 // Install event - cache assets
 self.addEventListener('install', event => {
   event.waitUntil(
@@ -28,7 +31,7 @@ self.addEventListener('install', event => {
 
 // Activate event - clean up old caches
 self.addEventListener('activate', event => {
-  const cacheWhitelist = [CACHE_NAME];
+  const cacheWhitelist = [CACHE_NAME, SYNC_STATE_CACHE];
   event.waitUntil(
     caches.keys().then(cacheNames => {
       return Promise.all(
@@ -54,46 +57,104 @@ self.addEventListener('sync', event => {
 // Function to sync data when back online
 async function syncSleepData() {
   try {
-    // Get offline data from IndexedDB
-    const offlineData = await getOfflineData();
-    
-    if (!offlineData || !offlineData.sleepData || offlineData.sleepData.length === 0) {
-      console.log('No offline data to sync');
-      return;
+    // Resend an upload that was sent before but never confirmed, under its
+    // original Idempotency-Key, so the server merges it only once
+    let upload = await getPendingUpload();
+    if (!upload) {
+      // Get records changed offline since the last sync from IndexedDB
+      const offlineData = await getOfflineData();
+      const syncToken = await getSyncToken();
+      
+      if (syncToken && (!offlineData || !offlineData.sleepData || offlineData.sleepData.length === 0)) {
+        console.log('No offline data to sync');
+        return;
+      }
+      
+      // Send only the changes; the token tells the server what we already have
+      upload = {
+        key: self.crypto.randomUUID(),
+        body: JSON.stringify({ ...(offlineData || { sleepData: [] }), syncToken })
+      };
+      await savePendingUpload(upload);
     }
     
-    // Send data to server
     const response = await fetch('/api/sync', {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json'
+        'Content-Type': 'application/json',
+        'Idempotency-Key': upload.key
       },
-      body: JSON.stringify(offlineData)
+      body: upload.body
     });
     
-    if (response.ok) {
-      const result = await response.json();
-      console.log('Data synced successfully:', result);
-      
-      // Update local data with merged data from server
+    if (!response.ok) {
+      console.error('Sync failed:', response.statusText);
+      if (response.status >= 400 && response.status < 500 && response.status !== 409 && response.status !== 429) {
+        // Rejected as sent (e.g. 413 too large): resending the same body can't succeed
+        await clearPendingUpload();
+      }
+      return;
+    }
+    
+    let result = await response.json();
+    if (response.status === 202) {
+      // Queued on the server: wait for the background merge to finish
+      result = await waitForSyncJob(result.statusUrl);
+    }
+    
+    if (!result.success) {
+      console.error('Sync failed:', result.message);
+      if (result.status === 'failed') {
+        // The server won't run this job again; upload afresh next time
+        await clearPendingUpload();
+      }
+      return;
+    }
+    
+    console.log('Data synced successfully:', result);
+    
+    if (result.full) {
+      // No usable token (first sync or program reset): replace local data
       await saveOfflineData(result.data);
-      
-      // Show notification
-      self.registration.showNotification('スリープセット', {
-        body: 'データが同期されました。',
-        icon: '/static/icons/icon.svg'
-      });
     } else {
-      console.error('Sync failed:', response.statusText);
+      // Apply only the records that changed on the server
+      await applyServerChanges(result.changes, result.currentDay, result.settings);
     }
+    await saveSyncToken(result.syncToken);
+    await clearPendingUpload();
+    
+    // Show notification
+    self.registration.showNotification('スリープセット', {
+      body: 'データが同期されました。',
+      icon: '/static/icons/icon.svg'
+    });
   } catch (error) {
     console.error('Error syncing data:', error);
   }
 }
 
+// Poll a queued sync job until it is done or failed
+async function waitForSyncJob(statusUrl) {
+  let delay = 1000;
+  for (let attempt = 0; attempt < 20; attempt++) {
+    await new Promise(resolve => setTimeout(resolve, delay));
+    const response = await fetch(statusUrl, { cache: 'no-store' });
+    if (response.ok) {
+      const result = await response.json();
+      if (result.status !== 'queued') {
+        return result;
+      }
+    }
+    delay = Math.min(delay * 2, 10000);
+  }
+  // Still queued: the pending upload is kept and polled again on the next sync
+  throw new Error('Sync job did not finish in time');
+}
+
 // Helper function to get offline data (placeholder - implement with IndexedDB)
 async function getOfflineData() {
-  // In a real implementation, this would retrieve data from IndexedDB
+  // In a real implementation, this would retrieve the records changed
+  // since the last sync from IndexedDB
   // For now, we'll return null to indicate no offline data
   return null;
 }
@@ -104,6 +165,42 @@ async function saveOfflineData(data) {
   console.log('Saving synced data locally:', data);
 }
 
+// Helper function to apply a delta sync response (placeholder - implement with IndexedDB)
+async function applyServerChanges(changes, currentDay, settings) {
+  // In a real implementation, this would upsert the changed records by day
+  // and store currentDay and settings in IndexedDB
+  console.log('Applying server changes locally:', changes.length, currentDay, settings);
+}
+
+// Helpers to keep the server-issued sync token between syncs
+async function getSyncToken() {
+  const cache = await caches.open(SYNC_STATE_CACHE);
+  const response = await cache.match('/sync-token');
+  return response ? response.text() : null;
+}
+
+async function saveSyncToken(token) {
+  const cache = await caches.open(SYNC_STATE_CACHE);
+  await cache.put('/sync-token', new Response(token));
+}
+
+// Helpers to keep an unconfirmed upload and its Idempotency-Key between attempts
+async function getPendingUpload() {
+  const cache = await caches.open(SYNC_STATE_CACHE);
+  const response = await cache.match('/sync-pending-upload');
+  return response ? response.json() : null;
+}
+
+async function savePendingUpload(upload) {
+  const cache = await caches.open(SYNC_STATE_CACHE);
+  await cache.put('/sync-pending-upload', new Response(JSON.stringify(upload)));
+}
+
+async function clearPendingUpload() {
+  const cache = await caches.open(SYNC_STATE_CACHE);
+  await cache.delete('/sync-pending-upload');
+}
+
 // Fetch event - handle caching with proper filtering
 self.addEventListener('fetch', event => {
   const url = new URL(event.request.url);
@@ -119,16 +216,30 @@ self.addEventListener('fetch', event => {
     if (API_ENDPOINTS.some(endpoint => url.pathname === endpoint)) {
       event.respondWith(
         caches.open(API_CACHE_NAME).then(cache => {
-          return fetch(event.request)
-            .then(response => {
-              // Cache a clone of the response
-              cache.put(event.request, response.clone());
-              return response;
-            })
-            .catch(() => {
-              // Return cached response if available
-              return cache.match(event.request);
-            });
+          return cache.match(event.request).then(cached => {
+            // Revalidate with the cached ETag so unchanged data costs a 304
+            const headers = new Headers(event.request.headers);
+            const etag = cached && cached.headers.get('ETag');
+            if (etag) {
+              headers.set('If-None-Match', etag);
+            }
+            
+            return fetch(event.request.url, { headers, credentials: 'same-origin' })
+              .then(response => {
+                if (response.status === 304 && cached) {
+                  return cached;
+                }
+                if (response.ok) {
+                  // Cache a clone of the response
+                  cache.put(event.request, response.clone());
+                }
+                return response;
+              })
+              .catch(() => {
+                // Return cached response if available
+                return cached;
+              });
+          });
         })
       );
     } else if (!navigator.onLine) {
@@ -1,20 +1,40 @@
 import random
 import json
+import logging
 import os
+from contextlib import contextmanager
 from datetime import datetime
+from app.services.concurrency import append_json_line, atomic_write_json, check_version, file_locks, load_stamps, retry_on_conflict
+from app.services.data_cache import document_cache
+from app.services.write_behind import SYNC, WRITE_BEHIND, write_behind
+from adventure_archive import AdventureArchive
+from dream_lexicon import load_lexicon
+from sleepen_content import load_content
+
+logger = logging.getLogger(__name__)
 
 class Sleepen:
     """
     Sleepen - A dream world companion that grows as the user improves their sleep habits
     """
-    def __init__(self, name="スリープン"):
+    def __init__(self, name="スリープン", rng=None, content=None, clock=None):
+        # Randomness, game tables and time source; not persisted. rng is
+        # anything with random()/randint()/choice(), e.g. a seeded
+        # random.Random in tests, and clock returns the current datetime
+        self.rng = rng or random
+        self.content = content or load_content()
+        self.clock = clock or datetime.now
+        # Events recorded since the last save (see SleepenManager.save_events)
+        self._events = []
         self.name = name
+        self.name_history = []  # Earlier names, oldest first, each with when it stopped being used
         self.level = 1
         self.exp = 0
         self.mood = 100  # 0-100
         self.energy = 100  # 0-100
-        self.dream_items = []
-        self.adventures = []
+        self.dream_items = {}  # Item name -> {"count", "first_found", "rarity"}
+        self.adventures = []  # Newest adventures; older ones are archived by SleepenManager
+        self.archived_adventures = 0  # How many adventures were moved to the archive
         self.skills = []  # New: Skills that Sleepen can learn
         self.friendship = 0  # New: Friendship level with user (0-100)
         self.dream_locations = []  # New: Discovered dream world locations
@@ -23,19 +43,126 @@ class Sleepen:
             "accessories": [],
             "evolution_stage": 1
         }
-        self.creation_date = datetime.now().isoformat()
-        self.last_interaction = datetime.now().isoformat()
+        self.creation_date = self.clock().isoformat()
+        self.last_interaction = self.clock().isoformat()
+    
+    @property
+    def skills(self):
+        """Learned skills; learn new ones through _learn_skill so the index stays current"""
+        return self._skills
+    
+    @skills.setter
+    def skills(self, skills):
+        self._skills = skills
+        self._skills_by_name = {skill["name"]: skill for skill in skills}
+    
+    @property
+    def dream_locations(self):
+        """Discovered dream locations; add new ones through _discover_dream_location"""
+        return self._dream_locations
+    
+    @dream_locations.setter
+    def dream_locations(self, locations):
+        # Older saves can list a location more than once; keep the first entry
+        self._locations_by_name = {}
+        for location in locations:
+            known = self._locations_by_name.setdefault(location["name"], location)
+            if known is not location:
+                known["visits"] = known.get("visits", 0) + location.get("visits", 0)
+        self._dream_locations = list(self._locations_by_name.values())
+    
+    def _inventory(self, dream_items):
+        """Counted inventory from stored dream_items, migrating the old list of names
+        
+        Older saves list an item once per find. Their first-found time is
+        taken from the first adventure that found the item, if still recorded.
+        """
+        if isinstance(dream_items, dict):
+            return dream_items
+        
+        first_found = {}
+        for adventure in self.adventures:
+            for item in adventure.get("items_found", []):
+                first_found.setdefault(item, adventure.get("date"))
+        
+        inventory = {}
+        for item in dream_items:
+            entry = inventory.get(item)
+            if entry is None:
+                inventory[item] = self._new_item_entry(item, first_found.get(item))
+            else:
+                entry["count"] += 1
+        return inventory
+    
+    def _new_item_entry(self, item, found_date):
+        """Inventory entry for the first find of an item"""
+        return {
+            "count": 1,
+            "first_found": found_date,
+            "rarity": self.content.item_rarity.get(item, "common")
+        }
+    
+    def add_items(self, items):
+        """Add found items to the inventory"""
+        for item in items:
+            entry = self.dream_items.get(item)
+            if entry is None:
+                self.dream_items[item] = self._new_item_entry(item, self.clock().isoformat())
+            else:
+                entry["count"] += 1
+    
+    def item_count(self, item):
+        """How many of the item the Sleepen has collected"""
+        entry = self.dream_items.get(item)
+        return entry["count"] if entry else 0
+    
+    @property
+    def adventure_count(self):
+        """Number of adventures in the whole history, archived ones included"""
+        return self.archived_adventures + len(self.adventures)
+    
+    def take_old_adventures(self, keep):
+        """Remove all but the newest keep adventures and return them numbered by history position"""
+        count = max(0, len(self.adventures) - keep)
+        start = self.archived_adventures
+        old = [dict(adventure, seq=start + offset) for offset, adventure in enumerate(self.adventures[:count])]
+        del self.adventures[:count]
+        self.archived_adventures += count
+        return old
+    
+    def has_skill(self, name):
+        """Whether the Sleepen has learned the named skill"""
+        return name in self._skills_by_name
+    
+    def get_skill(self, name):
+        """The learned skill with this name, or None"""
+        return self._skills_by_name.get(name)
+    
+    def get_location(self, name):
+        """The discovered dream location with this name, or None"""
+        return self._locations_by_name.get(name)
+    
+    def _record(self, event_type, **details):
+        """Note an event for the event log written on the next save"""
+        self._events.append(dict(details, type=event_type))
+    
+    def take_events(self):
+        """Return the events recorded since the last call and forget them"""
+        events, self._events = self._events, []
+        return events
     
     def to_dict(self):
         """Convert Sleepen object to dictionary for JSON serialization"""
         return {
             "name": self.name,
+            "name_history": self.name_history,
             "level": self.level,
             "exp": self.exp,
             "mood": self.mood,
             "energy": self.energy,
             "dream_items": self.dream_items,
             "adventures": self.adventures,
+            "archived_adventures": self.archived_adventures,
             "skills": self.skills,
             "friendship": self.friendship,
             "dream_locations": self.dream_locations,
@@ -45,15 +172,17 @@ class Sleepen:
         }
     
     @classmethod
-    def from_dict(cls, data):
+    def from_dict(cls, data, rng=None, content=None, clock=None):
         """Create Sleepen object from dictionary"""
-        sleepen = cls(name=data.get("name", "スリープン"))
+        sleepen = cls(name=data.get("name", "スリープン"), rng=rng, content=content, clock=clock)
+        sleepen.name_history = data.get("name_history", [])
         sleepen.level = data.get("level", 1)
         sleepen.exp = data.get("exp", 0)
         sleepen.mood = data.get("mood", 100)
         sleepen.energy = data.get("energy", 100)
-        sleepen.dream_items = data.get("dream_items", [])
-        sleepen.adventures = data.get("adventures", [])
+        sleepen.adventures = [sleepen._compact_adventure(adventure) for adventure in data.get("adventures", [])]
+        sleepen.archived_adventures = data.get("archived_adventures", 0)
+        sleepen.dream_items = sleepen._inventory(data.get("dream_items", {}))
         sleepen.skills = data.get("skills", [])
         sleepen.friendship = data.get("friendship", 0)
         sleepen.dream_locations = data.get("dream_locations", [])
@@ -62,8 +191,8 @@ class Sleepen:
             "accessories": [],
             "evolution_stage": 1
         })
-        sleepen.creation_date = data.get("creation_date", datetime.now().isoformat())
-        sleepen.last_interaction = data.get("last_interaction", datetime.now().isoformat())
+        sleepen.creation_date = data.get("creation_date", sleepen.creation_date)
+        sleepen.last_interaction = data.get("last_interaction", sleepen.last_interaction)
         return sleepen
     
     def add_exp(self, amount):
@@ -79,6 +208,7 @@ class Sleepen:
         """Level up the Sleepen"""
         self.level += 1
         self.exp = 0
+        self._record("level_up", level=self.level)
         
         # Check for evolution
         if self.level == 5:
@@ -95,25 +225,25 @@ class Sleepen:
         
     def _check_new_skills(self):
         """Check if Sleepen learns new skills based on level"""
-        available_skills = [
-            {"name": "夢の解読", "description": "睡眠の質を10%向上させる", "level_req": 3},
-            {"name": "癒しの光", "description": "ユーザーのストレスを軽減する", "level_req": 5},
-            {"name": "記憶の保管", "description": "夢の記憶を保存する", "level_req": 7},
-            {"name": "夢の操作", "description": "夢の内容に影響を与える", "level_req": 10},
-            {"name": "時間感覚", "description": "最適な睡眠時間を感知する", "level_req": 12},
-            {"name": "次元の扉", "description": "新しい夢の世界に行ける", "level_req": 15}
-        ]
-        
-        for skill in available_skills:
-            if self.level >= skill["level_req"] and skill["name"] not in [s["name"] for s in self.skills]:
-                self.skills.append(skill)
-                return skill
+        for skill in self.content.skills:
+            if skill["level_req"] > self.level:
+                break  # Skills are sorted by level requirement
+            if skill["name"] not in self._skills_by_name:
+                return self._learn_skill(dict(skill))
         
         return None
     
+    def _learn_skill(self, skill):
+        """Add a skill to the learned skills and the name index"""
+        self._skills.append(skill)
+        self._skills_by_name[skill["name"]] = skill
+        self._record("skill", skill=skill["name"])
+        return skill
+    
     def evolve(self, stage):
         """Evolve Sleepen to a new stage"""
         self.appearance["evolution_stage"] = stage
+        self._record("evolve", stage=stage)
         
         # Add evolution bonuses
         if stage == 2:
@@ -129,13 +259,15 @@ class Sleepen:
         
     def _discover_dream_location(self, location_name):
         """Discover a new dream world location"""
-        if location_name not in self.dream_locations:
+        if location_name not in self._locations_by_name:
             location = {
                 "name": location_name,
-                "discovered_date": datetime.now().isoformat(),
+                "discovered_date": self.clock().isoformat(),
                 "visits": 0
             }
-            self.dream_locations.append(location)
+            self._dream_locations.append(location)
+            self._locations_by_name[location_name] = location
+            self._record("discovery", location=location_name)
             return location
         return None
     
@@ -145,126 +277,53 @@ class Sleepen:
         sleep_quality: 1-5 rating
         location: Optional specific location for the adventure
         """
-        adventure_types = [
-            "森の冒険",  # Forest adventure
-            "海の探検",  # Ocean exploration
-            "空の旅",    # Sky journey
-            "洞窟探索",  # Cave exploration
-            "雪山登頂",  # Snowy mountain climb
-            "砂漠の旅",  # Desert journey
-            "宇宙旅行",  # Space travel
-            "時間旅行",  # Time travel
-            "異次元探索"  # Interdimensional exploration
-        ]
-        
-        # Special locations have their own adventure types
-        special_locations = {
-            "夢の神殿": ["神秘の儀式", "古代の知恵", "神殿の秘宝"],
-            "星の海": ["星の航海", "光の踊り", "銀河の交差点"],
-            "記憶の迷宮": ["過去への旅", "忘れられた記憶", "未来の可能性"],
-            "感情の渓谷": ["喜びの滝", "悲しみの川", "怒りの火山"],
-            "想像の島": ["創造の泉", "アイデアの森", "インスピレーションの丘"]
-        }
+        content = self.content
+        rng = self.rng
         
         # Better sleep quality = better adventures and rewards
         adventure_quality = min(5, max(1, sleep_quality))
         
         # Apply skill bonuses
-        for skill in self.skills:
-            if skill["name"] == "夢の操作":
-                adventure_quality += 1  # Dream manipulation improves adventure quality
+        if self.has_skill("夢の操作"):
+            adventure_quality += 1  # Dream manipulation improves adventure quality
         
         adventure_quality = min(5, adventure_quality)  # Cap at 5
         
+        # Special locations have their own adventure types
+        special_location = bool(location) and location in content.special_locations
+        
         # Generate adventure
-        if location and location in special_locations:
-            adventure_type = random.choice(special_locations[location])
+        if special_location:
+            adventure_type = content.special_locations[location].sample(rng)
             # Update location visits
-            for loc in self.dream_locations:
-                if loc["name"] == location:
-                    loc["visits"] += 1
-                    break
+            visited = self._locations_by_name.get(location)
+            if visited is not None:
+                visited["visits"] = visited.get("visits", 0) + 1
         else:
-            adventure_type = random.choice(adventure_types)
+            adventure_type = content.adventure_types.sample(rng)
             
-        adventure_duration = adventure_quality * random.randint(1, 3)
-        exp_gained = adventure_quality * random.randint(10, 20)
+        adventure_duration = adventure_quality * rng.randint(1, 3)
+        exp_gained = adventure_quality * rng.randint(10, 20)
         
         # Friendship bonus
         friendship_bonus = int(self.friendship / 20)  # 0-5 bonus based on friendship level
         exp_gained += friendship_bonus
         
-        # Possible items to find
-        common_items = [
-            "キラキラ石",      # Sparkling stone
-            "夢の花",          # Dream flower
-            "星の砂",          # Star sand
-            "虹のしずく",      # Rainbow drop
-            "月の欠片",        # Moon fragment
-            "雲のクッション",  # Cloud cushion
-            "時の砂時計",      # Hourglass of time
-            "夢の羽根",        # Dream feather
-            "幻想のクリスタル"  # Fantasy crystal
-        ]
-        
-        rare_items = [
-            "夢想の宝石",      # Dreaming gem
-            "記憶の結晶",      # Memory crystal
-            "星空のマント",    # Starry mantle
-            "幻影の鏡",        # Phantom mirror
-            "永遠の砂時計",    # Eternal hourglass
-            "夢幻の笛"         # Ethereal flute
-        ]
-        
-        legendary_items = [
-            "創造主の筆",      # Creator's brush
-            "夢の王冠",        # Dream crown
-            "次元の鍵",        # Dimensional key
-            "星の心臓"         # Star heart
-        ]
-        
         # Better sleep quality = more items and better chances for rare items
-        items_found = []
-        
-        # Common items
-        for _ in range(adventure_quality):
-            if random.random() < 0.7:  # 70% chance to find a common item per quality point
-                items_found.append(random.choice(common_items))
-        
-        # Rare items
-        if adventure_quality >= 3:
-            rare_chance = 0.2 + (adventure_quality - 3) * 0.1  # 20-40% chance based on quality
-            if random.random() < rare_chance:
-                items_found.append(random.choice(rare_items))
-        
-        # Legendary items
-        if adventure_quality >= 4:
-            legendary_chance = 0.05 + (adventure_quality - 4) * 0.05  # 5-10% chance based on quality
-            if random.random() < legendary_chance:
-                items_found.append(random.choice(legendary_items))
-        
-        # Special location bonus
-        if location and location in special_locations:
-            if random.random() < 0.5:  # 50% chance for a bonus item
-                if random.random() < 0.7:
-                    items_found.append(random.choice(rare_items))
-                else:
-                    items_found.append(random.choice(legendary_items))
+        items_found = content.roll_items(adventure_quality, special_location, rng)
         
         # Chance to discover a new location
         new_location = None
-        if random.random() < 0.1 * adventure_quality:  # 10-50% chance based on quality
-            possible_locations = list(special_locations.keys())
-            discovered_locations = [loc["name"] for loc in self.dream_locations]
-            undiscovered = [loc for loc in possible_locations if loc not in discovered_locations]
+        if rng.random() < content.discovery_chance[adventure_quality]:  # 10-50% chance based on quality
+            undiscovered = [loc for loc in content.location_names if loc not in self._locations_by_name]
             
             if undiscovered:
-                new_location = random.choice(undiscovered)
+                new_location = rng.choice(undiscovered)
                 self._discover_dream_location(new_location)
         
         # Create adventure record
         adventure = {
-            "date": datetime.now().isoformat(),
+            "date": self.clock().isoformat(),
             "type": adventure_type,
             "location": location,
             "duration": adventure_duration,
@@ -272,12 +331,14 @@ class Sleepen:
             "exp_gained": exp_gained,
             "items_found": items_found,
             "new_location_discovered": new_location,
-            "description": self._generate_adventure_description(adventure_type, adventure_quality, items_found, new_location)
+            # The description is rendered from these fields when served (see render_adventure)
+            "template": content.description_template(items_found)
         }
         
         # Update Sleepen
+        self._record("adventure", adventure=adventure_type, location=location, quality=adventure_quality)
         self.adventures.append(adventure)
-        self.dream_items.extend(items_found)
+        self.add_items(items_found)
         self.add_exp(exp_gained)
         
         # Update energy, mood and friendship
@@ -285,38 +346,75 @@ class Sleepen:
         self.mood = min(100, self.mood + 10)    # Adventures improve mood
         self.friendship = min(100, self.friendship + 5)  # Adventures increase friendship
         
-        return adventure
+        return self.render_adventure(adventure)
     
-    def _generate_adventure_description(self, adventure_type, quality, items, new_location=None):
-        """Generate a description of the adventure"""
-        quality_adjectives = ["小さな", "楽しい", "わくわくする", "素晴らしい", "伝説的な"]
-        adjective = quality_adjectives[quality-1]
+    def _generate_adventure_description(self, adventure, template, name):
+        """Generate the description of an adventure record"""
+        return self.content.describe(template, name, adventure["type"], adventure["quality"],
+                                     tuple(adventure.get("items_found", ())),
+                                     adventure.get("new_location_discovered"))
+    
+    def rename(self, name):
+        """Change the name, remembering the old one for descriptions of earlier adventures"""
+        if name != self.name:
+            self.name_history.append({"name": self.name, "until": self.clock().isoformat()})
+            self.name = name
+            self._record("rename", name=name)
+    
+    def name_at(self, date):
+        """The name the Sleepen had at an ISO date (the current name if unknown)"""
+        if date:
+            for entry in self.name_history:
+                if date < entry["until"]:
+                    return entry["name"]
+        return self.name
+    
+    def render_adventure(self, adventure):
+        """The adventure as served to clients, with its description rendered
         
-        # Base description
-        if not items:
-            description = f"{self.name}は{adjective}{adventure_type}に出かけました。冒険を楽しんだようです！"
-        elif len(items) == 1:
-            description = f"{self.name}は{adjective}{adventure_type}に出かけ、{items[0]}を見つけました！"
-        else:
-            items_text = "、".join(items[:-1]) + "と" + items[-1]
-            description = f"{self.name}は{adjective}{adventure_type}に出かけ、{items_text}を見つけました！"
+        Records from before description templates keep their stored text.
+        """
+        if "template" not in adventure:
+            return adventure
+        rendered = {key: value for key, value in adventure.items() if key != "template"}
+        rendered["description"] = self._generate_adventure_description(
+            adventure, adventure["template"], self.name_at(adventure.get("date")))
+        return rendered
+    
+    def render_adventures(self, adventures):
+        """render_adventure for each of adventures"""
+        return [self.render_adventure(adventure) for adventure in adventures]
+    
+    def _compact_adventure(self, adventure):
+        """Replace a stored description by its template id when rendering gives the same text
         
-        # Add new location discovery
-        if new_location:
-            description += f" 冒険の途中で、新しい場所「{new_location}」を発見しました！"
-            
-        return description
+        Descriptions that don't match (written under an earlier name that
+        wasn't recorded, or edited) are kept as they are.
+        """
+        description = adventure.get("description")
+        if description is None or "template" in adventure:
+            return adventure
+        template = self.content.description_template(adventure.get("items_found"))
+        try:
+            rendered = self._generate_adventure_description(adventure, template, self.name_at(adventure.get("date")))
+        except (KeyError, IndexError, TypeError):
+            return adventure
+        if rendered != description:
+            return adventure
+        compact = {key: value for key, value in adventure.items() if key != "description"}
+        compact["template"] = template
+        return compact
     
     def rest(self):
         """Rest to recover energy"""
         recovery = 30
         
         # Apply skill bonuses
-        for skill in self.skills:
-            if skill["name"] == "癒しの光":
-                recovery += 10  # Healing light improves rest
-                
+        if self.has_skill("癒しの光"):
+            recovery += 10  # Healing light improves rest
+        
         self.energy = min(100, self.energy + recovery)
+        self._record("rest")
         return self.energy
     
     def play(self):
@@ -330,6 +428,7 @@ class Sleepen:
         self.mood = min(100, self.mood + mood_increase)
         self.energy = max(0, self.energy - 10)
         self.friendship = min(100, self.friendship + 3)  # Playing increases friendship
+        self._record("play")
         
         return self.mood
         
@@ -340,9 +439,9 @@ class Sleepen:
             
         # If no skill specified, choose a random one
         if not skill_name:
-            skill = random.choice(self.skills)
+            skill = self.rng.choice(self.skills)
         else:
-            skill = next((s for s in self.skills if s["name"] == skill_name), None)
+            skill = self.get_skill(skill_name)
             
         if not skill:
             return None
@@ -350,40 +449,67 @@ class Sleepen:
         # Training consumes energy but increases friendship
         self.energy = max(0, self.energy - 15)
         self.friendship = min(100, self.friendship + 2)
+        self._record("train", skill=skill["name"])
         
         return skill
         
     def interpret_dream(self, dream_description):
         """Interpret a user's dream based on Sleepen's skills"""
-        has_interpretation_skill = any(skill["name"] == "夢の解読" for skill in self.skills)
-        
-        if not has_interpretation_skill:
+        if not self.has_skill("夢の解読"):
             return "まだ夢を解読する能力を持っていません。レベル3になると解読できるようになります。"
-            
-        # Simple dream interpretation based on keywords
-        positive_keywords = ["飛ぶ", "空", "光", "友達", "成功", "幸せ"]
-        negative_keywords = ["落ちる", "暗い", "怖い", "迷う", "失敗", "追いかけられる"]
         
-        positive_count = sum(1 for word in positive_keywords if word in dream_description)
-        negative_count = sum(1 for word in negative_keywords if word in dream_description)
+        return self.analyze_dream(dream_description)["interpretation"]
+    
+    def analyze_dream(self, dream_description, lexicon=None):
+        """
+        Score a dream against the dream lexicon and interpret it
+        
+        Returns the lexicon analysis (theme, scores, keywords) with the
+        interpretation added. Callers check for the 夢の解読 skill first.
+        """
+        lexicon = lexicon or load_lexicon()
+        analysis = lexicon.analyze(dream_description)
+        analysis["interpretation"] = lexicon.interpretation(analysis["theme"], self.name)
+        self._record("interpret_dream", theme=analysis["theme"])
         
-        if positive_count > negative_count:
-            interpretation = f"{self.name}は、この夢はあなたの希望や前向きな気持ちを表していると感じています。"
-        elif negative_count > positive_count:
-            interpretation = f"{self.name}は、この夢はあなたの不安や心配事を表していると感じています。"
-        else:
-            interpretation = f"{self.name}は、この夢はあなたの複雑な感情を表していると感じています。"
-            
         # Add friendship and exp for interpreting dreams
         self.friendship = min(100, self.friendship + 1)
         self.add_exp(5)
         
-        return interpretation
+        return analysis
 
 class SleepenManager:
-    """Manager class for handling Sleepen data and operations"""
-    def __init__(self, data_file='sleepen_data.json'):
+    """
+    Manager class for handling Sleepen data and operations
+    
+    The document carries a version that every save bumps. Saves check it
+    under an exclusive file lock and raise ConcurrentModificationError when
+    another worker saved first; update() retries such conflicts.
+    
+    Changes made in a session are appended to an event log next to the
+    snapshot (``sleepen_data.events``): one line per save with the events
+    that happened (play, rest, train, adventure, level_up, discovery, ...)
+    and the fields they changed, new adventures and inventory entries only.
+    Loading reads the snapshot and applies the log from the offset the
+    snapshot was taken at. The snapshot is rewritten every
+    ``snapshot_every`` events; the log itself is never rewritten, so it
+    keeps the full history for auditing (see events()).
+    
+    Only the newest ``hot_adventures`` adventures stay in the document. Once
+    twice as many have piled up, the older ones are moved to compressed
+    monthly segments (``sleepen_data_adventures/``); adventures_page() pages
+    back through both.
+    
+    With ``durability='write_behind'`` saves update the cached document and
+    queue it for the write-behind flusher instead of rewriting the file.
+    """
+    def __init__(self, data_file='sleepen_data.json', durability=SYNC, snapshot_every=50, hot_adventures=20):
         self.data_file = data_file
+        self.events_file = os.path.splitext(data_file)[0] + '.events'
+        self.archive = AdventureArchive(os.path.splitext(data_file)[0] + '_adventures')
+        self.durability = durability
+        self.snapshot_every = snapshot_every
+        self.hot_adventures = hot_adventures
         self.default_data = {
             "sleepen": None,
             "dream_world": {
@@ -393,64 +519,348 @@ class SleepenManager:
         }
     
     def load_data(self):
-        """Load Sleepen data from JSON file"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Convert sleepen dict to object if exists
-                    if data.get("sleepen"):
-                        data["sleepen"] = Sleepen.from_dict(data["sleepen"])
-                    
-                    return data
-            except json.JSONDecodeError:
-                print(f"Error decoding {self.data_file}. Using default data.")
+        """Load Sleepen data, reusing the cached document while the file is unchanged"""
+        return load_stamps.stamp(self.data_file, self._current_data())
+    
+    def _current_data(self):
+        """The latest document (queued, cached or read) without stamping it"""
+        pending = write_behind.pending(self.data_file)
+        if pending is not None:
+            return pending
+        return document_cache.get(self.data_file, self._read_data, (self.events_file,))
+    
+    def _read_data(self):
+        """Read the snapshot and apply the event log on top of it"""
+        with file_locks.shared(self.data_file):
+            if os.path.exists(self.data_file):
+                try:
+                    with open(self.data_file, 'r', encoding='utf-8') as f:
+                        data = self._hydrate(json.load(f))
+                except json.JSONDecodeError:
+                    print(f"Error decoding {self.data_file}. Using default data.")
+                    return self.default_data
+                self._replay_events(data)
+                return data
+            else:
+                # Return default data structure if file doesn't exist
                 return self.default_data
-        else:
-            # Return default data structure if file doesn't exist
-            return self.default_data
     
-    def save_data(self, data):
-        """Save Sleepen data to JSON file"""
-        # Convert Sleepen object to dict for serialization
+    def _replay_events(self, data):
+        """Apply the log entries saved after the snapshot to its Sleepen in place"""
+        if not data.get("sleepen") or not os.path.exists(self.events_file):
+            return
+        
+        with open(self.events_file, 'rb') as f:
+            offset = data.get("event_offset", 0)
+            # A log shorter than the snapshot's offset was replaced: read all of it
+            f.seek(offset if offset <= os.fstat(f.fileno()).st_size else 0)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn trailing line from an interrupted append
+                    logger.warning(f"Skipping unreadable entry in {self.events_file}")
+                    continue
+                # Versions tell entries already in the snapshot apart from later ones
+                if entry["v"] <= data.get("version", 0):
+                    continue
+                self._apply_patch(data["sleepen"], entry)
+                data["version"] = entry["v"]
+                data["events_since_snapshot"] = data.get("events_since_snapshot", 0) + 1
+            data["event_offset"] = f.tell()
+    
+    @staticmethod
+    def _diff(before, after, archived=0):
+        """Patch taking one Sleepen.to_dict() to another
+        
+        Only changed fields are kept; adventures and dream items are
+        recorded as the entries added or changed rather than whole lists.
+        archived is how many of the oldest adventures were archived since before.
+        """
+        changed = {key: value for key, value in after.items() if before.get(key) != value}
+        patch = {}
+        
+        adventures = changed.pop("adventures", None)
+        if adventures is not None:
+            known = before.get("adventures", [])[archived:]
+            if adventures[:len(known)] == known:
+                patch["archived"] = archived
+                patch["adventures"] = adventures[len(known):]
+            else:
+                changed["adventures"] = adventures
+        
+        items = changed.pop("dream_items", None)
+        if items is not None:
+            known = before.get("dream_items", {})
+            if isinstance(known, dict) and known.keys() <= items.keys():
+                patch["items"] = {name: entry for name, entry in items.items() if known.get(name) != entry}
+            else:
+                changed["dream_items"] = items
+        
+        if changed:
+            patch["set"] = changed
+        return patch
+    
+    @staticmethod
+    def _apply_patch(sleepen, patch):
+        """Apply a patch from _diff to a Sleepen"""
+        for field, value in patch.get("set", {}).items():
+            setattr(sleepen, field, value)
+        del sleepen.adventures[:patch.get("archived", 0)]
+        sleepen.adventures.extend(patch.get("adventures", []))
+        sleepen.dream_items.update(patch.get("items", {}))
+    
+    def _hydrate(self, data):
+        """Convert the stored sleepen dict to a Sleepen object if it exists"""
+        if data.get("sleepen"):
+            data["sleepen"] = Sleepen.from_dict(data["sleepen"])
+        return data
+    
+    def _serialize(self, data):
+        """Convert the Sleepen object to a dict for serialization"""
         if data.get("sleepen") and isinstance(data["sleepen"], Sleepen):
             data_copy = data.copy()
             data_copy["sleepen"] = data["sleepen"].to_dict()
-        else:
-            data_copy = data
+            return data_copy
+        return data
+    
+    @staticmethod
+    def bump_version(data):
+        """Advance the document version used to detect concurrent saves"""
+        data["version"] = data.get("version", 0) + 1
+        return data["version"]
+    
+    def save_data(self, data):
+        """Save a full snapshot of Sleepen data if it is still at the version it was loaded with"""
+        with file_locks.exclusive(self.data_file):
+            self._check_version(data)
+            self._archive_adventures(data)
+            self.bump_version(data)
+            load_stamps.stamp(self.data_file, data)
+            # The snapshot already holds everything logged so far
+            data["event_offset"] = os.path.getsize(self.events_file) if os.path.exists(self.events_file) else 0
+            if self.durability == WRITE_BEHIND:
+                document_cache.store(self.data_file, data, companions=(self.events_file,))
+                write_behind.schedule(self.data_file, data, self._flush)
+                return
+            self._write_snapshot(data)
+            document_cache.store(self.data_file, data, companions=(self.events_file,))
+    
+    def save_events(self, data, before, events):
+        """Append the change from the before state of data's Sleepen to the event log
+        
+        before is the Sleepen.to_dict() the session started from and events
+        the list from Sleepen.take_events(). Takes a full snapshot instead
+        once snapshot_every events have been logged since the last one.
+        """
+        with file_locks.exclusive(self.data_file):
+            self._check_version(data)
+            archived = self._archive_adventures(data)
+            entry = {
+                "v": self.bump_version(data),
+                "at": datetime.now().isoformat(),
+                "events": events or [{"type": "update"}]
+            }
+            load_stamps.stamp(self.data_file, data)
+            entry.update(self._diff(before, data["sleepen"].to_dict(), archived))
+            data["event_offset"] = append_json_line(self.events_file, entry, fsync=self.durability == SYNC)
+            data["events_since_snapshot"] = data.get("events_since_snapshot", 0) + 1
             
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(data_copy, f, ensure_ascii=False, indent=2)
+            if self.durability == WRITE_BEHIND:
+                document_cache.store(self.data_file, data, companions=(self.events_file,))
+                write_behind.schedule(self.data_file, data, self._flush)
+                return
+            if data["events_since_snapshot"] >= self.snapshot_every:
+                self._write_snapshot(data)
+            document_cache.store(self.data_file, data, companions=(self.events_file,))
+    
+    def _check_version(self, data):
+        """Fail if the stored data moved on since data was loaded (call with the write lock held)
+        
+        Compares the version data was stamped with when this thread loaded
+        it, since the shared cached document itself is bumped by every save.
+        """
+        current = self._current_data()
+        check_version(self.data_file, load_stamps.expected(self.data_file, data), current.get("version", 0))
+    
+    def _archive_adventures(self, data):
+        """Move old adventures of data's Sleepen to the archive once the hot list is full
+        
+        Returns how many were moved (call with the write lock held).
+        """
+        sleepen = data.get("sleepen")
+        if not sleepen or len(sleepen.adventures) < 2 * self.hot_adventures:
+            return 0
+        old = sleepen.take_old_adventures(self.hot_adventures)
+        self.archive.append(old)
+        return len(old)
+    
+    def adventures_page(self, cursor=None, limit=20):
+        """A rendered page of adventure history, newest first, and the cursor of the next page
+        
+        Each adventure carries its history position as ``seq``; a page holds
+        the adventures before cursor (from the newest when None). The next
+        cursor is None once the oldest adventure has been returned.
+        """
+        sleepen = self.get_sleepen()
+        first_hot = sleepen.archived_adventures
+        before = sleepen.adventure_count if cursor is None else min(cursor, sleepen.adventure_count)
+        
+        page = [dict(sleepen.adventures[seq - first_hot], seq=seq)
+                for seq in range(before - 1, max(first_hot, before - limit) - 1, -1)]
+        if len(page) < limit and min(before, first_hot) > 0:
+            with file_locks.shared(self.data_file):
+                page += self.archive.page(min(before, first_hot), limit - len(page))
+        
+        next_cursor = page[-1]["seq"] if page and page[-1]["seq"] > 0 else None
+        return sleepen.render_adventures(page), next_cursor
+    
+    def _flush(self, data):
+        """Write a queued document as a fresh snapshot (runs on the write-behind flusher thread)"""
+        with file_locks.exclusive(self.data_file):
+            self._write_snapshot(data)
+            document_cache.refresh(self.data_file, data, companions=(self.events_file,))
+    
+    def _write_snapshot(self, data):
+        """Write the whole document; it records the log offset it is current up to"""
+        data["events_since_snapshot"] = 0
+        atomic_write_json(self.data_file, self._serialize(data), indent=2)
+    
+    def events(self, since=0):
+        """Yield the logged saves after version since, oldest first, for auditing"""
+        if not os.path.exists(self.events_file):
+            return
+        with file_locks.shared(self.data_file):
+            with open(self.events_file, 'rb') as f:
+                lines = f.readlines()
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry["v"] > since:
+                yield entry
     
     def create_sleepen(self, name="スリープン"):
-        """Create a new Sleepen"""
+        """Create a new Sleepen, discarding the archived adventures of any previous one"""
         data = self.load_data()
         data["sleepen"] = Sleepen(name=name)
         self.save_data(data)
+        with file_locks.exclusive(self.data_file):
+            self.archive.clear()
         return data["sleepen"]
     
     def get_sleepen(self):
         """Get the current Sleepen, create one if it doesn't exist"""
-        data = self.load_data()
-        if not data.get("sleepen"):
-            return self.create_sleepen()
-        return data["sleepen"]
+        return self.update(lambda sleepen: sleepen)
     
-    def update_sleepen(self, sleepen):
-        """Update the Sleepen data"""
-        data = self.load_data()
-        data["sleepen"] = sleepen
-        self.save_data(data)
-        return sleepen
+    @contextmanager
+    def session(self):
+        """Unit of work on the current Sleepen: load once, save at most once
+        
+        Yields the Sleepen (creating one if none exists). On exit a new
+        Sleepen is saved as a snapshot and a changed one as an entry in the
+        event log; an unchanged Sleepen is not saved at all. If the block or
+        the save raises, nothing is saved: the Sleepen in the shared document
+        is restored from its state on entry (it may still be queued for
+        write-behind) and the cached copy dropped. Other sessions in this
+        process wait until this one ends.
+        """
+        with document_cache.lock(self.data_file):
+            data = self.load_data()
+            created = not data.get("sleepen")
+            if created:
+                # Copy so the shared default document is never mutated
+                data = dict(data, sleepen=Sleepen())
+            sleepen = data["sleepen"]
+            sleepen.take_events()  # Drop anything recorded outside a session
+            before = None if created else self._fingerprint(sleepen)
+            
+            try:
+                yield sleepen
+                if created:
+                    self.save_data(data)
+                elif self._fingerprint(sleepen) != before:
+                    self.save_events(data, json.loads(before), sleepen.take_events())
+            except BaseException:
+                if before is not None:
+                    data["sleepen"] = Sleepen.from_dict(json.loads(before))
+                document_cache.invalidate(self.data_file)
+                raise
+    
+    @staticmethod
+    def _fingerprint(sleepen):
+        """Serialized Sleepen state used to tell whether a session changed it"""
+        return json.dumps(sleepen.to_dict(), sort_keys=True, ensure_ascii=False)
+    
+    def update(self, mutator):
+        """Apply mutator to the current Sleepen in a session, retrying on concurrent saves
+        
+        mutator may run more than once, each time on a freshly loaded Sleepen.
+        Returns mutator's result from the attempt that was saved.
+        """
+        def attempt():
+            with self.session() as sleepen:
+                return mutator(sleepen)
+        
+        return retry_on_conflict(attempt, on_conflict=lambda: document_cache.invalidate(self.data_file))
     
     def process_sleep_data(self, sleep_data):
         """Process sleep data to update Sleepen"""
-        sleepen = self.get_sleepen()
+        return self.replay([sleep_data])
+    
+    def replay(self, records, seed=None):
+        """Apply a batch of sleep records to the Sleepen in chronological order and save once
+        
+        Every record is applied to the same in-memory Sleepen (exp, level-ups,
+        evolutions, skills, adventures) as process_sleep_data would, but the
+        document is loaded and saved a single time for the whole batch.
+        
+        With a seed the replay is deterministic: the Sleepen draws from
+        random.Random(seed) and its clock reads each record's date, so
+        replaying the same records onto the same starting state always gives
+        the same Sleepen. Without one it uses the live rng and clock.
+        Returns the saved Sleepen.
+        """
+        records = sorted(records, key=self._chronological)
         
+        def apply(sleepen):
+            # Fresh rng per attempt, so a retried replay draws the same values
+            rng, clock = sleepen.rng, sleepen.clock
+            try:
+                if seed is not None:
+                    sleepen.rng = random.Random(seed)
+                for record in records:
+                    if seed is not None:
+                        sleepen.clock = self._record_clock(record, sleepen.clock)
+                    self.apply_sleep_data(sleepen, record)
+            finally:
+                sleepen.rng, sleepen.clock = rng, clock
+            return sleepen
+        
+        return self.update(apply)
+    
+    @staticmethod
+    def _chronological(record):
+        """Sort key ordering sleep records by date, then program day"""
+        return (record.get("date") or "", record.get("day") or 0)
+    
+    @staticmethod
+    def _record_clock(record, fallback):
+        """Clock that always reads the record's date, or fallback if it has none"""
+        try:
+            moment = datetime.fromisoformat(record.get("date") or "")
+        except ValueError:
+            return fallback
+        return lambda: moment
+    
+    @staticmethod
+    def apply_sleep_data(sleepen, sleep_data):
+        """Apply the rewards for one night of sleep data to sleepen in memory, without saving"""
         # Calculate rewards based on sleep quality and duration
         sleep_quality = sleep_data.get("sleepQuality", 0)
         sleep_hours = sleep_data.get("sleepHours", 0)
+        sleepen._record("sleep", day=sleep_data.get("day"), quality=sleep_quality)
         
         # Base experience from sleep quality
         if sleep_quality > 0:
@@ -463,9 +873,8 @@ class SleepenManager:
                 exp_gain += 10
             
             # Apply skill bonuses
-            for skill in sleepen.skills:
-                if skill["name"] == "時間感覚":
-                    exp_gain = int(exp_gain * 1.1)  # 10% bonus with time sense skill
+            if sleepen.has_skill("時間感覚"):
+                exp_gain = int(exp_gain * 1.1)  # 10% bonus with time sense skill
             
             sleepen.add_exp(exp_gain)
             
@@ -478,8 +887,8 @@ class SleepenManager:
                 # Choose a random discovered location if available and quality is high enough
                 location = None
                 if sleep_quality >= 4 and sleepen.dream_locations:
-                    if random.random() < 0.7:  # 70% chance to go to a special location
-                        location = random.choice(sleepen.dream_locations)["name"]
+                    if sleepen.rng.random() < 0.7:  # 70% chance to go to a special location
+                        location = sleepen.rng.choice(sleepen.dream_locations)["name"]
                 
                 adventure = sleepen.go_on_adventure(sleep_quality, location)
             else:
@@ -490,9 +899,4 @@ class SleepenManager:
             sleepen.rest()
         
         # Update last interaction
-        sleepen.last_interaction = datetime.now().isoformat()
-        
-        # Save updated Sleepen
-        self.update_sleepen(sleepen)
-        
-        return sleepen
\ No newline at end of file
+        sleepen.last_interaction = sleepen.clock().isoformat()
\ No newline at end of file
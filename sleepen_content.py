@@ -0,0 +1,177 @@
+import json
+import math
+from functools import lru_cache
+from types import MappingProxyType
+from config.settings import SLEEPEN_CONTENT_FILE
+
+MAX_QUALITY = 5
+
+
+class AliasTable:
+    """
+    Weighted table sampled in O(1) with Vose's alias method
+
+    Entries are strings (weight 1) or {"name": ..., "weight": ...} objects
+    in the content file. Any object with a random() method, such as the
+    random module or a seeded random.Random, can be passed as rng.
+    """
+    __slots__ = ('outcomes', '_probability', '_alias')
+
+    def __init__(self, outcomes, weights=None):
+        if not outcomes:
+            raise ValueError("An alias table needs at least one outcome")
+        weights = list(weights) if weights is not None else [1.0] * len(outcomes)
+        if len(weights) != len(outcomes) or any(w < 0 for w in weights) or not sum(weights) > 0:
+            raise ValueError("Alias table weights must be non-negative and not all zero")
+
+        self.outcomes = tuple(outcomes)
+        count = len(weights)
+        total = sum(weights)
+        scaled = [w * count / total for w in weights]
+        probability = [1.0] * count
+        alias = list(range(count))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            probability[less] = scaled[less]
+            alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1 up to rounding error
+        self._probability = tuple(probability)
+        self._alias = tuple(alias)
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Build a table from content file entries"""
+        outcomes = []
+        weights = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                outcomes.append(entry['name'])
+                weights.append(float(entry.get('weight', 1)))
+            else:
+                outcomes.append(entry)
+                weights.append(1.0)
+        return cls(outcomes, weights)
+
+    def sample(self, rng):
+        """Draw one outcome using a single rng.random() call"""
+        scaled = rng.random() * len(self.outcomes)
+        column = int(scaled)
+        if scaled - column < self._probability[column]:
+            return self.outcomes[column]
+        return self.outcomes[self._alias[column]]
+
+
+def _binomial_table(trials, chance):
+    """Alias table over 0..trials successes of independent chance-weighted trials"""
+    weights = [math.comb(trials, k) * chance ** k * (1 - chance) ** (trials - k) for k in range(trials + 1)]
+    return AliasTable(range(trials + 1), weights)
+
+
+def _chance_by_quality(rule):
+    """Per-quality (index 0..MAX_QUALITY) chance from a minQuality/baseChance/chancePerQuality rule"""
+    return tuple(
+        rule['baseChance'] + (quality - rule['minQuality']) * rule['chancePerQuality']
+        if quality >= rule['minQuality'] else 0.0
+        for quality in range(MAX_QUALITY + 1)
+    )
+
+
+class SleepenContent:
+    """
+    Adventure, loot and skill tables loaded once from the content file
+
+    Everything is precompiled into tuples, read-only mappings and alias
+    tables, so an adventure draws each outcome in O(1) without rebuilding
+    any list, and the game can be tuned by editing the JSON alone.
+    """
+
+    def __init__(self, content):
+        self.adventure_types = AliasTable.from_entries(content['adventureTypes'])
+        self.special_locations = MappingProxyType({
+            name: AliasTable.from_entries(types)
+            for name, types in content['specialLocations'].items()
+        })
+        self.location_names = tuple(content['specialLocations'])
+
+        items = content['items']
+        self.common_items = AliasTable.from_entries(items['common'])
+        self.rare_items = AliasTable.from_entries(items['rare'])
+        self.legendary_items = AliasTable.from_entries(items['legendary'])
+        self.item_rarity = MappingProxyType({
+            name: tier
+            for tier, table in (('common', self.common_items), ('rare', self.rare_items),
+                                ('legendary', self.legendary_items))
+            for name in table.outcomes
+        })
+
+        loot = content['loot']
+        # Number of common items found at each quality: one roll instead of one per quality point
+        self.common_item_counts = (None,) + tuple(
+            _binomial_table(quality, loot['commonChancePerQuality'])
+            for quality in range(1, MAX_QUALITY + 1)
+        )
+        self.rare_chance = _chance_by_quality(loot['rare'])
+        self.legendary_chance = _chance_by_quality(loot['legendary'])
+        self.special_bonus_chance = loot['specialLocationBonus']['chance']
+        self.special_bonus_rare_share = loot['specialLocationBonus']['rareShare']
+        self.discovery_chance = tuple(
+            content['discoveryChancePerQuality'] * quality for quality in range(MAX_QUALITY + 1)
+        )
+
+        self.quality_adjectives = tuple(content['qualityAdjectives'])
+        self.description_templates = MappingProxyType(dict(content['adventureDescriptions']))
+        self.skills = tuple(
+            MappingProxyType(dict(skill))
+            for skill in sorted(content['skills'], key=lambda skill: skill['level_req'])
+        )
+
+    def roll_items(self, quality, special_location, rng):
+        """Items found on an adventure of the given quality (1-5)"""
+        items_found = [self.common_items.sample(rng)
+                       for _ in range(self.common_item_counts[quality].sample(rng))]
+
+        if self.rare_chance[quality] and rng.random() < self.rare_chance[quality]:
+            items_found.append(self.rare_items.sample(rng))
+        if self.legendary_chance[quality] and rng.random() < self.legendary_chance[quality]:
+            items_found.append(self.legendary_items.sample(rng))
+
+        # Special location bonus
+        if special_location and rng.random() < self.special_bonus_chance:
+            if rng.random() < self.special_bonus_rare_share:
+                items_found.append(self.rare_items.sample(rng))
+            else:
+                items_found.append(self.legendary_items.sample(rng))
+
+        return items_found
+
+    @staticmethod
+    def description_template(items):
+        """Id of the description template for an adventure that found items"""
+        return 'items' if items else 'none'
+
+    @lru_cache(maxsize=4096)
+    def describe(self, template, name, adventure_type, quality, items, new_location=None):
+        """Render an adventure description; items is a tuple so calls can be cached"""
+        if len(items) > 1:
+            items_text = "、".join(items[:-1]) + "と" + items[-1]
+        else:
+            items_text = "".join(items)
+        description = self.description_templates[template].format(
+            name=name, adjective=self.quality_adjectives[quality - 1], type=adventure_type, items=items_text
+        )
+
+        # Add new location discovery
+        if new_location:
+            description += self.description_templates['discovery'].format(location=new_location)
+        return description
+
+
+@lru_cache(maxsize=None)
+def load_content(path=SLEEPEN_CONTENT_FILE):
+    """Load and compile a content file once per path"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return SleepenContent(json.load(f))
@@ -1,13 +1,49 @@
 import json
+import logging
 import os
+import threading
+import uuid
 from datetime import datetime
+from app.models.sleep_aggregates import SleepAggregates
+from app.models.sleep_data import SleepData
+from app.services.concurrency import append_json_line, atomic_write_json, check_version, file_locks, load_stamps
+from app.services.data_cache import document_cache
+from app.services.write_behind import SYNC, WRITE_BEHIND, write_behind
+
+logger = logging.getLogger(__name__)
+
+# Data files with a compaction thread running in this process
+_compacting = set()
+_compacting_guard = threading.Lock()
+
 
 class SleepDataSync:
     """
     Class to handle synchronization between offline and online sleep data
+    
+    Single-record saves are appended to a journal next to the snapshot
+    (``sleep_data.journal``) and replayed on load; once the journal grows past
+    ``compact_threshold`` bytes it is folded back into a fresh snapshot by a
+    background thread.
+    
+    Reads hold a shared lock and writes an exclusive lock on the data file
+    (see FileLockManager), so several worker processes can share it. Every
+    write first checks that the stored version is still the one the caller
+    loaded and raises ConcurrentModificationError otherwise.
+    
+    With ``durability='sync'`` each save is written and fsynced before it
+    returns. With ``durability='write_behind'`` saves only update the cached
+    document and queue it; the write-behind flusher writes one snapshot per
+    interval for any number of saves (single writer process only).
     """
-    def __init__(self, data_file='sleep_data.json'):
+    # Whether find_by_day/find_by_date/get_all_dates are answered by the store itself
+    indexed = False
+    
+    def __init__(self, data_file='sleep_data.json', compact_threshold=256 * 1024, durability=SYNC):
         self.data_file = data_file
+        self.journal_file = os.path.splitext(data_file)[0] + '.journal'
+        self.compact_threshold = compact_threshold
+        self.durability = durability
         self.default_data = {
             'sleepData': [],
             'currentDay': 1,
@@ -23,7 +59,25 @@ class SleepDataSync:
         }
     
     def load_data(self):
-        """Load sleep data from JSON file"""
+        """Load sleep data, reusing the cached document while the files are unchanged"""
+        return load_stamps.stamp(self.data_file, self._current_data())
+    
+    def _current_data(self):
+        """The latest document (queued, cached or read) without stamping it"""
+        pending = write_behind.pending(self.data_file)
+        if pending is not None:
+            return pending
+        return document_cache.get(self.data_file, self._read_data, (self.journal_file,))
+    
+    def _read_data(self):
+        """Read the snapshot and replay the journal on top of it"""
+        with file_locks.shared(self.data_file):
+            data = self._read_snapshot()
+            self._replay_journal(data)
+            return data
+    
+    def _read_snapshot(self):
+        """Read and parse sleep data from JSON file"""
         if os.path.exists(self.data_file):
             try:
                 with open(self.data_file, 'r', encoding='utf-8') as f:
@@ -35,48 +89,257 @@ class SleepDataSync:
             # Return default data structure if file doesn't exist
             return self.default_data
     
+    def _replay_journal(self, data):
+        """Apply journaled upserts and state changes to a snapshot in place"""
+        if not os.path.exists(self.journal_file):
+            return
+        
+        records = data.setdefault('sleepData', [])
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn trailing line from an interrupted append
+                    logger.warning(f"Skipping unreadable entry in {self.journal_file}")
+                    continue
+                
+                op = entry.get('op')
+                if op == 'upsert':
+                    index = entry.get('index', len(records))
+                    if 0 <= index < len(records):
+                        records[index] = entry['record']
+                    else:
+                        records.append(entry['record'])
+                    # Aggregates as of this upsert; entries without them leave none to trust
+                    if 'aggregates' in entry:
+                        data['aggregates'] = entry['aggregates']
+                    else:
+                        data.pop('aggregates', None)
+                elif op == 'state':
+                    data['currentDay'] = entry['currentDay']
+                    data['settings'] = entry['settings']
+                
+                if 'version' in entry:
+                    data['version'] = entry['version']
+    
     def save_data(self, data):
-        """Save sleep data to JSON file"""
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """Save a full snapshot of sleep data and clear the journal"""
+        with file_locks.exclusive(self.data_file):
+            self._check_version(data)
+            self.bump_version(data)
+            load_stamps.stamp(self.data_file, data)
+            if self.durability == WRITE_BEHIND:
+                self._schedule_write(data)
+                return
+            self._write_snapshot(data)
+            document_cache.store(self.data_file, data, companions=(self.journal_file,))
+    
+    def append_record(self, data, index, record):
+        """Journal one added or updated record at its position in data['sleepData']"""
+        entry = {'op': 'upsert', 'index': index, 'record': record}
+        if 'aggregates' in data:
+            entry['aggregates'] = data['aggregates']
+        self._append(entry, data)
+    
+    def append_state(self, data):
+        """Journal the current day and settings of data"""
+        self._append({'op': 'state', 'currentDay': data['currentDay'], 'settings': data['settings']}, data)
+    
+    @staticmethod
+    def bump_version(data):
+        """Advance the data version that response caches and ETags are keyed on"""
+        data['version'] = data.get('version', 0) + 1
+        return data['version']
+    
+    @staticmethod
+    def next_version(data):
+        """Version the next save of data will be stored at (saves check data is current)"""
+        return data.get('version', 0) + 1
+    
+    @staticmethod
+    def new_sync_epoch(data):
+        """Invalidate every sync token issued so far, e.g. after records were removed"""
+        data['syncEpoch'] = uuid.uuid4().hex[:12]
+    
+    @staticmethod
+    def sync_token(data):
+        """Token a client presents on its next sync to receive only later changes"""
+        return f"{data.get('syncEpoch', '0')}:{data.get('version', 0)}"
+    
+    @staticmethod
+    def parse_sync_token(data, token):
+        """Return the version a sync token was issued at, or None if it can't be used for a delta"""
+        if not isinstance(token, str):
+            return None
+        epoch, _, version = token.rpartition(':')
+        if epoch != data.get('syncEpoch', '0'):
+            return None
+        try:
+            version = int(version)
+        except ValueError:
+            return None
+        if not 0 <= version <= data.get('version', 0):
+            return None
+        return version
+    
+    def _check_version(self, data):
+        """Fail if the stored data moved on since data was loaded (call with the write lock held)
+        
+        Compares the version data was stamped with when this thread loaded
+        it, since the shared cached document itself is bumped by every save.
+        """
+        current = self._current_data()
+        check_version(self.data_file, load_stamps.expected(self.data_file, data), current.get('version', 0))
+    
+    def _append(self, entry, data):
+        with file_locks.exclusive(self.data_file):
+            self._check_version(data)
+            entry['version'] = self.bump_version(data)
+            load_stamps.stamp(self.data_file, data)
+            if self.durability == WRITE_BEHIND:
+                # The queued snapshot will include this change; no journal needed
+                self._schedule_write(data)
+                return
+            journal_size = append_json_line(self.journal_file, entry)
+            document_cache.store(self.data_file, data, companions=(self.journal_file,))
+        
+        if journal_size >= self.compact_threshold:
+            self._start_compaction()
+    
+    def _schedule_write(self, data):
+        """Keep data as the current document and queue it for the write-behind flusher"""
+        document_cache.store(self.data_file, data, companions=(self.journal_file,))
+        write_behind.schedule(self.data_file, data, self._flush)
+    
+    def _flush(self, data):
+        """Write a queued document as a fresh snapshot (runs on the flusher thread)"""
+        with file_locks.exclusive(self.data_file):
+            self._write_snapshot(data)
+            document_cache.refresh(self.data_file, data, companions=(self.journal_file,))
+    
+    def _write_snapshot(self, data):
+        """Write data to a temp file, swap it in, then drop the journal"""
+        atomic_write_json(self.data_file, data, indent=2)
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+    
+    def _start_compaction(self):
+        with _compacting_guard:
+            if self.data_file in _compacting:
+                return
+            _compacting.add(self.data_file)
+        threading.Thread(target=self.compact, name='sleep-data-compaction', daemon=True).start()
+    
+    def compact(self):
+        """Fold the journal into a fresh snapshot"""
+        try:
+            with file_locks.exclusive(self.data_file):
+                data = self._read_data()
+                self._write_snapshot(data)
+                document_cache.store(self.data_file, data, companions=(self.journal_file,))
+            logger.info(f"Compacted journal into {self.data_file}")
+        except OSError as e:
+            logger.error(f"Journal compaction failed: {e}")
+        finally:
+            with _compacting_guard:
+                _compacting.discard(self.data_file)
     
     def merge_offline_data(self, offline_data):
         """
         Merge offline data with server data
         Strategy: For each day, use the most recent data based on timestamp
+        
+        offline_data may hold only the records changed on the client (delta
+        sync); settings and currentDay are optional. Records taken from the
+        client are stamped with the version of this save as their rev.
         """
+        return self.merge_offline_batch([offline_data])
+    
+    def merge_offline_batch(self, offline_batch):
+        """Merge several uploads, in order, into the server data with a single save"""
         server_data = self.load_data()
+        rev = self.next_version(server_data)
+        for offline_data in offline_batch:
+            self._merge_into(server_data, offline_data, rev)
+        
+        # Save merged data
+        self.save_data(server_data)
         
+        return server_data
+    
+    def _merge_into(self, server_data, offline_data, rev):
+        """Merge one upload into server_data in place"""
         # Extract sleep data from both sources
-        server_sleep_data = {day['day']: day for day in server_data['sleepData']}
-        offline_sleep_data = {day['day']: day for day in offline_data['sleepData']}
+        server_records = server_data['sleepData']
+        server_sleep_data = {day['day']: day for day in server_records}
+        offline_sleep_data = {day['day']: day for day in offline_data.get('sleepData', [])}
+        if len(server_sleep_data) != len(server_records):
+            # Duplicate days collapse below; clients can't learn that from a delta
+            self.new_sync_epoch(server_data)
+        
+        # Running aggregates can be updated in place only while every server
+        # record keeps its position (no duplicate days collapsed by the merge)
+        aggregates = None
+        if 'aggregates' in server_data and len(server_sleep_data) == len(server_records):
+            aggregates = SleepAggregates(server_data['aggregates'])
+            if not aggregates.is_valid_for(len(server_records),
+                                           sum(record.get('rev') or 0 for record in server_records)):
+                aggregates = None
+        positions = {day: position for position, day in enumerate(server_sleep_data)}
+        
+        def current_items():
+            return [SleepData.from_dict(record) for record in server_sleep_data.values()]
         
         # Merge sleep data
         for day, data in offline_sleep_data.items():
             if day not in server_sleep_data:
                 # Day doesn't exist in server data, add it
+                data['rev'] = rev
                 server_sleep_data[day] = data
+                if aggregates is not None:
+                    positions[day] = len(positions)
+                    aggregates.add(positions[day], SleepData.from_dict(data))
             else:
                 # Day exists in both, use the most recent one
                 server_date = datetime.fromisoformat(server_sleep_data[day]['date'])
                 offline_date = datetime.fromisoformat(data['date'])
                 
                 if offline_date > server_date:
+                    data['rev'] = rev
+                    if aggregates is not None:
+                        aggregates.replace(positions[day], SleepData.from_dict(server_sleep_data[day]),
+                                           SleepData.from_dict(data), current_items)
                     server_sleep_data[day] = data
         
         # Update server data
         server_data['sleepData'] = list(server_sleep_data.values())
+        if aggregates is None:
+            server_data['aggregates'] = SleepAggregates.from_items(current_items()).state
         
         # Use the highest current day from either source
-        server_data['currentDay'] = max(server_data['currentDay'], offline_data['currentDay'])
+        server_data['currentDay'] = max(server_data['currentDay'],
+                                        offline_data.get('currentDay', server_data['currentDay']))
         
         # For settings, use the most recent one (assuming offline is more recent)
-        server_data['settings'] = offline_data['settings']
-        
-        # Save merged data
-        self.save_data(server_data)
+        if 'settings' in offline_data:
+            server_data['settings'] = offline_data['settings']
+    
+    def changes_since(self, data, since, uploaded=()):
+        """
+        Records a client that synced at version since doesn't have yet
         
-        return server_data
+        uploaded are the records the client just sent; those that were
+        accepted are left out and those that lost to the server's copy are
+        sent back.
+        """
+        uploaded_ids = {id(record) for record in uploaded}
+        uploaded_days = {record.get('day') for record in uploaded}
+        return [
+            record for record in data['sleepData']
+            if id(record) not in uploaded_ids
+            and (record.get('rev', 0) > since or record.get('day') in uploaded_days)
+        ]
     
     def get_offline_data_template(self):
         """
@@ -0,0 +1,98 @@
+"""Concurrent updates from threads of one process."""
+import datetime
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from app.models.sleep_data import SleepData
+from app.services.concurrency import ConcurrentModificationError, atomic_write_json
+from app.services.data_cache import document_cache
+from app.services.data_service import DataService
+from app.services.sqlite_storage import SQLiteSleepStorage
+from sync import SleepDataSync
+
+THREADS = 16
+RECORDS_PER_THREAD = 25
+
+
+class ThreadedUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def service(self, backend: str = 'json') -> DataService:
+        data_service = DataService()
+        if backend == 'sqlite':
+            data_service.sync = SQLiteSleepStorage(os.path.join(self.directory, 'sleep_data.db'))
+        else:
+            data_service.sync = SleepDataSync(os.path.join(self.directory, 'sleep_data.json'))
+        return data_service
+
+    def save_records_from_threads(self, backend: str) -> None:
+        errors = []
+
+        def work(thread: int) -> None:
+            data_service = self.service(backend)
+            for offset in range(RECORDS_PER_THREAD):
+                day = thread * RECORDS_PER_THREAD + offset + 1
+                date = (datetime.date(2025, 1, 1) + datetime.timedelta(days=day)).isoformat()
+
+                def save(data):
+                    collection = data_service.get_sleep_data_collection(data)
+                    data_service.save_sleep_record(data, collection, SleepData(day=day, date=date))
+                try:
+                    data_service.update(save)
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(thread,)) for thread in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        document_cache.invalidate()
+        data = self.service(backend).load_data()
+        days = sorted(record['day'] for record in data['sleepData'])
+        self.assertEqual(days, list(range(1, THREADS * RECORDS_PER_THREAD + 1)))
+        collection = self.service(backend).get_sleep_data_collection(data)
+        self.assertEqual(collection.find_by_day(THREADS * RECORDS_PER_THREAD).day, THREADS * RECORDS_PER_THREAD)
+
+    def test_every_record_is_kept_json(self):
+        self.save_records_from_threads('json')
+
+    def test_every_record_is_kept_sqlite(self):
+        self.save_records_from_threads('sqlite')
+
+    def test_save_after_another_thread_saved_conflicts(self):
+        data_service = self.service()
+        data_service.advance_day()
+        stale = data_service.load_data()
+
+        other = threading.Thread(target=lambda: self.service().advance_day())
+        other.start()
+        other.join()
+
+        # stale is the shared cached document, already bumped by the other thread's save
+        with self.assertRaises(ConcurrentModificationError):
+            data_service.save_state(stale)
+
+
+class AtomicWriteTest(unittest.TestCase):
+
+    def test_rewrite_keeps_file_mode(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'document.json')
+        atomic_write_json(path, {'version': 1})
+        os.chmod(path, 0o644)
+        atomic_write_json(path, {'version': 2})
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+
+
+if __name__ == '__main__':
+    unittest.main()
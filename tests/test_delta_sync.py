@@ -0,0 +1,88 @@
+"""Delta sync tokens and the changes sent back to clients."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from app.models.sleep_data import SleepData
+from app.services.data_service import DataService
+from sync import SleepDataSync
+
+
+def record(day: int, date: str, quality: int = 3) -> dict:
+    return {'day': day, 'date': date, 'bedtime': '23:00', 'wakeTime': '07:00', 'sleepQuality': quality}
+
+
+class DeltaSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.data_service = DataService()
+        self.data_service.sync = SleepDataSync(os.path.join(directory, 'sleep_data.json'))
+
+    def save_on_server(self, day: int, date: str) -> None:
+        def save(data):
+            collection = self.data_service.get_sleep_data_collection(data)
+            self.data_service.save_sleep_record(data, collection, SleepData.from_dict(record(day, date)))
+        self.data_service.update(save)
+
+    def test_first_sync_is_full(self):
+        self.save_on_server(1, '2025-01-01T07:00:00')
+        payload = self.data_service.sync_offline_data({'syncToken': None, 'sleepData': []})
+
+        self.assertTrue(payload['full'])
+        self.assertEqual([item['day'] for item in payload['data']['sleepData']], [1])
+        data = self.data_service.load_data()
+        self.assertEqual(self.data_service.sync.parse_sync_token(data, payload['syncToken']), data['version'])
+
+    def test_delta_round_trip(self):
+        token = self.data_service.sync_offline_data({'syncToken': None, 'sleepData': []})['syncToken']
+        self.save_on_server(1, '2025-01-01T07:00:00')
+
+        # The client uploads day 2 and gets back only what it doesn't have
+        payload = self.data_service.sync_offline_data(
+            {'syncToken': token, 'sleepData': [record(2, '2025-01-02T07:00:00')]})
+        self.assertFalse(payload['full'])
+        self.assertEqual([item['day'] for item in payload['changes']], [1])
+        self.assertIn('settings', payload)
+        days = sorted(item['day'] for item in self.data_service.load_data()['sleepData'])
+        self.assertEqual(days, [1, 2])
+
+        # Nothing changed since: an empty delta
+        payload = self.data_service.sync_offline_data({'syncToken': payload['syncToken'], 'sleepData': []})
+        self.assertFalse(payload['full'])
+        self.assertEqual(payload['changes'], [])
+
+    def test_upload_that_loses_gets_server_copy_back(self):
+        self.save_on_server(1, '2025-01-01T08:00:00')
+        token = self.data_service.sync_offline_data({'syncToken': None, 'sleepData': []})['syncToken']
+
+        payload = self.data_service.sync_offline_data(
+            {'syncToken': token, 'sleepData': [record(1, '2025-01-01T06:00:00', quality=1)]})
+        self.assertFalse(payload['full'])
+        self.assertEqual([item['date'] for item in payload['changes']], ['2025-01-01T08:00:00'])
+
+    def test_collapsed_duplicate_days_force_full_resync(self):
+        sync = self.data_service.sync
+        data = sync.load_data()
+        data['sleepData'] = [record(1, '2025-01-01T07:00:00'), record(1, '2025-01-02T07:00:00')]
+        sync.save_data(data)
+        token = sync.sync_token(sync.load_data())
+
+        payload = self.data_service.sync_offline_data({'syncToken': token, 'sleepData': []})
+        self.assertTrue(payload['full'])
+        self.assertEqual(len(payload['data']['sleepData']), 1)
+        self.assertIsNone(sync.parse_sync_token(self.data_service.load_data(), token))
+
+    def test_unusable_tokens(self):
+        sync = self.data_service.sync
+        data = {'syncEpoch': 'abc', 'version': 5}
+        self.assertEqual(sync.parse_sync_token(data, 'abc:5'), 5)
+        self.assertEqual(sync.parse_sync_token(data, sync.sync_token(data)), 5)
+        for token in (None, 7, 'abc', 'abc:x', 'abc:6', 'abc:-1', 'other:3'):
+            self.assertIsNone(sync.parse_sync_token(data, token), token)
+
+
+if __name__ == '__main__':
+    unittest.main()
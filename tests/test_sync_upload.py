@@ -0,0 +1,102 @@
+"""gzip and NDJSON /api/sync uploads."""
+import gzip
+import io
+import json
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from app.routes import sleep_routes
+from app.services.sync_upload import UploadTooLarge, open_upload, read_json_upload, read_ndjson_upload
+
+
+def ndjson(*lines) -> bytes:
+    return ''.join(json.dumps(line) + '\n' for line in lines).encode('utf-8')
+
+
+class OpenUploadTest(unittest.TestCase):
+
+    def test_gzip_body_is_decoded(self):
+        body = json.dumps({'sleepData': [], 'currentDay': 3}).encode('utf-8')
+        upload = open_upload(io.BytesIO(gzip.compress(body)), 'gzip', 1000, 1000)
+        self.assertEqual(read_json_upload(upload), {'sleepData': [], 'currentDay': 3})
+
+    def test_decompressed_size_is_limited(self):
+        body = gzip.compress(b' ' * 100000 + b'{}')
+        upload = open_upload(io.BytesIO(body), 'gzip', len(body), 1000)
+        with self.assertRaises(UploadTooLarge):
+            read_json_upload(upload)
+
+    def test_bad_gzip_body(self):
+        upload = open_upload(io.BytesIO(b'not gzip at all'), 'gzip', 1000, 1000)
+        with self.assertRaises(ValueError):
+            read_json_upload(upload)
+
+    def test_unsupported_encoding(self):
+        with self.assertRaises(ValueError):
+            open_upload(io.BytesIO(b'{}'), 'br', 1000, 1000)
+
+
+class ReadNdjsonUploadTest(unittest.TestCase):
+
+    def test_records_and_state_lines(self):
+        data = read_ndjson_upload(io.BytesIO(ndjson(
+            {'syncToken': None},
+            {'day': 1, 'sleepQuality': 2},
+            {'day': 2, 'sleepQuality': 3},
+            {'day': 1, 'sleepQuality': 5},
+            {'currentDay': 2, 'settings': {'idealSleepTime': 7}}
+        )))
+        # The last line for a day wins at the position of the first
+        self.assertEqual(data['sleepData'], [{'day': 1, 'sleepQuality': 5}, {'day': 2, 'sleepQuality': 3}])
+        self.assertEqual(data['currentDay'], 2)
+        self.assertEqual(data['settings'], {'idealSleepTime': 7})
+        self.assertIsNone(data['syncToken'])
+
+    def test_state_lines_only_set_known_fields(self):
+        for line in ({'sleepData': []}, {'version': 9}, {'currentDay': 2, 'syncEpoch': 'x'}):
+            with self.assertRaises(ValueError, msg=line):
+                read_ndjson_upload(io.BytesIO(ndjson({'day': 1}, line)))
+
+    def test_lines_must_be_objects(self):
+        with self.assertRaises(ValueError):
+            read_ndjson_upload(io.BytesIO(b'{"day": 1}\n[1]\n'))
+
+
+class SyncRouteUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(sleep_routes.sleep_bp)
+        self.client = app.test_client()
+
+    def test_gzip_bomb_is_rejected_with_413(self):
+        body = gzip.compress(b' ' * 100000 + b'{}')
+        with mock.patch.object(sleep_routes, 'MAX_SYNC_DECODED_BYTES', 1000):
+            response = self.client.post('/api/sync', data=body, content_type='application/json',
+                                        headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(response.get_json()['success'])
+
+    def test_oversized_body_is_rejected_with_413(self):
+        with mock.patch.object(sleep_routes, 'MAX_SYNC_BODY_BYTES', 10):
+            response = self.client.post('/api/sync', data=json.dumps({'sleepData': [{'day': 1}]}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+
+    def test_bad_gzip_body_is_a_sync_error(self):
+        response = self.client.post('/api/sync', data=b'not gzip', content_type='application/json',
+                                    headers={'Content-Encoding': 'gzip'})
+        self.assertFalse(response.get_json()['success'])
+        self.assertIn('gzip', response.get_json()['message'])
+
+    def test_ndjson_state_line_with_records_is_a_sync_error(self):
+        response = self.client.post('/api/sync', data=ndjson({'day': 1}, {'sleepData': []}),
+                                    content_type='application/x-ndjson')
+        self.assertFalse(response.get_json()['success'])
+        self.assertIn('sleepData', response.get_json()['message'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""Moving averages and sleep debt from /api/trends."""
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from typing import List, Optional
+from unittest import mock
+
+from flask import Flask
+
+from app.models.sleep_data import SleepData
+from app.routes import sleep_routes
+from app.services.data_service import DataService
+from sync import SleepDataSync
+
+START = datetime.date(2025, 1, 1)
+
+
+def direct_mean(values: List[float]) -> Optional[float]:
+    values = [value for value in values if value]
+    return round(sum(values) / len(values), 1) if values else None
+
+
+class TrendsRouteTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.data_service = DataService()
+        self.data_service.sync = SleepDataSync(os.path.join(directory, 'sleep_data.json'))
+        patcher = mock.patch.object(sleep_routes, 'DataService', return_value=self.data_service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        app = Flask(__name__)
+        app.register_blueprint(sleep_routes.sleep_bp)
+        self.client = app.test_client()
+
+    def save_nights(self, count: int) -> List[SleepData]:
+        """Save nights on random dates over count days, with gaps and repeated dates."""
+        rng = random.Random(7)
+        nights = []
+        for day in range(1, count + 1):
+            date = START + datetime.timedelta(days=rng.randrange(count))
+            nights.append(SleepData(
+                day=day, date=date.isoformat() + 'T00:00:00',
+                bed_in_time='22:30', bed_out_time='07:30',
+                bedtime=f'{rng.choice([22, 23, 0, 1])}:{rng.choice(["00", "15", "45"])}', wake_time='07:00',
+                sleep_quality=rng.randint(0, 5)))
+
+        data = self.data_service.load_data()
+        data['sleepData'] = [night.to_dict() for night in nights]
+        self.data_service.sync.save_data(data)
+        return nights
+
+    def trends(self, **params) -> dict:
+        response = self.client.get('/api/trends', query_string=params)
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()
+
+    def test_moving_averages_and_sleep_debt_match_a_direct_calculation(self):
+        nights = self.save_nights(60)
+        ideal_sleep = self.data_service.load_data()['settings']['idealSleepTime']
+        payload = self.trends(windows='1,7,30', days=20)
+        self.assertTrue(payload['success'], payload)
+        trends = payload['trends']
+
+        last = max(datetime.date.fromisoformat(night.date[:10]) for night in nights)
+        shown = [last - datetime.timedelta(days=offset) for offset in range(19, -1, -1)]
+        self.assertEqual(trends['dates'], [date.isoformat() for date in shown])
+
+        for position, date in enumerate(shown):
+            up_to = [night for night in nights if night.date[:10] <= date.isoformat()]
+            slept = [night.sleep_hours for night in up_to if night.sleep_hours]
+            self.assertEqual(trends['cumulativeSleepDebt'][position],
+                             round(max(0, ideal_sleep * len(slept) - sum(slept)), 1))
+
+            for window in (1, 7, 30):
+                start = (date - datetime.timedelta(days=window - 1)).isoformat()
+                in_window = [night for night in up_to if night.date[:10] >= start]
+                series = trends['windows'][str(window)]
+                context = f'{date} window {window}'
+                self.assertEqual(series['sleepHours'][position],
+                                 direct_mean([night.sleep_hours for night in in_window]), context)
+                self.assertEqual(series['sleepQuality'][position],
+                                 direct_mean([night.sleep_quality for night in in_window]), context)
+                self.assertEqual(series['sleepEfficiency'][position],
+                                 direct_mean([night.sleep_efficiency for night in in_window]), context)
+                hours = [night.sleep_hours for night in in_window if night.sleep_hours]
+                self.assertEqual(series['sleepDebt'][position],
+                                 round(max(0, ideal_sleep * len(hours) - sum(hours)), 1), context)
+
+    def test_repeated_windows_give_one_series(self):
+        self.save_nights(30)
+        trends = self.trends(windows='7,30,7', days=10)['trends']
+
+        self.assertEqual(sorted(trends['windows'], key=int), ['7', '30'])
+        for series in trends['windows'].values():
+            for values in series.values():
+                self.assertEqual(len(values), len(trends['dates']))
+
+    def test_no_nights_give_empty_series(self):
+        trends = self.trends()['trends']
+        self.assertEqual(trends['dates'], [])
+        self.assertEqual(trends['cumulativeSleepDebt'], [])
+
+    def test_out_of_range_parameters_are_rejected(self):
+        too_many = ','.join(str(window) for window in range(1, sleep_routes.MAX_TREND_WINDOWS + 2))
+        for params in ({'days': 0}, {'days': sleep_routes.MAX_TREND_DAYS + 1}, {'windows': '0'},
+                       {'windows': str(sleep_routes.MAX_TREND_WINDOW + 1)}, {'windows': '7,-1'},
+                       {'windows': too_many}):
+            payload = self.trends(**params)
+            self.assertFalse(payload['success'], params)
+            self.assertEqual(payload['message'], '期間の指定が範囲外です。')
+
+    def test_non_integer_parameters_are_rejected(self):
+        for params in ({'days': 'x'}, {'windows': '7,'}, {'windows': '7.5'}, {'windows': ''}):
+            payload = self.trends(**params)
+            self.assertFalse(payload['success'], params)
+            self.assertEqual(payload['message'], 'windows と days は整数で指定してください。')
+
+
+if __name__ == '__main__':
+    unittest.main()
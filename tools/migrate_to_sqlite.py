@@ -0,0 +1,44 @@
+"""One-shot migration of sleep_data.json and sleepen_data.json into SQLite.
+
+Usage (from the project root):
+    python -m tools.migrate_to_sqlite [--db sleep_data.db]
+
+Then set SLEEP_STORAGE_BACKEND=sqlite (or STORAGE_BACKEND in
+config/settings.py) to serve from the database.
+"""
+import argparse
+import json
+import os
+from config.settings import DATA_FILE, SLEEPEN_DATA_FILE, SQLITE_DB_FILE
+from sync import SleepDataSync
+from app.services.sqlite_storage import SQLiteSleepStorage, get_database, UPSERT_DOCUMENT
+
+
+def migrate(data_file: str, sleepen_file: str, db_file: str) -> None:
+    # SleepDataSync replays any pending journal on top of the snapshot
+    data = SleepDataSync(data_file).load_data()
+    SQLiteSleepStorage(db_file).save_data(data)
+    print(f"Migrated {len(data.get('sleepData', []))} sleep records from {data_file}")
+
+    if os.path.exists(sleepen_file):
+        with open(sleepen_file, 'r', encoding='utf-8') as f:
+            sleepen_document = json.load(f)
+        conn = get_database(db_file).connection()
+        with conn:
+            conn.execute(UPSERT_DOCUMENT, ('sleepen', json.dumps(sleepen_document, ensure_ascii=False)))
+        print(f"Migrated Sleepen document from {sleepen_file}")
+    else:
+        print(f"No Sleepen data at {sleepen_file}, skipped")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Migrate JSON data files into SQLite.')
+    parser.add_argument('--sleep-data', default=DATA_FILE, help='path to sleep_data.json')
+    parser.add_argument('--sleepen-data', default=SLEEPEN_DATA_FILE, help='path to sleepen_data.json')
+    parser.add_argument('--db', default=SQLITE_DB_FILE, help='SQLite database to create or overwrite')
+    args = parser.parse_args()
+    migrate(args.sleep_data, args.sleepen_data, args.db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""Apply the stored sleep history to the Sleepen in one batch.
+
+Usage (from the project root):
+    python -m tools.replay_sleepen [--rebuild] [--seed 42] [--from-day 1]
+
+With --rebuild the current Sleepen is replaced by a new one with the same
+name before the replay, so the Sleepen is recomputed from the history
+alone; with --seed the result is the same on every run.
+"""
+import argparse
+from app.services.storage import create_sleep_storage, create_sleepen_manager
+
+
+def replay(rebuild: bool, seed: int = None, from_day: int = 1) -> None:
+    records = [record for record in create_sleep_storage().load_data().get('sleepData', [])
+               if (record.get('day') or 0) >= from_day]
+    manager = create_sleepen_manager()
+    if rebuild:
+        manager.create_sleepen(manager.get_sleepen().name)
+    sleepen = manager.replay(records, seed=seed)
+    print(f"Replayed {len(records)} sleep records: {sleepen.name} is level {sleepen.level} "
+          f"with {sleepen.adventure_count} adventures")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Apply stored sleep records to the Sleepen in one batch.')
+    parser.add_argument('--rebuild', action='store_true', help='start from a new Sleepen with the same name')
+    parser.add_argument('--seed', type=int, help='seed for a reproducible replay')
+    parser.add_argument('--from-day', type=int, default=1, help='skip records before this program day')
+    args = parser.parse_args()
+    replay(args.rebuild, args.seed, args.from_day)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""Monte Carlo balance simulator for Sleepen progression.
+
+Runs many synthetic users' Sleepens through months of nightly sleep
+records and play/rest/train calls, spread over a process pool, and reports
+the level curve, when the evolutions happen and how found items split by
+rarity. Every user has its own seed, so a report depends only on --seed,
+--users, --days and the content file, not on the number of workers. The
+run time doubles as a throughput benchmark of the Sleepen engine.
+
+Usage (from the project root):
+    python -m tools.simulate_sleepen [--users 10000] [--days 90] [--workers 8]
+        [--seed 0] [--content config/sleepen_content.json] [--json]
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+from config.settings import SLEEPEN_CONTENT_FILE
+from sleepen import Sleepen, SleepenManager
+from sleepen_content import load_content
+
+CHECKPOINT_DAYS = (7, 14, 30, 60, 90, 180, 365)
+EVOLUTION_STAGES = (2, 3, 4)
+RARITIES = ('common', 'rare', 'legendary')
+START = datetime.datetime(2025, 1, 1, 7, 0)
+
+
+def checkpoints(days: int) -> List[int]:
+    """Days at which every user's level is sampled."""
+    return sorted({day for day in CHECKPOINT_DAYS if day < days} | {days})
+
+
+def simulate_user(seed: int, days: int, content_file: str) -> Dict[str, Any]:
+    """Play one synthetic user for days days and summarize their Sleepen."""
+    # Separate string-seeded streams, so the user's behaviour and the Sleepen's draws are independent
+    user = random.Random(f"{seed}:user")
+    # How this user sleeps and how often they come back to the app
+    mean_quality = user.uniform(1.5, 4.8)
+    quality_spread = user.uniform(0.3, 1.2)
+    mean_hours = user.uniform(5.5, 8.5)
+    logging_rate = user.uniform(0.5, 1.0)
+    play_rate = user.uniform(0.0, 0.8)
+    rest_rate = user.uniform(0.0, 0.5)
+    train_rate = user.uniform(0.0, 0.4)
+
+    now = [START]
+    sleepen = Sleepen(rng=random.Random(f"{seed}:sleepen"), content=load_content(content_file),
+                      clock=lambda: now[0])
+    samples = set(checkpoints(days))
+    levels = []
+    evolution_days: Dict[int, Optional[int]] = dict.fromkeys(EVOLUTION_STAGES)
+    operations = 0
+
+    for day in range(1, days + 1):
+        now[0] = START + datetime.timedelta(days=day)
+        if user.random() < logging_rate:
+            quality = min(5, max(1, round(user.gauss(mean_quality, quality_spread))))
+            hours = round(user.gauss(mean_hours, 0.8), 1)
+            SleepenManager.apply_sleep_data(sleepen, {"day": day, "sleepQuality": quality, "sleepHours": hours})
+            operations += 1
+        if user.random() < play_rate:
+            sleepen.play()
+            operations += 1
+        if user.random() < train_rate:
+            sleepen.train()
+            operations += 1
+        if user.random() < rest_rate:
+            sleepen.rest()
+            operations += 1
+        # Nothing saves these; don't let them pile up
+        sleepen.take_events()
+
+        stage = sleepen.appearance["evolution_stage"]
+        for evolution in EVOLUTION_STAGES:
+            if evolution_days[evolution] is None and stage >= evolution:
+                evolution_days[evolution] = day
+        if day in samples:
+            levels.append(sleepen.level)
+
+    items = dict.fromkeys(RARITIES, 0)
+    for entry in sleepen.dream_items.values():
+        items[entry["rarity"]] = items.get(entry["rarity"], 0) + entry["count"]
+    return {
+        'levels': levels,
+        'evolutionDays': evolution_days,
+        'items': items,
+        'skills': len(sleepen.skills),
+        'adventures': sleepen.adventure_count,
+        'operations': operations
+    }
+
+
+def simulate_chunk(seeds: range, days: int, content_file: str) -> List[Dict[str, Any]]:
+    """Simulate a block of users (runs in a pool worker)."""
+    return [simulate_user(seed, days, content_file) for seed in seeds]
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of values, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(results: List[Dict[str, Any]], days: int) -> Dict[str, Any]:
+    """Aggregate per-user results into the balance report."""
+    users = len(results)
+    level_curve = {}
+    for index, day in enumerate(checkpoints(days)):
+        levels = [result['levels'][index] for result in results]
+        level_curve[day] = {
+            'mean': round(sum(levels) / users, 2),
+            'p10': percentile(levels, 0.1),
+            'p50': percentile(levels, 0.5),
+            'p90': percentile(levels, 0.9),
+            'max': max(levels)
+        }
+
+    evolutions = {}
+    for stage in EVOLUTION_STAGES:
+        reached = [result['evolutionDays'][stage] for result in results
+                   if result['evolutionDays'][stage] is not None]
+        evolutions[stage] = {
+            'reached': round(len(reached) / users, 3),
+            'p10Day': percentile(reached, 0.1),
+            'medianDay': percentile(reached, 0.5),
+            'p90Day': percentile(reached, 0.9)
+        }
+
+    items = {rarity: sum(result['items'].get(rarity, 0) for result in results) for rarity in RARITIES}
+    total_items = sum(items.values()) or 1
+    return {
+        'users': users,
+        'days': days,
+        'levelCurve': level_curve,
+        'evolutions': evolutions,
+        'items': {
+            rarity: {
+                'share': round(count / total_items, 4),
+                'perUserPer30Days': round(count / users / days * 30, 2)
+            }
+            for rarity, count in items.items()
+        },
+        'meanSkills': round(sum(result['skills'] for result in results) / users, 2),
+        'meanAdventures': round(sum(result['adventures'] for result in results) / users, 1),
+        'operations': sum(result['operations'] for result in results)
+    }
+
+
+def run(users: int, days: int, workers: int, seed: int, content_file: str) -> Dict[str, Any]:
+    """Simulate users across a process pool and return the report with timings."""
+    chunk = max(1, -(-users // (workers * 4)))
+    blocks = [range(seed + start, seed + min(start + chunk, users)) for start in range(0, users, chunk)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = [result
+                   for block in pool.map(simulate_chunk, blocks, [days] * len(blocks),
+                                         [content_file] * len(blocks))
+                   for result in block]
+    elapsed = time.perf_counter() - start
+
+    report = summarize(results, days)
+    report['workers'] = workers
+    report['seconds'] = round(elapsed, 2)
+    report['userDaysPerSecond'] = round(users * days / elapsed)
+    report['operationsPerSecond'] = round(report['operations'] / elapsed)
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{report['users']} users x {report['days']} days on {report['workers']} workers: "
+          f"{report['seconds']} s, {report['userDaysPerSecond']} user-days/s, "
+          f"{report['operationsPerSecond']} Sleepen ops/s")
+
+    print(f"\n{'day':>5} {'mean':>6} {'p10':>4} {'p50':>4} {'p90':>4} {'max':>4}   level curve")
+    for day, row in report['levelCurve'].items():
+        print(f"{day:>5} {row['mean']:>6} {row['p10']:>4} {row['p50']:>4} {row['p90']:>4} {row['max']:>4}")
+
+    print(f"\n{'stage':>5} {'reached':>8} {'p10 day':>8} {'median':>7} {'p90 day':>8}   evolutions")
+    for stage, row in report['evolutions'].items():
+        print(f"{stage:>5} {row['reached']:>8.1%} {str(row['p10Day']):>8} {str(row['medianDay']):>7} "
+              f"{str(row['p90Day']):>8}")
+
+    print(f"\n{'rarity':>10} {'share':>8} {'per user / 30 days':>19}   items found")
+    for rarity, row in report['items'].items():
+        print(f"{rarity:>10} {row['share']:>8.2%} {row['perUserPer30Days']:>19}")
+    print(f"\nmean skills learned: {report['meanSkills']}, mean adventures: {report['meanAdventures']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Simulate Sleepen progression for many synthetic users.')
+    parser.add_argument('--users', type=int, default=10000, help='number of synthetic users')
+    parser.add_argument('--days', type=int, default=90, help='days to simulate per user')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first user')
+    parser.add_argument('--content', default=SLEEPEN_CONTENT_FILE, help='Sleepen content file to evaluate')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = run(args.users, args.days, args.workers, args.seed, args.content)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()